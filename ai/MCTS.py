@@ -0,0 +1,287 @@
+''' Monte Carlo Tree Search AI: plays random games (playouts) from the positions of a tree that grows towards the
+    moves that win the most, and plays the move that was tried the most.
+
+    It doesn't need an evaluation nor a depth, so it keeps playing sensibly on the big boards (up to 19x19) where
+    alpha-beta can't search deep enough, and gets stronger with the time it is given.
+'''
+
+from __future__ import annotations
+import math
+import random
+import time
+from array import array
+
+import othello
+import othello_eval
+
+BLACK, WHITE = 0, 1 # player to move of a node
+PASS = -1 # move of the child of a node where the player to move has to pass
+UNEXPANDED, TERMINAL = -1, -2 # first child of a node without children yet, of a node where the game is over
+DEFAULT = object() # a limit of next_move not given: the one of the instance, since None is no limit
+
+
+class MCTS:
+    TIME_LIMIT = 1.0 # seconds per move, None to stop only after max_playouts
+
+    EXPLORATION = 1.0 # weight of the prior and of the uncertainty of the moves tried few times (PUCT)
+
+    PRIOR_TEMPERATURE = 25.0 # the prior of a move is proportional to exp(weight of its cell / PRIOR_TEMPERATURE)
+
+    FIRST_PLAY_VALUE = 0.5 # value of a move not tried yet
+
+    EXPAND_VISITS = 1 # playouts from a node before its children are created
+
+    MAX_NODES = 1_000_000 # the tree stops growing there, the playouts go on from its leaves
+
+    def __init__(self, time_limit: float = TIME_LIMIT, max_playouts: int = None, seed: int = None) -> None:
+        """
+        :param time_limit: default seconds per move of next_move
+        :type time_limit: float
+        :param max_playouts: default playouts per move of next_move, None for no limit but the time
+        :type max_playouts: int
+        :param seed: seed of the playouts, None for a different game every time
+        :type seed: int
+        """
+        self.time_limit = time_limit
+        self.max_playouts = max_playouts
+        self.rng = random.Random(seed)
+        self.cancel_event = None # a threading.Event that stops the search as soon as it is set, like the time limit
+        self.geometry = None
+        self.playouts = 0 # of the last move
+        self.nodes = 0 # positions played through in the last move, tree and playouts
+        self.reused = 0 # playouts of the tree kept from the previous move
+        self._clear_tree()
+
+    def __str__(self) -> str:
+        return "MCTS"
+
+    def _clear_tree(self) -> None:
+        """ Empties the tree. A node is an index in each of these arrays """
+        self.parent = array('i')
+        self.move = array('h') # cell of the move from the parent, PASS for a pass
+        self.player = array('b') # player to move, BLACK or WHITE
+        self.first_child = array('i') # the children of a node are next to each other, or UNEXPANDED or TERMINAL
+        self.child_count = array('H')
+        self.visits = array('i')
+        self.wins = array('d') # for the player who played the move into the node, a draw is half a win
+        self.prior = array('d')
+        self.own = [] # discs of the player to move
+        self.opp = [] # discs of the other player
+        self.root = None
+
+    def _add_node(self, parent: int, move: int, player: int, own: int, opp: int, prior: float) -> int:
+        self.parent.append(parent)
+        self.move.append(move)
+        self.player.append(player)
+        self.first_child.append(UNEXPANDED)
+        self.child_count.append(0)
+        self.visits.append(0)
+        self.wins.append(0.0)
+        self.prior.append(prior)
+        self.own.append(own)
+        self.opp.append(opp)
+        return len(self.parent) - 1
+
+    def next_move(self, board: othello.OthelloGame, time_limit: float = DEFAULT, max_playouts: int = DEFAULT) -> tuple[int, int]:
+        """
+        Grows the tree from the board until the time or the playouts run out, and returns the move tried the most.
+        The part of the tree under the move is kept, and used again if the board of the next call is in it. The
+        clock is looked at before every playout, so the move comes at most a playout late (a few ms on 19x19).
+
+        :param board: the current state of the game
+        :type board: othello.OthelloGame
+        :param time_limit: seconds we can think, self.time_limit by default, None for no limit
+        :type time_limit: float
+        :param max_playouts: playouts we can play, self.max_playouts by default, None for no limit
+        :type max_playouts: int
+        :return: The move that the AI will make.
+        """
+        time_limit = self.time_limit if time_limit is DEFAULT else time_limit
+        max_playouts = self.max_playouts if max_playouts is DEFAULT else max_playouts
+        if time_limit is None and max_playouts is None:
+            raise ValueError("MCTS needs a time limit or a number of playouts")
+        deadline = math.inf if time_limit is None else time.perf_counter() + time_limit
+
+        legal_moves = board.get_possible_move()
+        if len(legal_moves) == 1: # Nothing to think about
+            self._clear_tree()
+            return legal_moves[0]
+        self._set_root(board)
+
+        self.playouts = self.nodes = 0
+        self.reused = self.visits[self.root]
+        while max_playouts is None or self.playouts < max_playouts:
+            if time.perf_counter() > deadline or (self.cancel_event is not None and self.cancel_event.is_set()):
+                break
+            self._run_playout()
+            self.playouts += 1
+
+        root = self.root
+        if self.first_child[root] < 0: # not even one playout
+            return legal_moves[0]
+        children = range(self.first_child[root], self.first_child[root] + self.child_count[root])
+        best = max(children, key=lambda child: (self.visits[child], self.wins[child]))
+        move = divmod(self.move[best], self.geometry.cols)
+        self._reroot(best)
+        return move
+
+    def _set_root(self, board: othello.OthelloGame) -> None:
+        """ Makes the node of the board the root: found in the tree kept from the last move (the opponent's reply
+            to our move, or the position after our move if it passed), or a new tree """
+        turn = board.get_turn()
+        player = BLACK if turn == othello.BLACK else WHITE
+        own, opp = board.get_bits(turn), board.get_bits(othello.OPPOSITE[turn])
+        if self.root is not None and self.geometry is board.geometry:
+            level = [self.root]
+            for _ in range(3): # our move's node, its children, and theirs after a pass
+                for node in level:
+                    if self.player[node] == player and self.own[node] == own and self.opp[node] == opp:
+                        self._reroot(node)
+                        return
+                level = [child for node in level if self.first_child[node] >= 0
+                         for child in range(self.first_child[node], self.first_child[node] + self.child_count[node])]
+        self.geometry = board.geometry
+        self._clear_tree()
+        self.root = self._add_node(-1, PASS, player, own, opp, 1.0)
+
+    def _reroot(self, node: int) -> None:
+        """ Keeps only the subtree of the node, copied to new arrays breadth first so that the children of each node
+            stay next to each other, with the node as the root """
+        (move, player, first_child, child_count) = (self.move, self.player, self.first_child, self.child_count)
+        (visits, wins, prior, own, opp) = (self.visits, self.wins, self.prior, self.own, self.opp)
+        self._clear_tree()
+        self.root = self._add_node(-1, move[node], player[node], own[node], opp[node], 1.0)
+        self.visits[0], self.wins[0] = visits[node], wins[node]
+        self.first_child[0] = first_child[node] if first_child[node] == TERMINAL else UNEXPANDED
+        queue = [(node, 0)]
+        for old_node, new_node in queue:
+            first = first_child[old_node]
+            if first < 0:
+                continue
+            self.first_child[new_node] = len(self.parent)
+            self.child_count[new_node] = child_count[old_node]
+            for old_child in range(first, first + child_count[old_node]):
+                new_child = self._add_node(new_node, move[old_child], player[old_child], own[old_child], opp[old_child],
+                                           prior[old_child])
+                self.visits[new_child], self.wins[new_child] = visits[old_child], wins[old_child]
+                self.first_child[new_child] = TERMINAL if first_child[old_child] == TERMINAL else UNEXPANDED
+                queue.append((old_child, new_child))
+
+    def _expand(self, node: int) -> None:
+        """ Creates the children of the node, with their priors from the cell weights """
+        (own, opp) = (self.own[node], self.opp[node])
+        geometry = self.geometry
+        moves = geometry.legal_moves(own, opp)
+        next_player = 1 - self.player[node]
+        if not moves:
+            if not geometry.legal_moves(opp, own):
+                self.first_child[node] = TERMINAL
+                return
+            self.first_child[node] = len(self.parent)
+            self.child_count[node] = 1
+            self._add_node(node, PASS, next_player, opp, own, 1.0)
+            return
+
+        weights = othello_eval.get_evaluator(geometry.rows, geometry.cols).weights
+        cells = []
+        while moves:
+            bit = moves & -moves
+            moves ^= bit
+            cells.append(bit.bit_length() - 1)
+        priors = [math.exp(weights[cell // geometry.cols][cell % geometry.cols] / self.PRIOR_TEMPERATURE) for cell in cells]
+        total = sum(priors)
+        self.first_child[node] = len(self.parent)
+        self.child_count[node] = len(cells)
+        for cell, prior in zip(cells, priors):
+            bit = 1 << cell
+            flips = geometry.flips(bit, own, opp)
+            self._add_node(node, cell, next_player, opp ^ flips, own | bit | flips, prior / total)
+
+    def _select_child(self, node: int) -> int:
+        """ Returns the child of the node with the best PUCT score: its win rate, plus its prior and its uncertainty """
+        (visits, wins, prior) = (self.visits, self.wins, self.prior)
+        first = self.first_child[node]
+        exploration = self.EXPLORATION * math.sqrt(visits[node])
+        best_child = first
+        best_score = -math.inf
+        for child in range(first, first + self.child_count[node]):
+            child_visits = visits[child]
+            value = wins[child] / child_visits if child_visits else self.FIRST_PLAY_VALUE
+            score = value + exploration * prior[child] / (1 + child_visits)
+            if score > best_score:
+                (best_score, best_child) = (score, child)
+        return best_child
+
+    def _run_playout(self) -> None:
+        """ Goes down the tree to a leaf, expands it if it has been visited enough, plays a random game from it and
+            counts the result in every node on the way """
+        node = self.root
+        depth = 0
+        while self.first_child[node] >= 0:
+            node = self._select_child(node)
+            depth += 1
+        if self.first_child[node] == UNEXPANDED and self.visits[node] >= self.EXPAND_VISITS \
+                and len(self.parent) < self.MAX_NODES:
+            self._expand(node)
+            if self.first_child[node] >= 0:
+                node = self._select_child(node)
+                depth += 1
+        self.nodes += depth
+
+        margin = self._playout(self.own[node], self.opp[node]) # for the player to move at the node
+        winner = self.player[node] if margin > 0 else 1 - self.player[node] if margin < 0 else None
+
+        (parent, player, visits, wins) = (self.parent, self.player, self.visits, self.wins)
+        while node >= 0:
+            visits[node] += 1
+            up = parent[node]
+            if up >= 0:
+                if winner is None:
+                    wins[node] += 0.5
+                elif winner == player[up]: # the player who moved into the node
+                    wins[node] += 1.0
+            node = up
+
+    def _playout(self, own: int, opp: int) -> int:
+        """ Plays random moves from the position to the end of the game on the two bitboards alone, returns the
+            final disc margin of the `own` player, who is to move. Rather than the bitboard of every legal move,
+            each ply tries the empty cells in a random order until one flips something, which is cheaper on
+            average and still picks each legal move with the same chance """
+        geometry = self.geometry
+        flips_of = geometry.flips
+        neighbours = geometry.neighbours
+        randrange = self.rng.randrange
+        empty = geometry.full & ~(own | opp)
+        empties = []
+        while empty:
+            bit = empty & -empty
+            empty ^= bit
+            empties.append(bit.bit_length() - 1)
+        count = len(empties)
+        swapped = False
+        passed = False
+        while count:
+            for tried in range(count):
+                index = randrange(tried, count)
+                cell = empties[index]
+                empties[index] = empties[tried]
+                empties[tried] = cell
+                if neighbours[cell] & opp:
+                    bit = 1 << cell
+                    flips = flips_of(bit, own, opp)
+                    if flips:
+                        (own, opp) = (opp ^ flips, own | bit | flips)
+                        count -= 1
+                        empties[tried] = empties[count]
+                        passed = False
+                        break
+            else: # no legal move
+                if passed:
+                    break
+                passed = True
+                (own, opp) = (opp, own)
+            swapped = not swapped
+        self.nodes += len(empties) - count
+        if swapped:
+            (own, opp) = (opp, own)
+        return own.bit_count() - opp.bit_count()
@@ -1,24 +1,65 @@
 import time
 from ai.Random import Random
 import othello
+import othello_book
+import othello_endgame
+import othello_eval
+import othello_patterns
+import othello_search
 import random
 import math
-from copy import deepcopy
-from itertools import product
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from copy import copy, deepcopy
+from itertools import count, product
+
+_search_ids = count() # numbers the searches of this process, to tell the pool's workers when a new one starts
 
 
 class Michel_Peck:
-    WEIGHTS = [
-        [100, -10, 11, 6, 6, 6, 11, -10, 100],
-        [-10, -20, 1, 2, 2, 2, 1, -20, -10],
-        [10, 1, 5, 4, 4, 4, 5, 1, 10],
-        [6, 2, 4, 2, 2, 2, 4, 2, 6],
-        [10, 1, 5, 4, 4, 4, 5, 1, 10],
-        [-10, -20, 1, 2, 2, 2, 1, -20, -10],
-        [100, -10, 11, 6, 6, 6, 11, -10, 100]
-    ]  # taken from https://courses.cs.washington.edu/courses/cse573/04au/Project/mini1/O-Thell-Us/Othellus.pdf and modified to our needs
-
-    MAX_DEPTH = 5
+    MAX_DEPTH = 5 # depth searched when there is no time limit
+
+    TIME_LIMIT = 1.0 # seconds per move, None to always search to MAX_DEPTH
+
+    CHECK_TIME_EVERY = 64 # nodes between two looks at the clock, about 2 ms with the pattern evaluation
+
+    EVALUATION = 'patterns' # 'patterns': pattern tables (othello_patterns), 'positional': cell weights (othello_eval)
+
+    BATCH_LEAVES = True # score the leaves under a node in one batch (othello_eval), instead of one call per leaf
+
+    POOL_POLL_INTERVAL = 0.05 # seconds between two looks at the clock while the worker processes search
+
+    KILLERS_PER_PLY = 2 # last moves that made a cutoff at each ply, tried right after the best move of the last search
+
+    ORDER_BY_MOBILITY = False # also prefer the moves leaving few moves to the opponent, costs a move generation per move
+
+    MOBILITY_ORDER_DEPTH = 3 # only worth it that far from the leaves
+
+    TT_SIZE_MB = 16
+
+    WORKERS = 0 # processes searching the root moves in parallel, 0 to search in this process only
+
+    TIE_MARGIN = 0.5 # under the smallest difference between two scores (they are integers), see root_search
+
+    ENDGAME_EMPTIES = 12 # that many empty cells or fewer: solve the end of the game exactly (othello_endgame)
+
+    ENDGAME_TIME_SHARE = 0.5 # of the time limit the solver can take, the heuristic search gets what's left if it can't finish
+
+    ASPIRATION_WINDOW = 32 # half width of the first window of each iteration around the expected score, see aspiration_search
+
+    ASPIRATION_GROWTH = 4 # the window grows that many times on the side the score fell out of
+
+    WIN_SCORE = 10000 # score of a won game, above any heuristic score, plus the final disc margin
+
+    USE_BOOK = True # play the move of the opening book (othello_book) when the position is in it, without searching
+
+    PONDER = False # think on the opponent's time, see start_pondering
+
+    PONDER_HIT_MIN_SHARE = 0.1 # of its time limit a ponder hit still thinks, even when the ponder search had more
+
+    SEARCH_RESULTS = ('score', 'depth_reached', 'nodes', 'stats', 'cutoffs', 'first_move_cutoffs', 'history') # what a ponder hit hands over
 
     ROWS, COLS = None, None
 
@@ -26,110 +67,704 @@ class Michel_Peck:
 
     init_board = None
 
-    def __init__(self) -> None:
-        pass
+    weights = None # weight of each cell, generated for the board size (othello_eval)
+
+    def __init__(self, tt_size_mb: float = TT_SIZE_MB, workers: int = WORKERS, deterministic: bool = False,
+                 collect_stats: bool = False, evaluation: str = EVALUATION, ponder: bool = PONDER) -> None:
+        """
+        :param tt_size_mb: size of the transposition table, in MB (each worker process has its own)
+        :type tt_size_mb: float
+        :param workers: number of processes searching the root moves in parallel, 0 for a sequential search
+        :type workers: int
+        :param deterministic: choose the same move whatever the order the moves are searched in: the workers don't
+        share their alpha bound and the transposition table is only used to order the moves. Prunes less, but a
+        parallel search then always chooses the move of the sequential search
+        :type deterministic: bool
+        :param collect_stats: count the nodes, leaves, cutoffs... of each search by ply, and time it, in self.stats
+        (an othello_search.SearchStats). Slows the search down, so off by default
+        :type collect_stats: bool
+        :param evaluation: how the leaves are scored, 'positional' (the weight of each cell) or 'patterns' (the
+        values of the patterns of cells, as learned, on the board sizes with a table file, the positional evaluation
+        on the others)
+        :type evaluation: str
+        :param ponder: after each move, search the position after the opponent's expected reply in a background
+        thread until the next call of next_move (see start_pondering). Only without workers
+        :type ponder: bool
+        """
+        if evaluation not in ('positional', 'patterns'):
+            raise ValueError(f"unknown evaluation {evaluation!r}")
+        self.tt_size_mb = tt_size_mb
+        self.tt = othello_search.TranspositionTable(tt_size_mb) # kept for the whole game, see pvs
+        self.history = {} # (turn, move) -> how often and how deep the move made a cutoff, kept for the whole game
+        self.workers = workers
+        self.deterministic = deterministic
+        self.collect_stats = collect_stats
+        self.evaluation = evaluation
+        self.stats = None # stats of the last search, when collected
+        self.cancel_event = None # a threading.Event that stops the search as soon as it is set, like the time limit (see the GUI)
+        self.search_id = None
+        self.score = None # score of the move returned by the last next_move, None if it wasn't searched
+        self._pool = None # created at the first parallel search and kept warm until close()
+        self._shared_bound = None
+        self.pool_tag = None # in a worker process of the parallel search, the tag of the iteration searched, see out_of_time
+        self.ponder = ponder
+        self._ponder_thread = None # running self._ponderer._ponder on self._ponder_board
+        self._ponderer = None
+        self._ponder_board = None
+        self._ponder_move = None # move found by _ponder
+        self._ponder_start = None # perf_counter() when the ponder search started
+        self._deadline_lock = threading.Lock() # the deadline of a ponder search is changed from the other thread
+        self._solver = None # the endgame solver running, if any, whose deadline follows self.deadline
+
+    def close(self) -> None:
+        """ Stops the ponder search and the worker processes of the parallel search, if any """
+        self.stop_pondering()
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
 
     def __str__(self) -> str:
         return "Michel_Peck"
 
-    def next_move(self, board: othello.OthelloGame) -> tuple[int, int]:
+    def next_move(self, board: othello.OthelloGame, time_limit: float = TIME_LIMIT, max_depth: int = None) -> tuple[int, int]:
+        """
+        The function takes in a board, and returns the best move for the player.
+        Searches at depth 1, 2, 3... (iterative deepening) until the time limit, and returns the move of the
+        deepest search that had time to finish. The search running when the time is up is thrown away.
+        When pondering, the search of the board may already be running (see stop_pondering), and the search of the
+        next expected board starts before returning (see start_pondering).
+
+        :param board: the current state of the game
+        :type board: othello.OthelloGame
+        :param time_limit: seconds we can think, None to search to max_depth whatever the time it takes
+        :type time_limit: float
+        :param max_depth: deepest search, defaults to MAX_DEPTH without a time limit and to the number of
+        empty cells (the end of the game) with one
+        :type max_depth: int
+        :return: The move that the AI will make.
         """
-        The function takes in a board, and returns the best move for the player
+        move = self.stop_pondering(board, time_limit)
+        if move is None:
+            self.start_search(board, time_limit)
+            move = self.think(board, time_limit, max_depth)
+        if self.ponder and self.workers == 0:
+            self.start_pondering(board, move)
+        return move
+
+    def think(self, board: othello.OthelloGame, time_limit: float, max_depth: int = None) -> tuple[int, int]:
+        """
+        The search of next_move, once start_search has been called: the book, else the endgame solver, else the
+        iterative deepening.
 
         :param board: the current state of the game
         :type board: othello.OthelloGame
+        :param time_limit: seconds we can think, None for no limit
+        :type time_limit: float
+        :param max_depth: deepest search, see next_move
+        :type max_depth: int
         :return: The move that the AI will make.
         """
         self.board = board
         self.legal_moves = board.get_possible_move()
+        self.search_id = (os.getpid(), next(_search_ids))
+
+        if len(self.legal_moves) == 1: # Nothing to think about
+            return self.legal_moves[0]
+
+        if self.USE_BOOK:
+            book_move = othello_book.lookup(board)
+            if book_move is not None: # Already thought about
+                return book_move
+
+        empty_cells = self.ROWS * self.COLS - sum(board.get_scores())
+        if empty_cells <= self.ENDGAME_EMPTIES:
+            endgame_move = self.solve_endgame(board)
+            if endgame_move is not None:
+                return endgame_move
+        if max_depth is None:
+            max_depth = self.MAX_DEPTH if time_limit is None else empty_cells
+        max_depth = min(max_depth, empty_cells)
 
+        search_board = board.copy_game() # an aborted search leaves its moves on the board, never on the caller's one
+        if self.stats is not None:
+            search_board = othello_search.TimedBoard(search_board, self.stats)
+
+        move = self.legal_moves[0] # if not even the depth 1 search has time to finish
+        scores = {} # of each depth searched, the one two plies shallower is the aspiration guess (same player at the leaves)
+        for depth in range(1, max_depth + 1):
+            self.root_depth = depth
+            (start, nodes) = (time.perf_counter(), self.nodes)
+            try:
+                if self.workers > 0 or self.deterministic:
+                    (val, move) = self.root_search(search_board, depth)
+                else:
+                    (val, move) = self.aspiration_search(search_board, depth, scores.get(depth - 2, scores.get(depth - 1)))
+            except othello_search.SearchTimeout:
+                if self.stats is not None:
+                    self.stats.iterations.append({'depth': depth, 'seconds': time.perf_counter() - start,
+                                                  'nodes': self.nodes - nodes, 'move': None, 'score': None, 'completed': False})
+                break
+            self.depth_reached = depth
+            self.score = scores[depth] = val
+            if self.stats is not None:
+                self.stats.iterations.append({'depth': depth, 'seconds': time.perf_counter() - start,
+                                              'nodes': self.nodes - nodes, 'move': move, 'score': val, 'completed': True})
+
+        return move
+
+    def start_pondering(self, board: othello.OthelloGame, move: tuple[int, int]) -> None:
+        """
+        Starts searching, in a background thread, the position we expect to play in next: after our move and the
+        opponent's reply that the search found best (from the transposition table, else the one scoring worst for
+        us), or after our move if the opponent has to pass. The search has no time limit until next_move gives it
+        one (see stop_pondering).
+
+        It runs on a copy of this AI sharing its transposition table, so that the results of the move just returned
+        (score, nodes, stats...) stay readable until the next one. The copy has a history of its own, aged by its
+        start_search: it replaces ours on a hit, and on a miss ours is aged once by the search of next_move.
+
+        :param board: the board we played on
+        :type board: othello.OthelloGame
+        :param move: the move we played
+        :type move: tuple[int, int]
+        """
+        expected = board.copy_game()
+        expected.move(move[0], move[1])
+        if expected.is_game_over():
+            return
+        if expected.get_turn() != self.player_color:
+            entry = self.tt.probe(expected.get_key())
+            replies = expected.get_possible_move()
+            if entry is not None and entry[4] in replies:
+                reply = entry[4]
+            else: # the search didn't get that far, the reply that looks worst for us
+                scores = self.evaluate_leaves(expected, replies)
+                reply = replies[scores.index(min(scores))]
+            expected.move(reply[0], reply[1])
+            if expected.is_game_over() or expected.get_turn() != self.player_color: # nothing to think about
+                return
+
+        ponderer = copy(self)
+        ponderer.history = dict(self.history)
+        ponderer.start_search(expected, None)
+        self._ponderer = ponderer
+        self._ponder_board = expected.copy_game()
+        self._ponder_start = time.perf_counter()
+        self._ponder_thread = threading.Thread(target=ponderer._ponder, daemon=True,
+                                               args=(expected, expected.get_rows() * expected.get_columns() - sum(expected.get_scores())))
+        self._ponder_thread.start()
+
+    def _ponder(self, board: othello.OthelloGame, max_depth: int) -> None:
+        """ Runs in the ponder thread, on the copy: searches the expected position until told to stop """
+        self._ponder_move = self.think(board, None, max_depth)
+
+    def stop_pondering(self, board: othello.OthelloGame = None, time_limit: float = None) -> tuple[int, int] | None:
+        """
+        Stops the ponder search, if one is running. If the board is the position it searches (the opponent played
+        the expected reply), the search goes on until time_limit seconds after it started, as if next_move had
+        started it then, so that the time the opponent took is saved: a hit after that answers at once (after
+        PONDER_HIT_MIN_SHARE of time_limit, so that an endgame solve or a first iteration isn't cut to nothing). Its
+        move is returned, along with its results (score, nodes, stats...), where nodes only counts the nodes searched
+        after the hit and ponder_nodes the ones before, so that nodes per second of move time mean the same with
+        and without pondering. Else it stops at once and None is returned. Either way, what it stored in the
+        transposition table stays there for the next searches.
+
+        :param board: the board next_move was called with, None to just stop
+        :type board: othello.OthelloGame
+        :param time_limit: seconds the search can still take on a hit, None to stop it and search again (the
+        search without a time limit goes to MAX_DEPTH, the ponder search doesn't stop by itself)
+        :type time_limit: float
+        :return: The move of the ponder search on a hit, None otherwise
+        """
+        if self._ponder_thread is None:
+            return None
+        (ponderer, expected) = (self._ponderer, self._ponder_board)
+        hit = (board is not None and time_limit is not None and board.get_turn() == expected.get_turn()
+               and board.get_bits(othello.BLACK) == expected.get_bits(othello.BLACK)
+               and board.get_bits(othello.WHITE) == expected.get_bits(othello.WHITE))
+        now = time.perf_counter()
+        solver = ponderer._solver # its nodes are added to the ponderer's when it is done
+        ponder_nodes = ponderer.nodes + (solver.nodes if solver is not None else 0)
+        ponderer.set_deadline(max(self._ponder_start + time_limit, now + time_limit * self.PONDER_HIT_MIN_SHARE)
+                              if hit else 0)
+        self._ponder_thread.join()
+        self._ponder_thread = self._ponderer = self._ponder_board = None
+        if not hit or ponderer._ponder_move is None:
+            return None
+        for name in self.SEARCH_RESULTS:
+            setattr(self, name, getattr(ponderer, name))
+        self.nodes -= ponder_nodes
+        self.ponder_nodes = ponder_nodes
+        return ponderer._ponder_move
+
+    def set_deadline(self, deadline: float) -> None:
+        """ Moves the deadline of the running search, endgame solver included, even from another thread """
+        with self._deadline_lock:
+            self.deadline = deadline
+            if self._solver is not None:
+                self._solver.deadline = self._solver_deadline(time.perf_counter())
+
+    def _solver_deadline(self, start: float) -> float:
+        """ The endgame solver gets ENDGAME_TIME_SHARE of the time left from start """
+        return start + (self.deadline - start) * self.ENDGAME_TIME_SHARE if self.deadline > start else self.deadline
+
+    def start_search(self, board: othello.OthelloGame, time_limit: float) -> None:
+        """
+        Gets ready to search the given board: the score of every position is computed for the player whose turn it
+        is, with the weights of the board size.
+
+        :param board: the board the search starts from
+        :type board: othello.OthelloGame
+        :param time_limit: seconds the search can take, None for no limit
+        :type time_limit: float
+        """
         self.player_color = board.get_turn()
 
         self.ROWS, self.COLS = board.get_rows(), board.get_columns()
 
-        self.init_board = board
+        self.init_board = board.copy_game()
+
+        self.weights = othello_eval.get_evaluator(self.ROWS, self.COLS).weights # also used to order the moves
+        if self.evaluation == 'patterns' and othello_patterns.has_tables(self.ROWS, self.COLS):
+            self.evaluator = othello_patterns.get_evaluator(self.ROWS, self.COLS)
+        else:
+            self.evaluator = othello_eval.get_evaluator(self.ROWS, self.COLS)
+
+        self.tt.new_search() # the entries of the previous moves are only used to order the moves
 
-        (val, move) = self.alpha_beta(
-            board, self.MAX_DEPTH, -math.inf, math.inf, True)
+        self.deadline = math.inf if time_limit is None else time.perf_counter() + time_limit
+        self.nodes = 0
+        self.ponder_nodes = 0 # searched on the opponent's time before a ponder hit, not in nodes (see stop_pondering)
+        self.next_time_check = self.CHECK_TIME_EVERY
+        self.depth_reached = 0
+        self.score = None
+        self.cutoffs = 0 # nodes where a move made a cutoff...
+        self.first_move_cutoffs = 0 # ...and how many times it was the first one tried, the closer the better the ordering
+        self.killers = [[] for _ in range(self.ROWS * self.COLS + 1)] # per ply from the root, never deeper than the empty cells
+        for move_key in self.history: # older moves count less
+            self.history[move_key] //= 2
 
+        self.stats = othello_search.SearchStats() if self.collect_stats else None
+        if self.stats is not None: # time the evaluation and the ordering, the board times the rest (see next_move)
+            self.evaluate = self.stats.timed(Michel_Peck.evaluate.__get__(self), 'evaluation')
+            self.evaluate_leaves = self.stats.timed(Michel_Peck.evaluate_leaves.__get__(self), 'evaluation')
+            self.order_moves = self.stats.timed(Michel_Peck.order_moves.__get__(self), 'ordering')
+
+    def solve_endgame(self, board: othello.OthelloGame) -> tuple[int, int] | None:
+        """
+        Searches the board to the end of the game with the endgame solver. self.score is then the final disc margin.
+
+        :param board: the board, with few empty cells left
+        :type board: othello.OthelloGame
+        :return: The best move, None if the solver didn't have time to finish in ENDGAME_TIME_SHARE of the time left
+        """
+        start = time.perf_counter()
+        with self._deadline_lock:
+            solver = self._solver = othello_endgame.EndgameSolver(board.geometry, self._solver_deadline(start),
+                                                                  self.cancel_event)
+        try:
+            (margin, move) = solver.solve(board)
+        except othello_search.SearchTimeout:
+            move = margin = None
+        finally:
+            self._solver = None
+            self.nodes += solver.nodes
+        if self.stats is not None:
+            self.stats.iterations.append({'depth': self.ROWS * self.COLS - sum(board.get_scores()),
+                                          'seconds': time.perf_counter() - start, 'nodes': solver.nodes,
+                                          'move': move, 'score': margin, 'completed': move is not None})
+        if move is not None:
+            self.score = margin
+            self.depth_reached = self.ROWS * self.COLS - sum(board.get_scores())
         return move
 
-    def compare_boards(self, board: othello.OthelloGame, move: tuple[int, int]) -> int:
+    def search_root_move(self, board: othello.OthelloGame, move: tuple[int, int], depth: int, alpha: float) -> float:
         """
-        Takes the new board and calculates the difference between the scores of the boards, 
-        adds the value of the weight to the score therefor ensuring that the move is pretty good.
+        Plays one of the moves of the root and searches the position after it.
 
-        :param board: the board after the move has been made
+        :param board: the root board, left as it was
         :type board: othello.OthelloGame
-        :param move: tuple[int, int]
+        :param move: the root move to search
         :type move: tuple[int, int]
-        :return: The score of the move.
+        :param depth: depth of the search from the root
+        :type depth: int
+        :param alpha: the score of the best root move so far, a score at or under it means the move isn't better
+        :type alpha: float
+        :return: The score of the move, exact if it is over alpha
+        """
+        return self.search_child(board, move, depth, alpha, math.inf)
+
+    def root_search(self, board: othello.OthelloGame, depth: int) -> tuple[int, tuple[int, int]]:
         """
+        Same result as pvs at the root, one root move at a time. With workers, the first move is searched here
+        first (young brothers wait) and the others by the worker processes, with its score as alpha. Unless
+        deterministic, the workers also share the best score found so far to prune more.
 
-        (new_black_tiles, new_white_tiles) = board.get_scores() # Gets the score for the current board
-        (old_black_tiles, old_white_tiles) = self.init_board.get_scores() # Gets the score for the inital board
+        When deterministic, the moves are searched with an alpha just under the best score so that a move as good as
+        the best one gets its exact score too, and equal moves are told apart by their row and column. The chosen
+        move then doesn't depend on the order of the moves, so it is the same with or without workers.
 
-        weight = self.WEIGHTS[move[0]][move[1]] # Get the weight of the current board
-        player_score = 0 # Initialises the score to 0
-        if self.player_color == "B": # Changes how the score is calculated depending on the colour of the player
-            player_score = (new_black_tiles-old_black_tiles) - \
-                (new_white_tiles-old_white_tiles) # Difference between the new and old board
+        :param board: the root board
+        :type board: othello.OthelloGame
+        :param depth: depth of the search
+        :type depth: int
+        :return: The best score and the best move
+        """
+        self.nodes += 1
+        if self.stats is not None:
+            self.stats.nodes[0] += 1
+        entry = self.tt.probe(board.get_key())
+        moves = self.order_moves(board, board.get_possible_move(), entry[4] if entry is not None else None, depth)
+
+        best_move = moves[0]
+        best_score = self.search_root_move(board, best_move, depth, -math.inf)
+        margin = self.TIE_MARGIN if self.deterministic else 0
+
+        def search_in_order():
+            for move in moves[1:]: # lazy, so each move gets the best score of the ones before it
+                alpha = best_score - margin
+                yield move, (self.search_root_move(board, move, depth, alpha), alpha, 0)
+
+        if self.workers > 0:
+            results = zip(moves[1:], self._search_in_pool(getattr(board, 'game', board), moves[1:], depth, best_score - margin)) # the game itself, not its TimedBoard
         else:
-            player_score = (new_white_tiles-old_white_tiles) - \
-                (new_black_tiles-old_black_tiles) # Difference between the new and old board
+            results = search_in_order()
+
+        for move, (score, alpha, nodes) in results: # in the order of the sequential search
+            self.nodes += nodes
+            # fail-soft: a score at or under the alpha it was searched with is only an upper bound, never a better move
+            if score > alpha and (score > best_score or (self.deterministic and score == best_score and move < best_move)):
+                (best_score, best_move) = (score, move)
+        self.tt.store(board.get_key(), depth, best_score, othello_search.EXACT, best_move)
+        return best_score, best_move
+
+    def _search_in_pool(self, board: othello.OthelloGame, moves: list[tuple[int, int]], depth: int, alpha: float) -> list[tuple[float, float, int]]:
+        """
+        Searches the root moves in the worker processes, starting them all with the given alpha.
+
+        :return: The (score, alpha it was searched with, nodes) of each move, in the same order
+        """
+        if self._pool is None:
+            self._shared_bound = multiprocessing.Array('d', 2) # (iteration tag, alpha), the tag keeps late results of an aborted iteration away
+            self._pool = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                             initargs=(self._shared_bound, self.tt_size_mb, self.deterministic, self.collect_stats,
+                                                       self.evaluation))
 
-        player_score += weight # Adds the weight od the move to the score
-        return player_score
+        with self._shared_bound.get_lock():
+            tag = self._shared_bound[0] + 1
+            self._shared_bound[0] = tag
+            self._shared_bound[1] = alpha
+        # perf_counter() can't be compared between processes, the workers get the deadline on the wall clock
+        deadline = None if self.deadline == math.inf else time.time() + self.deadline - time.perf_counter()
+        futures = [self._pool.submit(_search_root_move, board, move, depth, alpha, deadline,
+                                     self.search_id, tag, not self.deterministic) for move in moves]
+        pending = futures
+        while pending and not self.out_of_time():
+            pending = wait(pending, timeout=max(0, min(self.POOL_POLL_INTERVAL, self.deadline - time.perf_counter()))).not_done
+        results = [future.result() if future.done() else None for future in futures]
+        if None in results or any(score is None for (score, alpha, nodes, stats) in results):
+            for future in futures: # the ones not started yet
+                future.cancel()
+            with self._shared_bound.get_lock(): # the running ones stop at their next look at the clock
+                self._shared_bound[0] = tag + 1
+            raise othello_search.SearchTimeout()
+        if self.stats is not None:
+            for (score, alpha, nodes, stats) in results:
+                self.stats.merge(stats)
+        return [(score, alpha, nodes) for (score, alpha, nodes, stats) in results]
 
-    def alpha_beta(self, board: othello.OthelloGame, depth: int, alpha: int, beta: int, maximizing_player: bool, test_move: tuple[int, int] = None) -> tuple[int, tuple[int, int]]:
+    def order_moves(self, board: othello.OthelloGame, moves: list[tuple[int, int]], best_move: tuple[int, int], depth: int) -> list[tuple[int, int]]:
         """
-        Using the alpha-beta algorithm, gets the "best" move for the current board going to a max depth definied in the initial called and decremented with every recursive call
+        Sorts the moves so that the ones most likely to make a cutoff come first: alpha-beta prunes the most when
+        the best move is tried first.
 
-        :param board: othello.OthelloGame
+        :param board: the board the moves are played on
         :type board: othello.OthelloGame
-        :param depth: The depth of the search tree
+        :param moves: the legal moves
+        :type moves: list[tuple[int, int]]
+        :param best_move: best move of the last search of this position (transposition table), None if there isn't any
+        :type best_move: tuple[int, int]
+        :param depth: depth left to search
         :type depth: int
-        :param alpha: the best score that the maximizing player currently can guarantee given the
-        current path
-        :type alpha: int
-        :param beta: the best score that the maximizing player can guarantee given the current state of
-        the game
-        :type beta: int
-        :param maximizing_player: True if the player is the maximizing player, False if the player is
-        the minimizing player
-        :type maximizing_player: bool
-        :return: The best score and the best move
+        :return: the moves, best move first, then the killer moves of this ply, then by history and square weight
+        """
+        turn = board.get_turn()
+        killers = self.killers[self.root_depth - depth]
+        priorities = {}
+        for move in moves:
+            priorities[move] = self.history.get((turn, move), 0) + self.weights[move[0]][move[1]]
+        if self.ORDER_BY_MOBILITY and depth >= self.MOBILITY_ORDER_DEPTH:
+            for move in moves:
+                record = board.make_move(move[0], move[1])
+                priorities[move] -= len(board.get_possible_move()) if board.get_turn() != turn else 0 # a pass is no mobility at all
+                board.unmake_move(record)
+        for index, killer in enumerate(killers):
+            if killer in priorities:
+                priorities[killer] = 10 ** 9 - index # above any history, below the best move
+        if best_move in priorities:
+            priorities[best_move] = math.inf
+        return sorted(moves, key=priorities.__getitem__, reverse=True)
+
+    def record_cutoff(self, board: othello.OthelloGame, move: tuple[int, int], index: int, depth: int) -> None:
+        """
+        Remembers a move that made a cutoff for the ordering of the next nodes: as a killer move of its ply and in the
+        history table, weighted by the depth of the subtree it saved.
+
+        :param board: the board the move was played on
+        :type board: othello.OthelloGame
+        :param move: the move
+        :type move: tuple[int, int]
+        :param index: its place in the ordered moves
+        :type index: int
+        :param depth: depth left to search
+        :type depth: int
+        """
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+        if self.stats is not None:
+            self.stats.cutoffs[(self.root_depth - depth, index)] += 1
+        killers = self.killers[self.root_depth - depth]
+        if move in killers:
+            killers.remove(move)
+        killers.insert(0, move)
+        del killers[self.KILLERS_PER_PLY:]
+        move_key = (board.get_turn(), move)
+        self.history[move_key] = self.history.get(move_key, 0) + depth * depth
+
+    def out_of_time(self) -> bool:
+        """ Returns True if the search has to stop: past the deadline, cancelled through cancel_event, or (in a
+            worker process) its iteration given up by root_search, which changes the tag of the shared bound """
+        return time.perf_counter() > self.deadline or (self.cancel_event is not None and self.cancel_event.is_set()) \
+            or (self.pool_tag is not None and _worker_bound[0] != self.pool_tag)
+
+    def evaluate(self, board: othello.OthelloGame) -> int:
+        """
+        Scores the board for the player with the evaluation chosen: the weights of the cells of its discs minus the
+        weights of the cells of the opponent's discs, or the sum of the values of the patterns of the board.
+
+        :param board: the board to score
+        :type board: othello.OthelloGame
+        :return: The score of the board.
+        """
+        return self.evaluator.evaluate(board.get_bits(self.player_color), board.get_bits(othello.OPPOSITE[self.player_color]))
+
+    def evaluate_leaves(self, board: othello.OthelloGame, moves: list[tuple[int, int]]) -> list[int]:
+        """
+        Scores the boards after each of the moves in one batch, finished games by their discs.
+
+        :param board: the board the moves are played on, left as it was
+        :type board: othello.OthelloGame
+        :param moves: the legal moves
+        :type moves: list[tuple[int, int]]
+        :return: The score of each move, in the same order
+        """
+        opponent = othello.OPPOSITE[self.player_color]
+        positions = []
+        final_scores = {}
+        for index, move in enumerate(moves):
+            record = board.make_move(move[0], move[1])
+            if board.is_game_over():
+                final_scores[index] = self.final_score(board)
+            positions.append((board.get_bits(self.player_color), board.get_bits(opponent)))
+            board.unmake_move(record)
+        scores = self.evaluator.evaluate_batch(positions)
+        for index, score in final_scores.items():
+            scores[index] = score
+        return scores
+
+    def final_score(self, board: othello.OthelloGame) -> int:
+        """
+        Scores a finished game: WIN_SCORE plus the disc margin if we won, minus WIN_SCORE plus the margin if we lost.
+
+        :param board: the board at the end of the game
+        :type board: othello.OthelloGame
+        :return: The score of the game
+        """
+        margin = board.get_scores(self.player_color) - board.get_scores(othello.OPPOSITE[self.player_color])
+        if margin > 0:
+            return self.WIN_SCORE + margin
+        if margin < 0:
+            return -self.WIN_SCORE + margin
+        return 0
+
+    def pvs(self, board: othello.OthelloGame, depth: int, alpha: float, beta: float, test_move: tuple[int, int] = None) -> tuple[int, tuple[int, int]]:
         """
+        Principal variation search, negamax style: the scores are for the player whose turn it is on the board, so
+        one branch serves both players. The first move (the best one of the ordering) gets the whole window, the
+        next ones a null window that only tells whether they beat it, and the rare one that does is searched again
+        with the whole window. Fail-soft: the score returned can be outside the window, a bound that is tighter for
+        the transposition table and the aspiration windows.
+
+        :param board: the board, left as it was
+        :type board: othello.OthelloGame
+        :param depth: depth left to search
+        :type depth: int
+        :param alpha: the score the player to move already has elsewhere, a score at or under it is worthless
+        :type alpha: float
+        :param beta: the score the opponent already has elsewhere (negated), a score at or over it won't be let happen
+        :type beta: float
+        :param test_move: the move that led to the board, None at the root (which always gets a move)
+        :type test_move: tuple[int, int]
+        :return: The best score and the best move. At or under alpha, the score is an upper bound, at or over beta a
+        lower bound
+        """
+        self.nodes += 1
+        if self.nodes >= self.next_time_check: # the leaves are counted in batches, so nodes doesn't go through every number
+            self.next_time_check = self.nodes + self.CHECK_TIME_EVERY
+            if self.out_of_time(): # Out of time, give up the whole search
+                raise othello_search.SearchTimeout()
+        if self.stats is not None:
+            self.stats.nodes[self.root_depth - depth] += 1
+
+        turn = board.get_turn()
+        sign = 1 if turn == self.player_color else -1 # evaluate and final_score are for the player of the search
         if depth == 0 or board.is_game_over(): # Run when we reach max depth or the game is over (last possible move, no need to go further)
-            return self.compare_boards(board, test_move), None # Return the score for the tested move, and None, which is the move itself.
-
-        if maximizing_player: # If we are maximising the player
-            best_score = -math.inf # Make the best score as low as possible, it can only get better from here
-            best_move = None # no move yet
-            for move in board.get_possible_move(): # Get all the possible moves on the board, maybe for the current player, hard to tell, never complains though so who knows
-                board_copy = board.copy_game() # Copy of the board, uses deepcopy, slow
-                board_copy.move(move[0], move[1]) # Play the move on the copied board
-                score = self.alpha_beta(
-                    board_copy, depth - 1, alpha, beta, not maximizing_player, move)[0] # call self again, gets the score for this move and future possbible moves from this one, saves just the score not the move
-                best_score = max(score, best_score) # Gets the best of the scores
-                alpha = max(alpha, best_score) # Takes the best between alpha and the score
-                if best_score == score: # if the best score is the same as the score, take that move
-                    best_move = move
-                if best_score > beta: # stop if the value is greater than beta
-                    break
-            return best_score, best_move
+            if self.stats is not None:
+                self.stats.leaves[self.root_depth - depth] += 1
+            if board.is_game_over(): # the discs tell who won, no need for a heuristic
+                return sign * self.final_score(board), None
+            return sign * self.evaluate(board), None
+
+        key = board.get_key()
+        entry = self.tt.probe(key) # Did we already search this position, maybe through another move order?
+        if entry is not None and test_move is not None and entry[1] >= depth and entry[5] == self.tt.generation and not self.deterministic: # deep enough and from this search, never at the root so we always get a move
+            if (entry[3] == othello_search.EXACT or (entry[3] == othello_search.LOWER and entry[2] >= beta)
+                    or (entry[3] == othello_search.UPPER and entry[2] <= alpha)): # the score, or the bound alone, is enough
+                if self.stats is not None:
+                    self.stats.tt_hits[self.root_depth - depth] += 1
+                return entry[2], entry[4]
+        (alpha_orig, beta_orig) = (alpha, beta) # Window we were called with, tells if the result is exact or a bound
+
+        moves = self.order_moves(board, board.get_possible_move(), entry[4] if entry is not None else None, depth) # Best move found last time goes first, even from a previous search
+
+        if depth == 1 and self.BATCH_LEAVES: # the children are leaves, score them all at once
+            scores = [sign * score for score in self.evaluate_leaves(board, moves)]
+            self.nodes += len(moves)
+            if self.stats is not None:
+                self.stats.nodes[self.root_depth] += len(moves)
+                self.stats.leaves[self.root_depth] += len(moves)
+        else:
+            scores = None
+
+        best_score = -math.inf
+        best_move = None
+        for index, move in enumerate(moves):
+            if scores is not None: # already scored
+                score = scores[index]
+            elif index == 0: # most likely the best move, whole window
+                score = self.search_child(board, move, depth, alpha, beta)
+            else: # only has to be shown worse than the best so far
+                score = self.search_child(board, move, depth, alpha, alpha + 1)
+                if alpha < score < beta: # it isn't: its exact score
+                    score = self.search_child(board, move, depth, alpha, beta)
+            if score > best_score: # the first of equal moves stays
+                (best_score, best_move) = (score, move)
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta: # the opponent won't let us get here
+                        self.record_cutoff(board, move, index, depth)
+                        break
+
+        if best_score <= alpha_orig: # Could be even lower, only an upper bound
+            bound = othello_search.UPPER
+        elif best_score >= beta_orig: # Could be even higher, only a lower bound
+            bound = othello_search.LOWER
         else:
-            best_score = math.inf # Make the best score as high as possible, since technically it can only get worse from here
-            best_move = None # no move yet
-            for move in board.get_possible_move(): # ditto
-                board_copy = board.copy_game() # ditto
-                board_copy.move(move[0], move[1]) # ditto
-                score = self.alpha_beta(
-                    board_copy, depth - 1, alpha, beta, not maximizing_player, move)[0] # call self again, gets the score for this move and future possbible moves from this one, saves just the score not the move
-                best_score = min(score, best_score) # gets the lowest
-                beta = min(beta, best_score) # opposite to alpha
-                if best_score == score: # same as alpha
-                    best_move = move
-                if best_score < alpha: # stop if the value is less than alpha
-                    break
-            return best_score, best_move
+            bound = othello_search.EXACT
+        self.tt.store(key, depth, best_score, bound, best_move)
+        return best_score, best_move
+
+    def search_child(self, board: othello.OthelloGame, move: tuple[int, int], depth: int, alpha: float, beta: float) -> int:
+        """
+        Plays the move and searches the position after it, with the window and the score turned around for the
+        opponent, unless the opponent has to pass.
+
+        :param board: the board, left as it was
+        :type board: othello.OthelloGame
+        :param move: the move to play
+        :type move: tuple[int, int]
+        :param depth: depth left to search before the move
+        :type depth: int
+        :param alpha: alpha of the player of the move
+        :type alpha: float
+        :param beta: beta of the player of the move
+        :type beta: float
+        :return: The score of the move for the player of the move
+        """
+        turn = board.get_turn()
+        record = board.make_move(move[0], move[1]) # Play the move in place, no copy of the board
+        if board.get_turn() == turn: # the opponent has to pass, still our turn
+            score = self.pvs(board, depth - 1, alpha, beta, move)[0]
+        else:
+            score = -self.pvs(board, depth - 1, -beta, -alpha, move)[0]
+        board.unmake_move(record) # Take the move back before trying the next one
+        return score
+
+    def aspiration_search(self, board: othello.OthelloGame, depth: int, guess: int = None) -> tuple[int, tuple[int, int]]:
+        """
+        Searches the root in a window of ASPIRATION_WINDOW around the expected score, which prunes more than the
+        whole window. When the score falls outside, the window grows ASPIRATION_GROWTH times on that side and the
+        root is searched again, up to the whole window.
+
+        :param board: the root board
+        :type board: othello.OthelloGame
+        :param depth: depth of the search
+        :type depth: int
+        :param guess: the expected score, None (or a won or lost game) for the whole window at once
+        :type guess: int
+        :return: The best score and the best move
+        """
+        if guess is None or abs(guess) >= self.WIN_SCORE:
+            return self.pvs(board, depth, -math.inf, math.inf)
+        (below, above) = (self.ASPIRATION_WINDOW, self.ASPIRATION_WINDOW)
+        while True:
+            alpha = guess - below if below < self.WIN_SCORE else -math.inf
+            beta = guess + above if above < self.WIN_SCORE else math.inf
+            (score, move) = self.pvs(board, depth, alpha, beta)
+            if score <= alpha:
+                below *= self.ASPIRATION_GROWTH
+            elif score >= beta:
+                above *= self.ASPIRATION_GROWTH
+            else:
+                return score, move
+
+
+_worker_engine = None # the engine of a worker process of the parallel search, kept between moves
+_worker_bound = None
+
+
+def _init_worker(shared_bound, tt_size_mb: float, deterministic: bool, collect_stats: bool, evaluation: str) -> None:
+    """ Runs once in each process of the pool of Michel_Peck.root_search """
+    global _worker_engine, _worker_bound
+    _worker_engine = Michel_Peck(tt_size_mb, deterministic=deterministic, collect_stats=collect_stats, evaluation=evaluation)
+    _worker_bound = shared_bound
+
+
+def _search_root_move(board: othello.OthelloGame, move: tuple[int, int], depth: int, alpha: float, deadline: float,
+                      search_id: tuple, tag: float, share_alpha: bool) -> tuple[float, float, int, othello_search.SearchStats]:
+    """ Runs in a worker process: searches one root move and returns its score (None if out of time), the alpha it
+        was searched with (raised by the shared bound), the number of nodes it took and their stats (None if not
+        collected). The deadline is a time.time(), None for no limit """
+    engine = _worker_engine
+    if engine.search_id != search_id: # first task of a new search, same root board for all its tasks
+        engine.start_search(board, None)
+        engine.search_id = search_id
+    engine.deadline = math.inf if deadline is None else time.perf_counter() + deadline - time.time()
+    engine.root_depth = depth
+    engine.pool_tag = tag
+    nodes = engine.nodes
+    if engine.stats is not None:
+        engine.stats.clear() # each task sends its own stats back
+        board = othello_search.TimedBoard(board, engine.stats)
+    if share_alpha and _worker_bound[0] == tag:
+        alpha = max(alpha, _worker_bound[1])
+    try:
+        score = engine.search_root_move(board, move, depth, alpha)
+    except othello_search.SearchTimeout:
+        return None, alpha, engine.nodes - nodes, engine.stats
+    if share_alpha and score > alpha: # an exact score, not an upper bound
+        with _worker_bound.get_lock():
+            if _worker_bound[0] == tag and score > _worker_bound[1]:
+                _worker_bound[1] = score
+    return score, alpha, engine.nodes - nodes, engine.stats
@@ -1,14 +1,21 @@
 """
 This is the file with the Othello game logic. It contains the OthelloGame class that represents the game state
+
+The board is stored as two bitboards: one Python int per color where bit ``row * cols + col`` is set
+when that color owns the cell. Move generation, flipping and scoring are done with shifts and masks
+on those ints, the 2D list of '.'/'B'/'W' strings is only built on demand for the GUI and older code.
 """
 
 import copy
+import random
 
 # Game Constants
 NONE = '.'
 BLACK = 'B'
 WHITE = 'W'
 
+OPPOSITE = {BLACK: WHITE, WHITE: BLACK}
+
 
 class InvalidMoveException(Exception):
     """ Raised whenever an exception arises from an invalid move """
@@ -20,6 +27,113 @@ class InvalidTypeException(Exception):
     pass
 
 
+class BoardGeometry:
+    """
+    Masks and shifts for a board of a given size, shared by every game of that size.
+
+    Each of the 8 directions is a (shift, mask) pair: shifting a bitboard left moves every disc towards
+    higher indexes (east, south, south-east, south-west) and shifting right towards lower ones. The mask
+    removes the discs that wrapped around from one edge column to the other and the bits past the board.
+    """
+
+    def __init__(self, rows: int, cols: int):
+        self.rows = rows
+        self.cols = cols
+        self.size = rows * cols
+        self.full = (1 << self.size) - 1
+
+        first_col = 0
+        last_col = 0
+        for row in range(rows):
+            first_col |= 1 << (row * cols)
+            last_col |= 1 << (row * cols + cols - 1)
+        not_first_col = self.full & ~first_col
+        not_last_col = self.full & ~last_col
+
+        # east, south, south-east, south-west
+        self.left_shifts = ((1, not_first_col), (cols, self.full),
+                            (cols + 1, not_first_col), (cols - 1, not_last_col))
+        # west, north, north-west, north-east
+        self.right_shifts = ((1, not_last_col), (cols, self.full),
+                             (cols + 1, not_last_col), (cols - 1, not_first_col))
+
+        # neighbours[index] is the mask of the (up to 8) cells around the cell of bit `index`
+        self.neighbours = tuple(self.dilate(1 << index) for index in range(self.size))
+
+        # Zobrist keys. Seeded by the board size so that the keys, and so the position hashes,
+        # are the same in every process and every run
+        rng = random.Random(f"zobrist {rows}x{cols}")
+        self.black_keys = tuple(rng.getrandbits(64) for _ in range(self.size))
+        self.white_keys = tuple(rng.getrandbits(64) for _ in range(self.size))
+        self.flip_keys = tuple(black ^ white for black, white in zip(self.black_keys, self.white_keys))
+        self.white_turn_key = rng.getrandbits(64)
+
+    def dilate(self, bits: int) -> int:
+        """ Returns the cells next to at least one of the cells of `bits`, in any of the 8 directions """
+        grown = 0
+        for shift, mask in self.left_shifts:
+            grown |= (bits << shift) & mask
+        for shift, mask in self.right_shifts:
+            grown |= (bits >> shift) & mask
+        return grown
+
+    def legal_moves(self, own: int, opp: int) -> int:
+        """ Returns the bitboard of every legal move of the `own` player. In each direction, grows the rays
+            of opponent discs that start next to one of our discs, and the empty cell right after a ray
+            is a legal move """
+        moves = 0
+        for shift, mask in self.left_shifts:
+            targets = opp & mask
+            ray = (own << shift) & targets
+            grown = ray
+            while grown:
+                grown = (grown << shift) & targets
+                ray |= grown
+            moves |= (ray << shift) & mask
+        for shift, mask in self.right_shifts:
+            targets = opp & mask
+            ray = (own >> shift) & targets
+            grown = ray
+            while grown:
+                grown = (grown >> shift) & targets
+                ray |= grown
+            moves |= (ray >> shift) & mask
+        return moves & ~(own | opp)
+
+    def flips(self, bit: int, own: int, opp: int) -> int:
+        """ Returns the opponent discs that a disc of `own` put on the cell of `bit` would flip. Walks each
+            of the 8 directions while it is on opponent discs and keeps the run only if it ends on one of ours """
+        flips = 0
+        for shift, mask in self.left_shifts:
+            run = 0
+            cell = (bit << shift) & mask
+            while cell & opp:
+                run |= cell
+                cell = (cell << shift) & mask
+            if cell & own:
+                flips |= run
+        for shift, mask in self.right_shifts:
+            run = 0
+            cell = (bit >> shift) & mask
+            while cell & opp:
+                run |= cell
+                cell = (cell >> shift) & mask
+            if cell & own:
+                flips |= run
+        return flips
+
+
+_geometries = {}
+
+
+def get_geometry(rows: int, cols: int) -> BoardGeometry:
+    """ Returns the (cached) BoardGeometry for a board of the given size """
+    geometry = _geometries.get((rows, cols))
+    if geometry is None:
+        geometry = _geometries[(rows, cols)] = BoardGeometry(rows, cols)
+    return geometry
+
+
 class OthelloGame:
     """
     Class that creates the Othello game and deals with all its game logic
@@ -29,37 +143,76 @@ class OthelloGame:
         """ Initialize all of the games settings and creates the board. """
         self.rows = rows
         self.cols = cols
-        self.current_board = self._new_game_board(rows, cols, WHITE)
+        self.geometry = get_geometry(rows, cols)
+        self.black_bits, self.white_bits = self._new_game_bits(rows, cols, WHITE)
         self.turn = turn
         self.scores = self.compute_scores()
+        self.key = self.compute_key()
+        self._reset_caches()
 
     def copy_game(self):
         """ Returns a copy of the current game """
-        copy_game = OthelloGame(self.rows, self.cols, self.turn)
-        copy_game.current_board = self.copy_board()
-        copy_game.scores = self.scores
+        copy_game = OthelloGame.__new__(OthelloGame)
+        copy_game.__dict__.update(self.__dict__)
+        copy_game._board_view = None
         return copy_game
 
+    def __getstate__(self) -> dict:
+        """ Pickles only the position, the geometry and the cached 2D board are rebuilt on the other side """
+        state = self.__dict__.copy()
+        del state['geometry']
+        state['_board_view'] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.geometry = get_geometry(self.rows, self.cols)
+
     def copy_board(self):
         """ Returns a copy of the current game's 2D board """
         return copy.deepcopy(self.current_board)
 
-    def _new_game_board(self, rows: int, cols: int, top_left: str) -> list[list[str]]:
-        """ Creates the Othello Game board with specified dimensions. """
-        board = []
-
-        # Create an empty board
-        for row in range(rows):
-            board.append([])
-            for col in range(cols):
-                board[-1].append(NONE)
-
-        board[rows // 2 - 1][cols // 2 - 1] = top_left
-        board[rows // 2 - 1][cols // 2] = self._opposite_turn(top_left)
-        board[rows // 2][cols // 2 - 1] = self._opposite_turn(top_left)
-        board[rows // 2][cols // 2] = top_left
-
-        return board
+    @property
+    def current_board(self) -> list[list[str]]:
+        """ The 2D board built from the bitboards. It is cached until the next move, so treat it as read-only
+            and assign a whole new board to change the position """
+        if self._board_view is None:
+            board = []
+            for row in range(self.rows):
+                board.append([])
+                for col in range(self.cols):
+                    board[-1].append(self._cell_color(row, col))
+            self._board_view = board
+        return self._board_view
+
+    @current_board.setter
+    def current_board(self, board: list[list[str]]) -> None:
+        black_bits = 0
+        white_bits = 0
+        for row in range(self.rows):
+            for col in range(self.cols):
+                if board[row][col] == BLACK:
+                    black_bits |= 1 << (row * self.cols + col)
+                elif board[row][col] == WHITE:
+                    white_bits |= 1 << (row * self.cols + col)
+        self.set_bits(black_bits, white_bits)
+
+    def _reset_caches(self) -> None:
+        """ Recomputes the frontier (the empty cells next to at least one disc) from scratch and forgets
+            the cached legal moves. Every move then keeps them up to date incrementally """
+        occupied = self.black_bits | self.white_bits
+        self.frontier = self.geometry.dilate(occupied) & ~occupied
+        self._black_moves = None
+        self._white_moves = None
+        self._board_view = None
+
+    def _new_game_bits(self, rows: int, cols: int, top_left: str) -> tuple[int, int]:
+        """ Creates the Othello Game bitboards (black, white) with specified dimensions. """
+        top_left_bits = (1 << ((rows // 2 - 1) * cols + cols // 2 - 1)) | (1 << ((rows // 2) * cols + cols // 2))
+        top_right_bits = (1 << ((rows // 2 - 1) * cols + cols // 2)) | (1 << ((rows // 2) * cols + cols // 2 - 1))
+        if top_left == BLACK:
+            return top_left_bits, top_right_bits
+        return top_right_bits, top_left_bits
 
     def move(self, row: int, col: int, fake_move: bool = False):
         """ Attempts to make a move at given row/col position.
@@ -72,113 +225,120 @@ class OthelloGame:
         # within the board's boundary
         if type(row) is not int or type(col) is not int:
             raise InvalidTypeException
+        if not self._is_valid_cell(row, col):
+            raise InvalidMoveException()
 
-        if fake_move:
-            temp_board = self.copy_board()
-        self._require_valid_empty_space_to_move(row, col)
-        possible_directions = self._adjacent_opposite_color_directions(
-            row, col, self.turn)
-
-        next_turn = self.turn
-        for direction in possible_directions:
-            if self._is_valid_directional_move(row, col, direction[0], direction[1], self.turn):
-                next_turn = self._opposite_turn(self.turn)
-            self._convert_adjacent_cells_in_direction(
-                row, col, direction[0], direction[1], self.turn)
-
-        if next_turn != self.turn:
-            self.current_board[row][col] = self.turn
-            if self.can_move(next_turn):
-                self.switch_turn()
-            self.scores = self.compute_scores()
-        else:
+        bit = 1 << (row * self.cols + col)
+        if not self._moves_of(self.turn) & bit:
             raise InvalidMoveException()
+        own, opp = self._own_and_opponent_bits(self.turn)
+        record = self._play(bit, self._flipped_bits(bit, own, opp))
 
         if fake_move:
             fake_board = self.current_board
-            self.current_board = temp_board
+            self.unmake_move(record)
             return fake_board
 
-    def _is_valid_directional_move(self, row: int, col: int, rowdelta: int, coldelta: int, turn: str) -> bool:
-        """ Given a move at specified row/col, checks in the given direction to see if
-            a valid move can be made. Returns True if it can; False otherwise.
-            Only supposed to be used in conjunction with _adjacent_opposite_color_directions()"""
-        current_row = row + rowdelta
-        current_col = col + coldelta
-
-        last_cell_color = self._opposite_turn(turn)
-
-        while True:
-            # Immediately return false if the board reaches the end (b/c there's no blank
-            # space for the cell to sandwich the other colored cell(s)
-            if not self._is_valid_cell(current_row, current_col):
-                break
-            if self._cell_color(current_row, current_col) == NONE:
-                break
-            if self._cell_color(current_row, current_col) == turn:
-                last_cell_color = turn
-                break
-
-            current_row += rowdelta
-            current_col += coldelta
-
-        return last_cell_color == turn
-
-    def _adjacent_opposite_color_directions(self, row: int, col: int, turn: str) -> list[tuple]:
-        """ Looks up to a possible of 8 directions surrounding the given move. If any of the
-            move's surrounding cells is the opposite color of the move itself, then record
-            the direction it is in and store it in a list of tuples [(rowdelta, coldelta)].
-            Return the list of the directions at the end. """
-        dir_list = []
-        for rowdelta in range(-1, 2):
-            for coldelta in range(-1, 2):
-                if self._is_valid_cell(row + rowdelta, col + coldelta):
-                    if self.current_board[row + rowdelta][col + coldelta] == self._opposite_turn(turn):
-                        dir_list.append((rowdelta, coldelta))
-        return dir_list
-
-    def _convert_adjacent_cells_in_direction(self, row: int, col: int,
-                                             rowdelta: int, coldelta: int, turn: str) -> None:
-        """ If it can, converts all the adjacent/contiguous cells on a turn in
-            a given direction until it finally reaches the specified cell's original color """
-        if self._is_valid_directional_move(row, col, rowdelta, coldelta, turn):
-            current_row = row + rowdelta
-            current_col = col + coldelta
-
-            while self._cell_color(current_row, current_col) == self._opposite_turn(turn):
-                self._flip_cell(current_row, current_col)
-                current_row += rowdelta
-                current_col += coldelta
+    def make_move(self, row: int, col: int) -> tuple:
+        """ Plays the current player's move at row/col in place, like move() but without any type, bounds
+            or legality check: the move MUST be one of get_possible_move(). Meant for engines that search a
+            single position. Returns the undo record to give back to unmake_move() """
+        bit = 1 << (row * self.cols + col)
+        own, opp = self._own_and_opponent_bits(self.turn)
+        return self._play(bit, self._flipped_bits(bit, own, opp))
+
+    def unmake_move(self, record: tuple) -> None:
+        """ Takes back the move of the undo record returned by make_move(). Moves have to be taken back
+            in the reverse order they were made """
+        bit, flips, turn, scores, key, frontier, black_moves, white_moves = record
+        if turn == BLACK:
+            self.black_bits &= ~(bit | flips)
+            self.white_bits |= flips
+        else:
+            self.white_bits &= ~(bit | flips)
+            self.black_bits |= flips
+        self.turn = turn
+        self.scores = scores
+        self.key = key
+        self.frontier = frontier
+        self._black_moves = black_moves
+        self._white_moves = white_moves
+        self._board_view = None
+
+    def _play(self, bit: int, flips: int) -> tuple:
+        """ Puts the current player's disc on the cell of `bit`, flips `flips`, updates the scores from the
+            flip count and gives the turn to the opponent if it can move. Returns the undo record
+            (bit, flips, previous turn, scores, key, frontier and cached legal moves) """
+        turn = self.turn
+        record = (bit, flips, turn, self.scores, self.key, self.frontier, self._black_moves, self._white_moves)
+        self._place(bit, flips, turn)
+        flipped = flips.bit_count()
+        black, white = self.scores
+        if turn == BLACK:
+            self.scores = (black + flipped + 1, white - flipped)
+        else:
+            self.scores = (black - flipped, white + flipped + 1)
+        if self._moves_of(OPPOSITE[turn]):
+            self.turn = OPPOSITE[turn]
+            self.key ^= self.geometry.white_turn_key
+        return record
+
+    def _place(self, bit: int, flips: int, turn: str) -> None:
+        """ Puts a disc of the given color on the cell of `bit` and flips the `flips` discs over to it """
+        geometry = self.geometry
+        if turn == BLACK:
+            self.black_bits |= bit | flips
+            self.white_bits &= ~flips
+            key = self.key ^ geometry.black_keys[bit.bit_length() - 1]
+        else:
+            self.white_bits |= bit | flips
+            self.black_bits &= ~flips
+            key = self.key ^ geometry.white_keys[bit.bit_length() - 1]
+        while flips:
+            low = flips & -flips
+            key ^= geometry.flip_keys[low.bit_length() - 1]
+            flips ^= low
+        self.key = key
+        # Flips never change which cells are empty, only the new disc does
+        self.frontier = (self.frontier & ~bit) | (geometry.neighbours[bit.bit_length() - 1]
+                                                  & ~(self.black_bits | self.white_bits))
+        self._black_moves = None
+        self._white_moves = None
+        self._board_view = None
+
+    def _flipped_bits(self, bit: int, own: int, opp: int) -> int:
+        """ Returns the opponent discs that a disc put on the cell of `bit` would flip """
+        return self.geometry.flips(bit, own, opp)
+
+    def _legal_moves_bits(self, own: int, opp: int) -> int:
+        """ Returns the bitboard of every legal move of the `own` player """
+        return self.geometry.legal_moves(own, opp) & self.frontier
+
+    def _moves_of(self, turn: str) -> int:
+        """ Returns the bitboard of the legal moves of the specified player, computed at most once per
+            position. No legal move can be played outside of the frontier """
+        if turn == BLACK:
+            if self._black_moves is None:
+                self._black_moves = self._legal_moves_bits(self.black_bits, self.white_bits) if self.frontier else 0
+            return self._black_moves
+        if self._white_moves is None:
+            self._white_moves = self._legal_moves_bits(self.white_bits, self.black_bits) if self.frontier else 0
+        return self._white_moves
 
     def get_possible_move(self):
         """ Looks at all the empty cells in the board and return possible moves """
-        possible_move = []
-        for row in range(self.rows):
-            for col in range(self.cols):
-                if self._cell_color(row, col) == NONE:
-                    possible_directions = self._adjacent_opposite_color_directions(
-                        row, col, self.turn)
-                    for direction in possible_directions:
-                        if self._is_valid_directional_move(row, col, direction[0], direction[1], self.turn):
-                            possible_move.append((row, col))
-        return possible_move
+        return self._bits_to_cells(self._moves_of(self.turn))
 
     def is_game_over(self) -> bool:
         """ Looks through every empty cell and determines if there are
             any valid moves left. If not, returns True; otherwise returns False """
-        return self.can_move(BLACK) is False and self.can_move(WHITE) is False
+        return not self._moves_of(self.turn) and not self._moves_of(OPPOSITE[self.turn])
 
     def can_move(self, turn: str) -> bool:
         """ Looks at all the empty cells in the board and checks to
             see if the specified player can move in any of the cells.
             Returns True if it can move; False otherwise. """
-        for row in range(self.rows):
-            for col in range(self.cols):
-                if self.current_board[row][col] == NONE:
-                    for direction in self._adjacent_opposite_color_directions(row, col, turn):
-                        if self._is_valid_directional_move(row, col, direction[0], direction[1], turn):
-                            return True
-        return False
+        return self._moves_of(turn) != 0
 
     def return_winner(self) -> str:
         """ Returns the winner. ONLY to be called once the game is over.
@@ -196,7 +356,8 @@ class OthelloGame:
         """ Switches the player's turn from the current one to
             the other. Only to be called if the current player
             cannot move at all. """
-        self.turn = self._opposite_turn(self.turn)
+        self.turn = OPPOSITE[self.turn]
+        self.key ^= self.geometry.white_turn_key
 
     def get_board(self) -> list[list[str]]:
         """ Returns the current game's 2D board """
@@ -223,37 +384,65 @@ class OthelloGame:
         else:
             return self.scores
 
+    def get_key(self) -> int:
+        """ Returns the 64 bits Zobrist hash of the position (discs and turn) """
+        return self.key
+
+    def get_bits(self, color: str) -> int:
+        """ Returns the bitboard of the specified color """
+        return self.black_bits if color == BLACK else self.white_bits
+
+    def set_bits(self, black_bits: int, white_bits: int) -> None:
+        """ Sets up the position from its two bitboards, keeping the turn, like assigning current_board does """
+        self.black_bits = black_bits
+        self.white_bits = white_bits
+        self.scores = self.compute_scores()
+        self.key = self.compute_key()
+        self._reset_caches()
+
     def compute_scores(self) -> tuple[int, int]:
         """ Returns the total cell count of the specified colored player """
-        black = 0
-        white = 0
-        for row in range(self.rows):
-            for col in range(self.cols):
-                if self.current_board[row][col] == BLACK:
-                    black += 1
-                elif self.current_board[row][col] == WHITE:
-                    white += 1
-        return black, white
+        return self.black_bits.bit_count(), self.white_bits.bit_count()
+
+    def compute_key(self) -> int:
+        """ Returns the Zobrist hash of the position, computed from scratch """
+        geometry = self.geometry
+        key = geometry.white_turn_key if self.turn == WHITE else 0
+        for index in range(geometry.size):
+            if self.black_bits >> index & 1:
+                key ^= geometry.black_keys[index]
+            elif self.white_bits >> index & 1:
+                key ^= geometry.white_keys[index]
+        return key
 
     # The rest of the functions are private functions only to be used within this module
-    def _flip_cell(self, row: int, col: int) -> None:
-        """ Flips the specified cell over to the other color """
-        self.current_board[row][col] = self._opposite_turn(
-            self.current_board[row][col])
+    def _own_and_opponent_bits(self, turn: str) -> tuple[int, int]:
+        """ Returns the bitboards of the specified player and of its opponent """
+        if turn == BLACK:
+            return self.black_bits, self.white_bits
+        return self.white_bits, self.black_bits
+
+    def _bits_to_cells(self, bits: int) -> list[tuple[int, int]]:
+        """ Converts a bitboard to the list of its (row, col) cells, in row by row order """
+        cells = []
+        while bits:
+            low = bits & -bits
+            cells.append(divmod(low.bit_length() - 1, self.cols))
+            bits ^= low
+        return cells
 
     def _cell_color(self, row: int, col: int) -> str:
         """ Determines the color/player of the specified cell """
-        return self.current_board[row][col]
+        bit = 1 << (row * self.cols + col)
+        if self.black_bits & bit:
+            return BLACK
+        if self.white_bits & bit:
+            return WHITE
+        return NONE
 
     def _opposite_turn(self, turn: str) -> str:
         """ Returns the player of the opposite player """
-        return {BLACK: WHITE, WHITE: BLACK}[turn]
-
-    def _require_valid_empty_space_to_move(self, row: int, col: int) -> bool:
-        """ In order to move, the specified cell space must be within board boundaries
-            AND the cell has to be empty """
-        if self._is_valid_cell(row, col) and self._cell_color(row, col) != NONE:
-            raise InvalidMoveException()
+        return OPPOSITE[turn]
 
     def _is_valid_cell(self, row: int, col: int) -> bool:
         """ Returns True if the given cell move position is invalid due to
@@ -0,0 +1,265 @@
+""" This file contains the headless arena: it makes the AIs of the ai folder play each other without the GUI,
+    many games at once in worker processes, and reports how each AI did.
+
+    Usage: python othello_arena.py Michel_Peck Random --games 1000 --sizes 7x9 8x8 --workers 8
+"""
+
+import argparse
+import glob
+import importlib
+import inspect
+import json
+import os.path
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import othello
+import othello_engine_host
+import othello_record
+
+AI_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ai')
+DEFAULT_SIZES = [(7, 9)]
+
+_engine_pool = None # hosts of the AIs of this process, when they play hosted, kept warm from game to game
+
+
+def discover_engines() -> list[str]:
+    """ Returns the names of the AIs of the ai folder. Same convention as the GUI's OptionDialog: each module
+        ai/<Name>.py holds a class <Name> """
+    return sorted(os.path.basename(path).split(".")[0] for path in glob.glob(os.path.join(AI_FOLDER, "*.py")))
+
+
+def load_engine(name: str):
+    """ Imports ai.<name> and returns a new instance of its <name> class """
+    return getattr(importlib.import_module(f"ai.{name}"), name)()
+
+
+def play_game(black_name: str, white_name: str, rows: int, cols: int, seed: int = None,
+              time_limit: float = None, collect_stats: bool = False, ponder: bool = False, hosted: bool = False) -> dict:
+    """ Plays one game between two AIs and returns its result: names, board size, final scores, the moves
+        played, and for each color the time of each move and the nodes searched. With `collect_stats`, the
+        AIs that can collect search stats (collect_stats attribute) do, and the summary of the stats of each of
+        their moves is added. With `ponder`, the AIs that can think on the other one's time (ponder attribute) do.
+        With `hosted`, each AI plays from a worker process of its own (see othello_engine_host), which is reused by
+        the next games of this process, and is stopped if it goes over the time limit; the nodes and the stats of
+        its moves are then not known. An AI that plays an illegal move, raises or times out loses the game by
+        forfeit """
+    global _engine_pool
+
+    if seed is not None:
+        random.seed(seed)
+    if hosted:
+        if _engine_pool is None:
+            _engine_pool = othello_engine_host.EnginePool()
+        engines = {othello.BLACK: _engine_pool.acquire(black_name, ponder),
+                   othello.WHITE: _engine_pool.acquire(white_name, ponder)}
+    else:
+        engines = {othello.BLACK: load_engine(black_name), othello.WHITE: load_engine(white_name)}
+    stats = {othello.BLACK: [], othello.WHITE: []}
+    for engine in engines.values():
+        if collect_stats and hasattr(engine, 'collect_stats'):
+            engine.collect_stats = True
+        if ponder and hasattr(engine, 'ponder'):
+            engine.ponder = True
+    game = othello.OthelloGame(rows, cols, othello.BLACK)
+    moves = []
+    latencies = {othello.BLACK: [], othello.WHITE: []}
+    nodes = {othello.BLACK: 0, othello.WHITE: 0}
+    forfeit = None
+
+    while not game.is_game_over():
+        turn = game.get_turn()
+        engine = engines[turn]
+        start = time.perf_counter()
+        try:
+            if time_limit is not None and 'time_limit' in inspect.signature(engine.next_move).parameters:
+                move = engine.next_move(game.copy_game(), time_limit=time_limit)
+            else:
+                move = engine.next_move(game.copy_game())
+            latencies[turn].append(time.perf_counter() - start)
+            nodes[turn] += getattr(engine, 'nodes', 0)
+            if getattr(engine, 'stats', None) is not None:
+                stats[turn].append(engine.stats.summary())
+            game.move(move[0], move[1])
+        except Exception:
+            forfeit = turn
+            break
+        moves.append((move[0], move[1]))
+
+    for engine in engines.values():
+        if hosted:
+            _engine_pool.release(engine)
+        elif hasattr(engine, 'close'):
+            engine.close()
+
+    black, white = game.get_scores()
+    if forfeit is not None:
+        winner = othello.OPPOSITE[forfeit]
+    elif black != white:
+        winner = othello.BLACK if black > white else othello.WHITE
+    else:
+        winner = None
+    return {'black': black_name, 'white': white_name, 'rows': rows, 'cols': cols, 'seed': seed,
+            'scores': (black, white), 'winner': winner, 'forfeit': forfeit, 'moves': moves,
+            'latencies': latencies, 'nodes': nodes, 'stats': stats}
+
+
+def _play_game(args: tuple) -> dict:
+    """ play_game for the worker processes """
+    return play_game(*args)
+
+
+def schedule(engine_names: list[str], games: int, sizes: list[tuple[int, int]], seed: int = 0,
+             time_limit: float = None, collect_stats: bool = False, ponder: bool = False,
+             hosted: bool = False) -> list[tuple]:
+    """ Returns the arguments of play_game for `games` games between each pair of AIs, going through the board
+        sizes in turn and swapping the colors every game """
+    pairs = [(first, second) for index, first in enumerate(engine_names) for second in engine_names[index + 1:]]
+    if len(engine_names) == 1:
+        pairs = [(engine_names[0], engine_names[0])]
+    games_list = []
+    for first, second in pairs:
+        for number in range(games):
+            rows, cols = sizes[number // 2 % len(sizes)]
+            black, white = (first, second) if number % 2 == 0 else (second, first)
+            games_list.append((black, white, rows, cols, seed + len(games_list), time_limit, collect_stats, ponder,
+                               hosted))
+    return games_list
+
+
+def run(games_list: list[tuple], workers: int = None, on_result=None) -> list[dict]:
+    """ Plays the scheduled games on `workers` processes (all the CPUs by default, 0 or 1 to play them here)
+        and returns their results in the scheduled order. `on_result` is called with each result as it comes """
+    if workers is not None and workers <= 1:
+        results = []
+        for args in games_list:
+            results.append(play_game(*args))
+            if on_result is not None:
+                on_result(results[-1])
+        return results
+    with ProcessPoolExecutor(workers) as pool:
+        results = []
+        for result in pool.map(_play_game, games_list, chunksize=max(1, len(games_list) // (8 * (workers or os.cpu_count() or 1)))):
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+        return results
+
+
+def _percentile(values: list[float], percent: float) -> float:
+    """ Nearest-rank percentile of the values, 0 if there are none """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(percent / 100 * len(values))) - 1))]
+
+
+def summarize(results: list[dict]) -> dict:
+    """ Returns, for each AI: games played, win/draw/loss rates, forfeits, average disc margin, move latency
+        percentiles (seconds) and nodes per second (only for the AIs that count their nodes) """
+    stats = {}
+    for result in results:
+        black, white = result['scores']
+        for color, name, margin in ((othello.BLACK, result['black'], black - white),
+                                    (othello.WHITE, result['white'], white - black)):
+            engine = stats.setdefault(name, {'games': 0, 'wins': 0, 'draws': 0, 'losses': 0, 'forfeits': 0,
+                                             'margin': 0, 'latencies': [], 'nodes': 0})
+            engine['games'] += 1
+            if result['winner'] is None:
+                engine['draws'] += 1
+            elif result['winner'] == color:
+                engine['wins'] += 1
+            else:
+                engine['losses'] += 1
+            if result['forfeit'] == color:
+                engine['forfeits'] += 1
+            engine['margin'] += margin
+            engine['latencies'].extend(result['latencies'][color])
+            engine['nodes'] += result['nodes'][color]
+
+    summary = {}
+    for name, engine in stats.items():
+        thinking_time = sum(engine['latencies'])
+        summary[name] = {
+            'games': engine['games'],
+            'win_rate': engine['wins'] / engine['games'],
+            'draw_rate': engine['draws'] / engine['games'],
+            'loss_rate': engine['losses'] / engine['games'],
+            'forfeits': engine['forfeits'],
+            'average_margin': engine['margin'] / engine['games'],
+            'moves': len(engine['latencies']),
+            'latency_p50': _percentile(engine['latencies'], 50),
+            'latency_p90': _percentile(engine['latencies'], 90),
+            'latency_p99': _percentile(engine['latencies'], 99),
+            'latency_max': max(engine['latencies'], default=0.0),
+            'nodes_per_second': engine['nodes'] / thinking_time if engine['nodes'] and thinking_time else None,
+        }
+    return summary
+
+
+def print_summary(summary: dict, file=sys.stdout) -> None:
+    """ Prints the summary as a table """
+    print(f"{'AI':<20}{'games':>7}{'win':>7}{'draw':>7}{'loss':>7}{'margin':>8}"
+          f"{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}{'nodes/s':>10}", file=file)
+    for name, engine in sorted(summary.items()):
+        nodes_per_second = f"{engine['nodes_per_second']:.0f}" if engine['nodes_per_second'] is not None else '-'
+        print(f"{name:<20}{engine['games']:>7}{engine['win_rate']:>7.1%}{engine['draw_rate']:>7.1%}"
+              f"{engine['loss_rate']:>7.1%}{engine['average_margin']:>8.2f}"
+              f"{engine['latency_p50'] * 1000:>9.1f}{engine['latency_p90'] * 1000:>9.1f}"
+              f"{engine['latency_p99'] * 1000:>9.1f}{engine['latency_max'] * 1000:>9.1f}{nodes_per_second:>10}",
+              file=file)
+
+
+def parse_size(text: str) -> tuple[int, int]:
+    """ Parses a board size written ROWSxCOLS, like 7x9 """
+    rows, cols = (int(number) for number in text.lower().split('x'))
+    if not (4 <= rows <= 19 and 4 <= cols <= 19):
+        raise argparse.ArgumentTypeError(f"{text}: boards go from 4x4 to 19x19")
+    return rows, cols
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Plays the AIs of the ai folder against each other, without the GUI.")
+    parser.add_argument('engines', nargs='*', help=f"AIs to play, all of them by default ({', '.join(discover_engines())})")
+    parser.add_argument('--games', type=int, default=100, help="games per pair of AIs, colors swap every game")
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=DEFAULT_SIZES, help="board sizes, like 7x9 8x8")
+    parser.add_argument('--workers', type=int, default=None, help="processes, all the CPUs by default")
+    parser.add_argument('--time-limit', type=float, default=None, help="seconds per move, for the AIs that take one")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the first game, the others follow")
+    parser.add_argument('--stats', action='store_true', help="collect the search stats of each move (in the JSON file)")
+    parser.add_argument('--ponder', action='store_true',
+                        help="let the AIs that can think on the other one's time (in the same process, so they share the CPU)")
+    parser.add_argument('--hosted', action='store_true',
+                        help="play each AI from a warm worker process of its own, stopped if it goes over the time limit")
+    parser.add_argument('--json', help="also write the summary and every result to this file")
+    parser.add_argument('--record', help="also append every game to this game record file (see othello_record)")
+    args = parser.parse_args(argv)
+
+    engine_names = args.engines or discover_engines()
+    for name in engine_names:
+        if name not in discover_engines():
+            parser.error(f"no AI called {name} in {AI_FOLDER}")
+
+    games_list = schedule(engine_names, args.games, args.sizes, args.seed, args.time_limit, args.stats, args.ponder,
+                          args.hosted)
+    writer = othello_record.RecordWriter(args.record) if args.record else None
+    start = time.perf_counter()
+    try:
+        results = run(games_list, args.workers, writer.write_result if writer is not None else None)
+    finally:
+        if writer is not None:
+            writer.close()
+    elapsed = time.perf_counter() - start
+    summary = summarize(results)
+
+    print(f"{len(results)} games in {elapsed:.1f}s")
+    print_summary(summary)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'summary': summary, 'results': results}, file)
+
+
+if __name__ == '__main__':
+    main()
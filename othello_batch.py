@@ -0,0 +1,283 @@
+"""
+This file contains the batch game engine: N games of one board size played together, each step plays one move in every
+game that isn't over with NumPy operations on the whole batch, instead of one OthelloGame at a time. It is meant for
+playouts and self-play, where the games are many and the moves are chosen by a simple policy.
+
+The boards are boolean arrays, a row per game and a column per cell, flattened with a border of empty cells around
+the board ((rows + 2) * (cols + 2) columns): moving every disc one cell in a direction is then a slice, and the border
+stops the discs that would wrap from one edge to the other. The games are seen from the player to move (own and
+opponent discs), like the bitboards of the AIs, and black_to_move tells who that is.
+
+- the legal moves of all the games are found like BoardGeometry.legal_moves does, a direction at a time
+- the flips are found by walking the 8 rays from the move of each game, a cell at a time for all the games at once
+- a player who can't move passes at once, as in OthelloGame, so every game is either over or has a legal move
+
+A policy is called with the batch and the legal moves (a boolean per game and cell, in the row * cols + col order of
+the bitboards) and returns the cell played in each game, -1 in the games that are over. RandomPolicy and
+WeightedPolicy choose them all at once.
+
+Usage: python othello_batch.py --size 8x8 --games 4096
+"""
+
+import argparse
+import time
+
+import numpy
+
+import othello
+import othello_eval
+
+
+class BatchGame:
+    """
+    `count` games of a board size, from the starting position or from OthelloGames (from_games), and back to
+    OthelloGames (to_games).
+    """
+
+    def __init__(self, rows: int, cols: int, count: int, turn: str = othello.BLACK):
+        """
+        :param rows: rows of the boards
+        :type rows: int
+        :param cols: columns of the boards
+        :type cols: int
+        :param count: number of games
+        :type count: int
+        :param turn: player of the first move of every game, like OthelloGame
+        :type turn: str
+        """
+        self.rows = rows
+        self.cols = cols
+        self.count = count
+        width = cols + 2
+        self._width = width
+        self._padded_size = (rows + 2) * width
+        # _cells[index] is the column of the cell of bit `index` (row * cols + col) in the padded boards
+        self._cells = numpy.array([(row + 1) * width + col + 1 for row in range(rows) for col in range(cols)])
+        self._inside = numpy.zeros(self._padded_size, dtype=bool)
+        self._inside[self._cells] = True
+        # east, west, south, north, south-east, north-west, south-west, north-east
+        self._offsets = (1, -1, width, -width, width + 1, -width - 1, width - 1, -width + 1)
+        self._longest_ray = max(rows, cols) - 2 # opponent discs in a row between a move and our disc, at most
+
+        self.own = numpy.zeros((count, self._padded_size), dtype=bool)
+        self.opp = numpy.zeros((count, self._padded_size), dtype=bool)
+        self.black_to_move = numpy.full(count, turn == othello.BLACK)
+        self.over = numpy.zeros(count, dtype=bool)
+        self.moves_played = numpy.zeros(count, dtype=numpy.int64) # passes aren't moves
+        start = othello.OthelloGame(rows, cols, turn)
+        self._set_game(slice(None), start)
+        self._update_legal()
+
+    @classmethod
+    def from_games(cls, games: list[othello.OthelloGame]) -> 'BatchGame':
+        """ Returns a batch of the positions of the games, all of the same board size """
+        rows, cols = games[0].get_rows(), games[0].get_columns()
+        batch = cls(rows, cols, len(games))
+        for index, game in enumerate(games):
+            if (game.get_rows(), game.get_columns()) != (rows, cols):
+                raise ValueError("the games of a batch have the same board size")
+            batch._set_game(index, game)
+        batch._update_legal()
+        return batch
+
+    def _set_game(self, index, game: othello.OthelloGame) -> None:
+        """ Puts the position of the game in the game(s) of the batch at index """
+        turn = game.get_turn()
+        self.own[index] = self._unpack(game.get_bits(turn))
+        self.opp[index] = self._unpack(game.get_bits(othello.OPPOSITE[turn]))
+        self.black_to_move[index] = turn == othello.BLACK
+        self.over[index] = game.is_game_over()
+
+    def _unpack(self, bits: int) -> numpy.ndarray:
+        """ Returns a padded board of a bitboard """
+        board = numpy.zeros(self._padded_size, dtype=bool)
+        cells = numpy.unpackbits(numpy.frombuffer(bits.to_bytes((self.rows * self.cols + 7) // 8, 'little'),
+                                                  dtype=numpy.uint8), bitorder='little')
+        board[self._cells] = cells[:self.rows * self.cols].astype(bool)
+        return board
+
+    def _pack(self, board: numpy.ndarray) -> int:
+        """ Returns the bitboard of a padded board """
+        return int.from_bytes(numpy.packbits(board[self._cells], bitorder='little').tobytes(), 'little')
+
+    def to_game(self, index: int) -> othello.OthelloGame:
+        """ Returns the game at index as an OthelloGame """
+        turn = othello.BLACK if self.black_to_move[index] else othello.WHITE
+        game = othello.OthelloGame(self.rows, self.cols, turn)
+        own, opp = self._pack(self.own[index]), self._pack(self.opp[index])
+        game.set_bits(*((own, opp) if turn == othello.BLACK else (opp, own)))
+        return game
+
+    def to_games(self) -> list[othello.OthelloGame]:
+        """ Returns every game of the batch as an OthelloGame """
+        return [self.to_game(index) for index in range(self.count)]
+
+    def _shift(self, boards: numpy.ndarray, offset: int) -> numpy.ndarray:
+        """ Returns the boards with every cell moved by offset columns. Only the border receives the cells that
+            leave the board, and it is masked off by the caller """
+        shifted = numpy.zeros_like(boards)
+        if offset > 0:
+            shifted[:, offset:] = boards[:, :-offset]
+        else:
+            shifted[:, :offset] = boards[:, -offset:]
+        return shifted
+
+    def _legal_moves(self, own: numpy.ndarray, opp: numpy.ndarray) -> numpy.ndarray:
+        """ Returns the padded legal moves of the `own` player of each game. In each direction, grows the rays of
+            opponent discs that start next to one of our discs, and the empty cell right after a ray is a legal move """
+        empty = ~(own | opp) & self._inside
+        moves = numpy.zeros_like(own)
+        for offset in self._offsets:
+            ray = self._shift(own, offset) & opp
+            grown = ray
+            for _ in range(self._longest_ray - 1):
+                grown = self._shift(grown, offset) & opp
+                if not grown.any():
+                    break
+                ray |= grown
+            moves |= self._shift(ray, offset) & empty
+        return moves
+
+    def _update_legal(self) -> None:
+        """ Finds the legal moves of every game, makes the players who have none pass, and ends the games where
+            neither player has any """
+        legal = self._legal_moves(self.own, self.opp)
+        stuck = numpy.flatnonzero(~legal.any(axis=1) & ~self.over)
+        if len(stuck):
+            other = self._legal_moves(self.opp[stuck], self.own[stuck])
+            passing = stuck[other.any(axis=1)]
+            (self.own[passing], self.opp[passing]) = (self.opp[passing], self.own[passing])
+            self.black_to_move[passing] = ~self.black_to_move[passing]
+            legal[passing] = other[other.any(axis=1)]
+            self.over[stuck[~other.any(axis=1)]] = True
+        legal[self.over] = False
+        self._legal = legal
+
+    def legal_moves(self) -> numpy.ndarray:
+        """ Returns the legal moves of the player to move in each game, a boolean per game and cell (row * cols +
+            col), all False in the games that are over """
+        return self._legal[:, self._cells]
+
+    def step(self, moves: numpy.ndarray) -> int:
+        """
+        Plays a move in every game that isn't over.
+
+        :param moves: the cell (row * cols + col) played in each game, ignored in the games that are over
+        :type moves: numpy.ndarray
+        :return: The number of moves played
+        :raises ValueError: a move isn't legal
+        """
+        games = numpy.flatnonzero(~self.over)
+        if not len(games):
+            return 0
+        cells = self._cells[numpy.asarray(moves)[games]]
+        if not self._legal[games, cells].all():
+            raise ValueError(f"illegal move in game {games[~self._legal[games, cells]][0]}")
+        (own, opp) = (self.own, self.opp)
+        last = self._padded_size - 1
+        for offset in self._offsets:
+            # length of the run of opponent discs from the move, and whether one of ours ends it
+            length = numpy.zeros(len(games), dtype=numpy.int64)
+            running = numpy.ones(len(games), dtype=bool)
+            for distance in range(1, self._longest_ray + 1):
+                running &= opp[games, numpy.clip(cells + distance * offset, 0, last)]
+                if not running.any():
+                    break
+                length += running
+            flips = (length > 0) & own[games, numpy.clip(cells + (length + 1) * offset, 0, last)]
+            for distance in range(1, int(length[flips].max(initial=0)) + 1):
+                flipped = flips & (length >= distance)
+                (flipped_games, flipped_cells) = (games[flipped], cells[flipped] + distance * offset)
+                own[flipped_games, flipped_cells] = True
+                opp[flipped_games, flipped_cells] = False
+        own[games, cells] = True
+        self.moves_played[games] += 1
+
+        (self.own, self.opp) = (self.opp, self.own) # the opponent's turn, in the finished games too
+        self.black_to_move = ~self.black_to_move
+        self._update_legal()
+        return len(games)
+
+    def play(self, policy, max_steps: int = None) -> int:
+        """
+        Plays the games with the moves chosen by the policy, until they are all over (or for max_steps steps).
+
+        :param policy: called with (batch, legal moves), returns the cell played in each game (see the top)
+        :param max_steps: most steps to play, None for no limit
+        :type max_steps: int
+        :return: The number of moves played
+        """
+        played = 0
+        steps = 0
+        while not self.over.all() and (max_steps is None or steps < max_steps):
+            played += self.step(policy(self, self.legal_moves()))
+            steps += 1
+        return played
+
+    def scores(self) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """ Returns the number of black discs and of white discs of each game """
+        own = self.own.sum(axis=1)
+        opp = self.opp.sum(axis=1)
+        return numpy.where(self.black_to_move, own, opp), numpy.where(self.black_to_move, opp, own)
+
+
+class RandomPolicy:
+    """ Plays one of the legal moves at random, each as likely, like the Random AI """
+
+    def __init__(self, seed: int = None):
+        self.rng = numpy.random.default_rng(seed)
+
+    def __call__(self, batch: BatchGame, legal: numpy.ndarray) -> numpy.ndarray:
+        keys = self.rng.random(legal.shape)
+        keys[~legal] = -1.0
+        moves = keys.argmax(axis=1)
+        moves[~legal.any(axis=1)] = -1
+        return moves
+
+
+class WeightedPolicy:
+    """
+    Prefers the moves on the cells of high weight (othello_eval, or the given weights): plays each legal move with a
+    chance proportional to exp(weight / temperature), the best one always at a temperature of 0.
+    """
+
+    def __init__(self, rows: int, cols: int, temperature: float = 10.0, weights: tuple[tuple[int, ...], ...] = None,
+                 seed: int = None):
+        weights = weights if weights is not None else othello_eval.get_evaluator(rows, cols).weights
+        self.weights = numpy.array([weight for line in weights for weight in line], dtype=numpy.float64)
+        self.temperature = temperature
+        self.rng = numpy.random.default_rng(seed)
+
+    def __call__(self, batch: BatchGame, legal: numpy.ndarray) -> numpy.ndarray:
+        keys = numpy.broadcast_to(self.weights, legal.shape).copy()
+        if self.temperature > 0: # Gumbel noise: the argmax is then a sample of the softmax of weight / temperature
+            keys += self.temperature * self.rng.gumbel(size=legal.shape)
+        keys[~legal] = -numpy.inf
+        moves = keys.argmax(axis=1)
+        moves[~legal.any(axis=1)] = -1
+        return moves
+
+
+def main(argv: list[str] = None) -> None:
+    from othello_arena import parse_size
+
+    parser = argparse.ArgumentParser(description="Plays a batch of random games and prints how fast it went.")
+    parser.add_argument('--size', type=parse_size, default=(8, 8), help="board size, like 7x9")
+    parser.add_argument('--games', type=int, default=4096, help="games played together")
+    parser.add_argument('--policy', choices=('random', 'weighted'), default='random')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    (rows, cols) = args.size
+    policy = RandomPolicy(args.seed) if args.policy == 'random' else WeightedPolicy(rows, cols, seed=args.seed)
+    start = time.perf_counter()
+    batch = BatchGame(rows, cols, args.games)
+    moves = batch.play(policy)
+    seconds = time.perf_counter() - start
+    black, white = batch.scores()
+    print(f"{args.games} games of {rows}x{cols}, {moves} moves in {seconds:.2f}s: {moves / seconds * 60:,.0f} "
+          f"positions per minute, black won {(black > white).mean():.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+""" This file contains the benchmark suite of the game logic and of the AIs:
+
+    - perft: counts the positions reached in N plies from fixed positions, checked against known counts, and
+      measures how fast OthelloGame generates (get_possible_move) and plays (move) moves
+    - search: Michel_Peck.pvs at a fixed depth over a corpus of midgame positions
+    - games: full Random vs Random games per second
+    - batch: random games played together by othello_batch, moves per second
+
+    The results are written as JSON, and can be compared to the results of an earlier run to catch slowdowns.
+
+    Usage: python othello_bench.py --save bench.json
+           python othello_bench.py --baseline bench.json
+"""
+
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+
+import othello
+
+# (name, rows, cols, moves played from the start, depth, expected count). The counts were checked against the
+# original list-based OthelloGame, and the 8x8 ones against the well-known Othello perft numbers.
+PERFT_POSITIONS = [
+    ('4x4 start', 4, 4, [], 9, 20044),
+    ('4x4 midgame', 4, 4, [(1, 0), (0, 2), (0, 3), (2, 0)], 8, 307),
+    ('7x9 start', 7, 9, [], 6, 8046),
+    ('7x9 midgame', 7, 9, [(2, 2), (3, 2), (4, 1), (1, 3), (0, 2), (5, 0), (4, 3), (5, 4), (5, 3), (1, 4), (3, 1),
+                           (0, 3), (6, 5), (0, 1), (2, 5), (4, 0), (2, 1), (1, 1), (3, 0), (3, 6)], 5, 53813),
+    ('8x8 start', 8, 8, [], 7, 55092),
+    ('8x8 midgame', 8, 8, [(2, 3), (2, 2), (2, 1), (2, 4), (2, 5), (4, 2), (5, 5), (1, 6), (4, 1), (5, 2), (3, 5),
+                           (4, 0), (0, 7), (4, 5), (5, 3), (6, 4), (6, 3), (5, 4), (7, 3), (3, 2), (6, 2), (6, 1),
+                           (7, 0), (5, 1)], 5, 83012),
+    ('19x19 start', 19, 19, [], 4, 244),
+    ('19x19 midgame', 19, 19, [(8, 7), (9, 7), (10, 10), (7, 7), (9, 6), (11, 11), (7, 9), (10, 9), (6, 7), (7, 10),
+                               (7, 11), (9, 5), (12, 12), (7, 6), (11, 9), (6, 10), (6, 9), (8, 12), (9, 4), (10, 7),
+                               (8, 5), (7, 8), (7, 12), (6, 6), (10, 6), (6, 5), (11, 7), (10, 5), (6, 11), (5, 7)],
+     3, 2831),
+]
+
+SEARCH_SIZES = [(7, 9)]
+SEARCH_POSITIONS = 8  # per board size
+SEARCH_PLIES = (10, 30)  # the corpus positions are that many random moves from the start
+SEARCH_DEPTH = 4
+GAMES_SIZE = (7, 9)
+GAMES = 200
+BATCH_GAMES = 4096
+REGRESSION_THRESHOLD = 0.10  # a rate dropping more than that from the baseline is a regression
+MIN_SECONDS = 0.2  # shortest timing, shorter ones are too noisy
+
+
+def position(rows: int, cols: int, moves: list[tuple[int, int]]) -> othello.OthelloGame:
+    """ Returns the game after the given moves, from the starting position """
+    game = othello.OthelloGame(rows, cols, othello.BLACK)
+    for move in moves:
+        game.move(move[0], move[1])
+    return game
+
+
+def perft(game: othello.OthelloGame, depth: int) -> int:
+    """ Counts the positions `depth` plies from the game, through copy_game() and move() like the AIs do.
+        A pass counts as a ply, and a game that ends before `depth` counts as one position """
+    if depth == 0 or game.is_game_over():
+        return 1
+    nodes = 0
+    turn = game.get_turn()
+    for move in game.get_possible_move():
+        child = game.copy_game()
+        child.move(move[0], move[1])
+        if child.get_turn() == turn and not child.is_game_over():  # the opponent has to pass, which takes a ply
+            nodes += 1 if depth == 1 else perft(child, depth - 2)
+        else:
+            nodes += perft(child, depth - 1)
+    return nodes
+
+
+def perft_in_place(game: othello.OthelloGame, depth: int) -> int:
+    """ Same as perft, with make_move() and unmake_move() on a single board """
+    if depth == 0 or game.is_game_over():
+        return 1
+    nodes = 0
+    turn = game.get_turn()
+    for move in game.get_possible_move():
+        record = game.make_move(move[0], move[1])
+        if game.get_turn() == turn and not game.is_game_over():
+            nodes += 1 if depth == 1 else perft_in_place(game, depth - 2)
+        else:
+            nodes += perft_in_place(game, depth - 1)
+        game.unmake_move(record)
+    return nodes
+
+
+def _best_time(function, repeat: int) -> tuple[float, object]:
+    """ Times the function `repeat` times and returns the fastest time and the last result. Fast functions are
+        called again and again for at least MIN_SECONDS in each timing, and their average time counts """
+    best = math.inf
+    for _ in range(repeat):
+        calls = 0
+        start = time.perf_counter()
+        while calls == 0 or time.perf_counter() - start < MIN_SECONDS:
+            result = function()
+            calls += 1
+        best = min(best, (time.perf_counter() - start) / calls)
+    return best, result
+
+
+def bench_perft(repeat: int = 1) -> list[dict]:
+    """ Runs perft (copy and move) and perft_in_place (make/unmake) from each of PERFT_POSITIONS """
+    results = []
+    for name, rows, cols, moves, depth, expected in PERFT_POSITIONS:
+        game = position(rows, cols, moves)
+        seconds, nodes = _best_time(lambda: perft(game, depth), repeat)
+        in_place_seconds, in_place_nodes = _best_time(lambda: perft_in_place(game, depth), repeat)
+        results.append({'name': name, 'depth': depth, 'nodes': nodes, 'expected': expected,
+                        'ok': nodes == expected and in_place_nodes == expected,
+                        'seconds': seconds, 'nodes_per_second': nodes / seconds,
+                        'in_place_seconds': in_place_seconds, 'in_place_nodes_per_second': nodes / in_place_seconds})
+    return results
+
+
+def search_corpus(rows: int, cols: int, count: int = SEARCH_POSITIONS, seed: int = 0) -> list[othello.OthelloGame]:
+    """ Returns `count` midgame positions, each a seeded number of random moves (SEARCH_PLIES) from the start """
+    rng = random.Random(f"corpus {rows}x{cols} {seed}")
+    corpus = []
+    while len(corpus) < count:
+        game = othello.OthelloGame(rows, cols, othello.BLACK)
+        for _ in range(rng.randint(*SEARCH_PLIES)):
+            if game.is_game_over():
+                break
+            move = rng.choice(game.get_possible_move())
+            game.move(move[0], move[1])
+        if not game.is_game_over():
+            corpus.append(game)
+    return corpus
+
+
+def bench_search(depth: int = SEARCH_DEPTH, repeat: int = 1) -> list[dict]:
+    """ Runs Michel_Peck.pvs to a fixed depth on the corpus of each of SEARCH_SIZES """
+    from ai.Michel_Peck import Michel_Peck
+
+    results = []
+    for rows, cols in SEARCH_SIZES:
+        corpus = search_corpus(rows, cols)
+
+        def search() -> tuple[int, list]:
+            nodes = 0
+            moves = []
+            for game in corpus:
+                engine = Michel_Peck()
+                engine.start_search(game, None)
+                engine.root_depth = depth
+                moves.append(engine.pvs(game.copy_game(), depth, -math.inf, math.inf)[1])
+                nodes += engine.nodes
+            return nodes, moves
+
+        seconds, (nodes, moves) = _best_time(search, repeat)
+        results.append({'name': f"{rows}x{cols} depth {depth}", 'positions': len(corpus), 'nodes': nodes,
+                        'moves': moves, 'seconds': seconds, 'nodes_per_second': nodes / seconds})
+    return results
+
+
+def bench_games(games: int = GAMES, repeat: int = 1) -> dict:
+    """ Plays full Random vs Random games, copying the board for each move like the GUI does """
+    from ai.Random import Random
+
+    rows, cols = GAMES_SIZE
+    engine = Random()
+
+    def play() -> int:
+        random.seed(0)
+        moves = 0
+        for _ in range(games):
+            game = othello.OthelloGame(rows, cols, othello.BLACK)
+            while not game.is_game_over():
+                move = engine.next_move(game.copy_game())
+                game.move(move[0], move[1])
+                moves += 1
+        return moves
+
+    seconds, moves = _best_time(play, repeat)
+    return {'name': f"Random vs Random {rows}x{cols}", 'games': games, 'moves': moves, 'seconds': seconds,
+            'games_per_second': games / seconds, 'moves_per_second': moves / seconds}
+
+
+def bench_batch(games: int = BATCH_GAMES, repeat: int = 1) -> dict:
+    """ Plays random games all together with othello_batch """
+    import othello_batch
+
+    rows, cols = GAMES_SIZE
+
+    def play() -> int:
+        return othello_batch.BatchGame(rows, cols, games).play(othello_batch.RandomPolicy(0))
+
+    seconds, moves = _best_time(play, repeat)
+    return {'name': f"batch of {games} random games {rows}x{cols}", 'games': games, 'moves': moves,
+            'seconds': seconds, 'moves_per_second': moves / seconds}
+
+
+def run(repeat: int = 1, search_depth: int = SEARCH_DEPTH, games: int = GAMES) -> dict:
+    """ Runs the whole suite and returns its results """
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'perft': bench_perft(repeat), 'search': bench_search(search_depth, repeat),
+            'games': bench_games(games, repeat), 'batch': bench_batch(repeat=repeat)}
+
+
+def _rates(results: dict) -> dict:
+    """ Returns the throughputs of the results, by name, for the comparison with a baseline """
+    rates = {}
+    for entry in results['perft']:
+        rates[f"perft {entry['name']}"] = entry['nodes_per_second']
+        rates[f"perft {entry['name']} in place"] = entry['in_place_nodes_per_second']
+    for entry in results['search']:
+        rates[f"search {entry['name']}"] = entry['nodes_per_second']
+    rates[results['games']['name']] = results['games']['games_per_second']
+    if 'batch' in results: # not in the results of the older runs
+        rates[results['batch']['name']] = results['batch']['moves_per_second']
+    return rates
+
+
+def compare(results: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> list[str]:
+    """ Returns the regressions of the results against the baseline: wrong perft counts, throughputs that dropped
+        more than `threshold`, and searches that now visit more nodes """
+    regressions = [f"perft {entry['name']}: {entry['nodes']} positions instead of {entry['expected']}"
+                   for entry in results['perft'] if not entry['ok']]
+    rates = _rates(results)
+    for name, old_rate in _rates(baseline).items():
+        if name in rates and rates[name] < old_rate * (1 - threshold):
+            regressions.append(f"{name}: {rates[name]:.0f}/s instead of {old_rate:.0f}/s "
+                               f"({rates[name] / old_rate - 1:+.0%})")
+    old_searches = {entry['name']: entry for entry in baseline.get('search', [])}
+    for entry in results['search']:
+        old = old_searches.get(entry['name'])
+        if old is not None and entry['nodes'] > old['nodes'] * (1 + threshold):
+            regressions.append(f"search {entry['name']}: {entry['nodes']} nodes instead of {old['nodes']}")
+    return regressions
+
+
+def print_results(results: dict, baseline: dict = None, file=sys.stdout) -> None:
+    """ Prints the results, and the change from the baseline when there is one """
+    old_rates = _rates(baseline) if baseline is not None else {}
+    for name, rate in _rates(results).items():
+        change = f"{rate / old_rates[name] - 1:+7.1%}" if name in old_rates else ''
+        print(f"{name:<40}{rate:>14.0f}/s {change}", file=file)
+    for entry in results['perft']:
+        if not entry['ok']:
+            print(f"perft {entry['name']}: WRONG COUNT {entry['nodes']} (expected {entry['expected']})", file=file)
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks the game logic and the AIs.")
+    parser.add_argument('--repeat', type=int, default=3, help="runs of each benchmark, the fastest counts")
+    parser.add_argument('--depth', type=int, default=SEARCH_DEPTH, help="depth of the search benchmark")
+    parser.add_argument('--games', type=int, default=GAMES, help="games of the Random vs Random benchmark")
+    parser.add_argument('--save', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="compare to the results of an earlier run (JSON file from --save)")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="slowdown from the baseline that counts as a regression")
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat, args.depth, args.games)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline['search'] and baseline['search'][0]['name'] != results['search'][0]['name']:
+            print("warning: the baseline was run with another search depth", file=sys.stderr)
+    print_results(results, baseline)
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=1)
+
+    regressions = [f"perft {entry['name']}: {entry['nodes']} positions instead of {entry['expected']}"
+                   for entry in results['perft'] if not entry['ok']]
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
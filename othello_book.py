@@ -0,0 +1,206 @@
+"""
+This file contains the opening book: the best move of every position of the first plies of the game, searched deeply
+once and for all, so that the AIs don't have to think about the opening.
+
+There is one book file per board size, books/book_<rows>x<cols>.bin: a header followed by fixed-size records
+(position key, move, score) sorted by key. The key is the Zobrist key of the canonical image of the position (see
+othello_symmetry), which is the same in every process for a given board size and the same for all the images of the
+position, and the move is the move of the canonical image: a position and its mirrored or turned images share one
+record. The file is memory-mapped and binary-searched, so opening a book reads nothing until the first lookup.
+
+Usage: python othello_book.py --sizes 7x9 8x8 --plies 8 --depth 8 --workers 8
+"""
+
+import argparse
+import mmap
+import os.path
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import othello
+import othello_symmetry
+
+BOOK_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'books')
+MAGIC = b'OTHB'
+VERSION = 2 # 1 had the keys of the positions themselves
+HEADER = struct.Struct('<4sHBBI') # magic, version, rows, cols, number of records
+RECORD = struct.Struct('<QHh') # position key, move (row * cols + col), score
+KEY = struct.Struct('<Q')
+
+DEFAULT_SIZES = [(7, 9)]
+DEFAULT_PLIES = 6 # positions with fewer moves played than this get a book move
+DEFAULT_DEPTH = 6
+
+
+def book_path(rows: int, cols: int) -> str:
+    """ Returns the path of the book file of the board size """
+    return os.path.join(BOOK_FOLDER, f"book_{rows}x{cols}.bin")
+
+
+class OpeningBook:
+    """
+    A book file opened read-only. The records are read straight from the memory-mapped file by probe, nothing is
+    loaded when the book is opened.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.rows, self.cols, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not an opening book of version {VERSION}")
+        if len(self._map) != HEADER.size + self.count * RECORD.size:
+            self._map.close()
+            raise ValueError(f"{path} is truncated")
+
+    def close(self) -> None:
+        self._map.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def probe(self, key: int) -> tuple[tuple[int, int], int] | None:
+        """ Returns the (move, score) of the position with the given key, or None if it isn't in the book """
+        (low, high) = (0, self.count)
+        while low < high:
+            middle = (low + high) // 2
+            middle_key = KEY.unpack_from(self._map, HEADER.size + middle * RECORD.size)[0]
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                (key, move, score) = RECORD.unpack_from(self._map, HEADER.size + middle * RECORD.size)
+                return divmod(move, self.cols), score
+        return None
+
+    def lookup(self, board: othello.OthelloGame) -> tuple[int, int] | None:
+        """ Returns the book move of the board, None if the board isn't in the book. A move that isn't legal on the
+            board (two positions with the same key) is never returned """
+        if (board.get_rows(), board.get_columns()) != (self.rows, self.cols):
+            return None
+        (key, transform) = othello_symmetry.canonical_key(board)
+        entry = self.probe(key)
+        if entry is None:
+            return None
+        move = othello_symmetry.original_move(board, entry[0], transform)
+        if move not in board.get_possible_move():
+            return None
+        return move
+
+
+_books = {} # (rows, cols) -> OpeningBook, None when there's no book for the size
+
+
+def get_book(rows: int, cols: int) -> OpeningBook | None:
+    """ Returns the book of the board size, opened once per process, or None if there isn't any """
+    if (rows, cols) not in _books:
+        path = book_path(rows, cols)
+        _books[(rows, cols)] = OpeningBook(path) if os.path.exists(path) else None
+    return _books[(rows, cols)]
+
+
+def lookup(board: othello.OthelloGame) -> tuple[int, int] | None:
+    """ Returns the book move of the board, None if it isn't in the book of its size (or there is no book) """
+    book = get_book(board.get_rows(), board.get_columns())
+    return book.lookup(board) if book is not None else None
+
+
+def write_book(path: str, rows: int, cols: int, entries: dict[int, tuple[tuple[int, int], int]]) -> None:
+    """ Writes a book file from a dict canonical key -> (move of the canonical image, score). The scores are
+        clamped to 16 bits """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary_path = path + '.tmp' # never leave half a book where get_book would open it
+    with open(temporary_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, rows, cols, len(entries)))
+        for key in sorted(entries):
+            (move, score) = entries[key]
+            file.write(RECORD.pack(key, move[0] * cols + move[1], max(-32768, min(32767, round(score)))))
+    os.replace(temporary_path, path)
+
+
+def opening_positions(rows: int, cols: int, plies: int) -> list[othello.OthelloGame]:
+    """ Returns every position reached after fewer than `plies` moves from the start, once each and once for all
+        its images (othello_symmetry), leaving out the ones with a single legal move (the AIs don't search them
+        anyway) """
+    level = {}
+    start = othello.OthelloGame(rows, cols, othello.BLACK)
+    level[othello_symmetry.canonical_key(start)[0]] = start
+    positions = []
+    for ply in range(plies):
+        positions.extend(game for game in level.values() if len(game.get_possible_move()) > 1)
+        next_level = {}
+        for game in level.values():
+            for move in game.get_possible_move():
+                child = game.copy_game()
+                child.make_move(move[0], move[1])
+                if not child.is_game_over():
+                    next_level.setdefault(othello_symmetry.canonical_key(child)[0], child)
+        level = next_level
+    return positions
+
+
+def _search_position(args: tuple) -> tuple[int, tuple[int, int], int]:
+    """ Runs in a worker process: searches one position and returns its canonical key, the best move on the
+        canonical image and the score """
+    (game, depth) = args
+    from ai.Michel_Peck import Michel_Peck
+    engine = Michel_Peck()
+    engine.USE_BOOK = False # the book being built must not answer for itself
+    move = engine.next_move(game, time_limit=None, max_depth=depth)
+    (key, transform) = othello_symmetry.canonical_key(game)
+    symmetries = othello_symmetry.get_symmetries(game.get_rows(), game.get_columns())
+    return key, symmetries.transform_move(move, transform), engine.score
+
+
+def build_book(rows: int, cols: int, plies: int = DEFAULT_PLIES, depth: int = DEFAULT_DEPTH, workers: int = None,
+               path: str = None, on_progress=None) -> int:
+    """
+    Searches every opening position of the board size with Michel_Peck to `depth` plies, on `workers` processes
+    (all the CPUs by default, 0 or 1 to search them here), and writes the book file.
+
+    :param on_progress: called with (positions done, positions) as the searches finish
+    :return: The number of positions in the book
+    """
+    positions = opening_positions(rows, cols, plies)
+    tasks = [(game, depth) for game in positions]
+    entries = {}
+    if workers is not None and workers <= 1:
+        results = map(_search_position, tasks)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(workers)
+        results = pool.map(_search_position, tasks, chunksize=16)
+    try:
+        for (key, move, score) in results:
+            entries[key] = (move, score)
+            if on_progress is not None:
+                on_progress(len(entries), len(tasks))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    write_book(path or book_path(rows, cols), rows, cols, entries)
+    return len(entries)
+
+
+def main(argv: list[str] = None) -> None:
+    from othello_arena import parse_size
+
+    parser = argparse.ArgumentParser(description="Builds the opening books of Michel_Peck.")
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=DEFAULT_SIZES, help="board sizes, like 7x9 8x8")
+    parser.add_argument('--plies', type=int, default=DEFAULT_PLIES, help="book moves for the positions of the first plies")
+    parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH, help="depth of the search of each position")
+    parser.add_argument('--workers', type=int, default=None, help="processes, all the CPUs by default")
+    args = parser.parse_args(argv)
+
+    for (rows, cols) in args.sizes:
+        start = time.perf_counter()
+        count = build_book(rows, cols, args.plies, args.depth, args.workers,
+                           on_progress=lambda done, total: print(f"\r{rows}x{cols}: {done}/{total}", end='', flush=True))
+        print(f"\r{rows}x{cols}: {count} positions in {time.perf_counter() - start:.1f}s -> {book_path(rows, cols)}")
+
+
+if __name__ == '__main__':
+    main()
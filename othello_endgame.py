@@ -0,0 +1,185 @@
+"""
+This file contains the endgame solver: once few empty cells are left, it searches every line to the end of the game
+and returns the exact final disc margin, instead of a heuristic score.
+
+It works on the two bitboards of the position (see BoardGeometry.legal_moves and BoardGeometry.flips) rather than on
+an OthelloGame, to keep the cost of each node down, and it uses the usual endgame tricks:
+
+- fastest-first: far from the end, the moves leaving the opponent the fewest replies are tried first
+- parity: closer to the end, the moves in the regions (groups of connected empty cells) with an odd number of
+  empty cells are tried first, since the last move of such a region is usually ours
+- the last 4 empty cells are played by looping over them directly, without generating or ordering the moves
+
+The game is scored like OthelloGame does, by the number of discs of each color: the empty cells left when neither
+player can move don't count.
+"""
+
+import math
+import time
+
+import othello
+import othello_search
+
+
+class EndgameSolver:
+    FASTEST_FIRST_EMPTIES = 7 # more empty cells than that: fastest-first ordering, else parity ordering
+
+    SMALL_EMPTIES = 4 # that many empty cells or fewer: loops over the empty cells, no move generation
+
+    CHECK_TIME_EVERY = 256 # nodes between two looks at the clock, a few milliseconds
+
+    def __init__(self, geometry: othello.BoardGeometry, deadline: float = math.inf, cancel_event=None):
+        """
+        :param geometry: the geometry of the board size of the positions to solve
+        :type geometry: othello.BoardGeometry
+        :param deadline: time.perf_counter() at which the solve gives up with a SearchTimeout
+        :type deadline: float
+        :param cancel_event: a threading.Event that also makes the solve give up when it is set
+        """
+        self.geometry = geometry
+        self.deadline = deadline
+        self.cancel_event = cancel_event
+        self.nodes = 0
+        self.next_check = self.CHECK_TIME_EVERY # nodes at the next look at the clock, every search function counts nodes
+
+    def solve(self, game: othello.OthelloGame, alpha: int = None, beta: int = None) -> tuple[int, tuple[int, int]]:
+        """
+        Solves the position for the player whose turn it is. Within the (alpha, beta) window, which defaults to
+        every possible margin, the margin is exact, outside of it it is only a bound: a window of (-1, 1) is
+        enough to tell a win from a draw from a loss, and faster.
+
+        :param game: the position, with at least one legal move
+        :type game: othello.OthelloGame
+        :return: The final disc margin (own discs - opponent discs) with perfect play, and the best move
+        """
+        size = self.geometry.size
+        alpha = -size - 1 if alpha is None else alpha
+        beta = size + 1 if beta is None else beta
+        turn = game.get_turn()
+        own, opp = game.get_bits(turn), game.get_bits(othello.OPPOSITE[turn])
+        self.nodes += 1
+
+        best_score = -math.inf
+        best_bit = None
+        for bit in self._ordered_moves(own, opp, self.geometry.legal_moves(own, opp)):
+            flips = self.geometry.flips(bit, own, opp)
+            score = -self._search(opp ^ flips, own | bit | flips, -beta, -alpha)
+            if score > best_score:
+                (best_score, best_bit) = (score, bit)
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return best_score, divmod(best_bit.bit_length() - 1, self.geometry.cols)
+
+    def _search(self, own: int, opp: int, alpha: int, beta: int) -> int:
+        """ Returns the final margin of the `own` player, who is to move, fail-soft within (alpha, beta) """
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self._check_time()
+
+        empties = self.geometry.full & ~(own | opp)
+        if empties.bit_count() <= self.SMALL_EMPTIES:
+            return self._search_small(own, opp, empties, alpha, beta, False)
+
+        moves = self.geometry.legal_moves(own, opp)
+        if not moves:
+            if not self.geometry.legal_moves(opp, own): # nobody can move, the game is over
+                return own.bit_count() - opp.bit_count()
+            return -self._search(opp, own, -beta, -alpha)
+
+        best_score = -math.inf
+        for bit in self._ordered_moves(own, opp, moves):
+            flips = self.geometry.flips(bit, own, opp)
+            score = -self._search(opp ^ flips, own | bit | flips, -beta, -alpha)
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return best_score
+
+    def _check_time(self) -> None:
+        """ Raises SearchTimeout past the deadline or once cancel_event is set, and sets the next look at the clock """
+        self.next_check = self.nodes + self.CHECK_TIME_EVERY
+        if time.perf_counter() > self.deadline or (self.cancel_event is not None and self.cancel_event.is_set()):
+            raise othello_search.SearchTimeout()
+
+    def _search_small(self, own: int, opp: int, empties: int, alpha: int, beta: int, passed: bool) -> int:
+        """ _search for the last few empty cells: each empty cell is tried in turn, it is a legal move if it
+            flips something. `passed` tells that the opponent just passed """
+        if empties & (empties - 1) == 0: # one empty cell left, or none
+            return self._search_last(own, opp, empties)
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self._check_time()
+
+        best_score = -math.inf
+        cells = empties
+        while cells:
+            bit = cells & -cells
+            cells ^= bit
+            flips = self.geometry.flips(bit, own, opp)
+            if not flips:
+                continue
+            score = -self._search_small(opp ^ flips, own | bit | flips, empties ^ bit, -beta, -alpha, False)
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        if best_score == -math.inf: # no legal move
+            if passed: # nobody can move, the game is over
+                return own.bit_count() - opp.bit_count()
+            return -self._search_small(opp, own, empties, -beta, -alpha, True)
+        return best_score
+
+    def _search_last(self, own: int, opp: int, bit: int) -> int:
+        """ Final margin when at most one empty cell is left: we play it if we can, else the opponent does if it can """
+        self.nodes += 1
+        margin = own.bit_count() - opp.bit_count()
+        if not bit:
+            return margin
+        flips = self.geometry.flips(bit, own, opp)
+        if flips:
+            return margin + 2 * flips.bit_count() + 1
+        flips = self.geometry.flips(bit, opp, own)
+        if flips:
+            return margin - 2 * flips.bit_count() - 1
+        return margin
+
+    def _ordered_moves(self, own: int, opp: int, moves: int) -> list[int]:
+        """ Returns the bits of the moves, best first: fastest-first far from the end, odd regions first near it """
+        empties = self.geometry.full & ~(own | opp)
+        odd = self._odd_regions(empties)
+        bits = []
+        while moves:
+            bit = moves & -moves
+            moves ^= bit
+            bits.append(bit)
+        if empties.bit_count() > self.FASTEST_FIRST_EMPTIES:
+            def replies(bit: int) -> tuple[int, bool]:
+                flips = self.geometry.flips(bit, own, opp)
+                return self.geometry.legal_moves(opp ^ flips, own | bit | flips).bit_count(), not bit & odd
+            bits.sort(key=replies)
+        else:
+            bits.sort(key=lambda bit: not bit & odd)
+        return bits
+
+    def _odd_regions(self, empties: int) -> int:
+        """ Returns the empty cells that are in a region (cells connected in any of the 8 directions) of an odd
+            number of empty cells """
+        odd = 0
+        while empties:
+            region = empties & -empties
+            while True:
+                grown = region | (self.geometry.dilate(region) & empties)
+                if grown == region:
+                    break
+                region = grown
+            empties &= ~region
+            if region.bit_count() % 2:
+                odd |= region
+        return odd
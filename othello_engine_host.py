@@ -0,0 +1,290 @@
+"""
+This file contains the engine host: each AI runs in a worker process of its own, where its module is imported and
+its class instantiated once, and is asked for its moves through a pipe. The worker stays up from game to game, so a
+new game costs a new instance of the class, not a new process and a new import.
+
+Every move has a wall-clock limit: an AI that hasn't answered in time (hung, or much slower than it was asked to be)
+gets its worker killed and restarted, and the move raises EngineTimeout, instead of freezing the program that asked.
+
+The messages of the pipe are packed bytes, not pickles:
+
+- MOVE request: REQUEST (command, sequence number, rows, cols, turn, time limit or NaN for none), then the black and
+  the white bitboards, (rows * cols + 7) // 8 bytes each, little-endian
+- NEW_GAME request: REQUEST with the command, the sequence number and the options (PONDER) in place of the turn
+- QUIT request: REQUEST with only the command filled
+- reply: REPLY (status, sequence number of the request, row, col), followed by the error text when the AI raised
+
+A request that was given up on (cancelled or timed out) still gets its reply later, which the sequence number tells
+apart from the reply of the next request.
+
+The GUI plays its AIs through an EnginePool; othello_arena does with --hosted.
+"""
+
+import inspect
+import math
+import multiprocessing
+import struct
+import threading
+import time
+import traceback
+
+import othello
+
+REQUEST = struct.Struct('<BIBBBd') # command, sequence number, rows, cols, turn, time limit
+REPLY = struct.Struct('<BIhh') # status, sequence number, row, col
+
+MOVE, NEW_GAME, QUIT = 1, 2, 3 # commands
+OK, ERROR = 0, 1 # statuses
+PONDER = 1 # option of NEW_GAME: the AI thinks on the opponent's time, if it can (ponder attribute)
+
+TURNS = {othello.BLACK: 0, othello.WHITE: 1}
+TURN_COLORS = {value: color for color, value in TURNS.items()}
+
+MOVE_TIME_LIMIT = 10.0 # seconds an AI can take for a move when it isn't given a time limit
+GRACE_TIME = 1.0 # seconds on top of the time limit given to the AI, for the pipe and for the AI to stop searching
+START_TIME_LIMIT = 30.0 # seconds a worker can take to start and create a new instance of its AI
+
+
+class EngineError(Exception):
+    """ The AI raised, or its worker process died """
+
+
+class EngineTimeout(EngineError):
+    """ The AI didn't answer in time, its worker process was restarted """
+
+
+def encode_board(board: othello.OthelloGame, sequence: int, time_limit: float = None) -> bytes:
+    """ Returns the MOVE request for the board """
+    rows, cols = board.get_rows(), board.get_columns()
+    size = (rows * cols + 7) // 8
+    return b''.join((REQUEST.pack(MOVE, sequence, rows, cols, TURNS[board.get_turn()],
+                                  math.nan if time_limit is None else time_limit),
+                     board.get_bits(othello.BLACK).to_bytes(size, 'little'),
+                     board.get_bits(othello.WHITE).to_bytes(size, 'little')))
+
+
+def decode_board(data: bytes) -> tuple[othello.OthelloGame, float]:
+    """ Returns the board and the time limit (None for none) of a MOVE request """
+    command, sequence, rows, cols, turn, time_limit = REQUEST.unpack_from(data, 0)
+    size = (rows * cols + 7) // 8
+    board = othello.OthelloGame(rows, cols, TURN_COLORS[turn])
+    board.set_bits(int.from_bytes(data[REQUEST.size:REQUEST.size + size], 'little'),
+                   int.from_bytes(data[REQUEST.size + size:REQUEST.size + 2 * size], 'little'))
+    return board, None if math.isnan(time_limit) else time_limit
+
+
+def _new_engine(name: str, engine, cancel_event, options: int):
+    """ Closes the previous instance of the AI, if any, and returns a new one listening to cancel_event, with the
+        NEW_GAME options """
+    from othello_arena import load_engine
+
+    if hasattr(engine, 'close'):
+        engine.close()
+    engine = load_engine(name)
+    if hasattr(engine, 'cancel_event'):
+        engine.cancel_event = cancel_event
+    if options & PONDER and hasattr(engine, 'ponder'):
+        engine.ponder = True
+    return engine
+
+
+def _serve(connection, name: str, cancel_event, game_options: int = 0) -> None:
+    """ Main loop of a worker process: answers the requests of the connection with the AI called `name`.
+        game_options are the NEW_GAME options of the game in progress, for a worker restarted in the middle of it """
+    engine = None
+    while True:
+        try:
+            data = connection.recv_bytes()
+        except (EOFError, OSError): # the host is gone
+            break
+        command, sequence, rows, cols, options = REQUEST.unpack_from(data, 0)[:5]
+        if command == QUIT:
+            break
+        try:
+            if command == NEW_GAME:
+                game_options = options
+            if command == NEW_GAME or engine is None:
+                engine = _new_engine(name, engine, cancel_event, game_options)
+            if command == MOVE:
+                board, time_limit = decode_board(data)
+                if time_limit is not None and 'time_limit' in inspect.signature(engine.next_move).parameters:
+                    move = engine.next_move(board, time_limit=time_limit)
+                else:
+                    move = engine.next_move(board)
+            else:
+                move = (-1, -1)
+            reply = REPLY.pack(OK, sequence, move[0], move[1])
+        except Exception:
+            reply = REPLY.pack(ERROR, sequence, -1, -1) + traceback.format_exc().encode()
+        connection.send_bytes(reply)
+    if hasattr(engine, 'close'):
+        engine.close()
+
+
+class EngineHost:
+    """
+    One AI in its worker process. Its methods can be called from any thread, one call at a time (they wait for each
+    other), except cancel which never waits.
+    """
+
+    def __init__(self, name: str, move_time_limit: float = MOVE_TIME_LIMIT):
+        """
+        :param name: the AI, ai.<name>.<name> like in the GUI and the arena
+        :type name: str
+        :param move_time_limit: seconds a move can take when the AI isn't given a time limit
+        :type move_time_limit: float
+        """
+        self.name = name
+        self.move_time_limit = move_time_limit
+        self.in_use = False # lent by an EnginePool
+        self.restarts = 0
+        self._context = multiprocessing.get_context('spawn') # nothing of the caller (a GUI, threads...) in the worker
+        self._cancel_event = self._context.Event()
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._options = 0 # of the last NEW_GAME, given again to a restarted worker
+        self._process = None
+        self._closed = False # by close, from any thread: the worker isn't restarted any more
+        self._start()
+
+    def __str__(self) -> str:
+        return self.name
+
+    def _start(self) -> None:
+        """ Starts the worker process, it imports the AI while the caller goes on """
+        self._started = False # until the first reply, the AI may still be importing
+        (self._connection, worker_connection) = self._context.Pipe()
+        self._process = self._context.Process(target=_serve, name=f"engine-{self.name}", daemon=True,
+                                              args=(worker_connection, self.name, self._cancel_event, self._options))
+        self._process.start()
+        worker_connection.close()
+
+    def _restart(self) -> None:
+        """ Kills the worker process and starts a new one """
+        self._process.kill()
+        self._process.join()
+        self._connection.close()
+        self.restarts += 1
+        self._start()
+
+    def _request(self, data: bytes, sequence: int, time_limit: float) -> tuple[int, int]:
+        """ Sends a request and returns the (row, col) of its reply, restarting the worker if it doesn't come in
+            time_limit seconds (unless the host was closed meanwhile) """
+        if self._closed:
+            raise EngineError(f"{self.name} is closed")
+        deadline = time.perf_counter() + time_limit
+        try:
+            self._connection.send_bytes(data)
+            while True:
+                if not self._connection.poll(max(0.0, deadline - time.perf_counter())):
+                    if self._closed:
+                        raise EngineError(f"{self.name} was closed")
+                    self._restart()
+                    raise EngineTimeout(f"{self.name} didn't answer in {time_limit:.1f}s, restarted")
+                reply = self._connection.recv_bytes()
+                status, reply_sequence, row, col = REPLY.unpack_from(reply, 0)
+                self._started = True
+                if reply_sequence == sequence: # else the late reply of a request given up on
+                    break
+        except (EOFError, OSError) as error:
+            if self._closed: # close() stopped the worker under us, it stays stopped
+                raise EngineError(f"{self.name} was closed") from error
+            self._restart()
+            raise EngineError(f"the worker of {self.name} died, restarted") from error
+        if status == ERROR:
+            raise EngineError(f"{self.name} raised:\n{reply[REPLY.size:].decode()}")
+        return row, col
+
+    @property
+    def busy(self) -> bool:
+        """ Whether a call is waiting for the worker """
+        return self._lock.locked()
+
+    def new_game(self, ponder: bool = False) -> None:
+        """ Replaces the AI by a new instance, for a new game. With `ponder`, the AI thinks on the opponent's time
+            if it can """
+        with self._lock:
+            self._sequence += 1
+            self._options = PONDER if ponder else 0
+            self._request(REQUEST.pack(NEW_GAME, self._sequence, 0, 0, self._options, math.nan),
+                          self._sequence, START_TIME_LIMIT)
+
+    def next_move(self, board: othello.OthelloGame, time_limit: float = None) -> tuple[int, int]:
+        """
+        Returns the move of the AI on the board, like its next_move.
+
+        :param board: the board
+        :type board: othello.OthelloGame
+        :param time_limit: seconds the AI can think, given to it if its next_move takes a time limit. It has
+        GRACE_TIME more to answer, move_time_limit without a time limit
+        :type time_limit: float
+        :return: The move of the AI
+        :raises EngineTimeout: the AI didn't answer in time
+        :raises EngineError: the AI raised, or its worker died
+        """
+        with self._lock:
+            self._cancel_event.clear()
+            self._sequence += 1
+            limit = self.move_time_limit if time_limit is None else time_limit + GRACE_TIME
+            if not self._started: # the worker may still be starting
+                limit += START_TIME_LIMIT
+            return self._request(encode_board(board, self._sequence, time_limit), self._sequence, limit)
+
+    def cancel(self) -> None:
+        """ Asks the AI to answer its current move at once, for the AIs that listen to a cancel_event. The answer
+            is returned by next_move as usual """
+        self._cancel_event.set()
+
+    def close(self) -> None:
+        """ Stops the worker process. A call waiting for it raises EngineError """
+        self._closed = True
+        self.cancel()
+        try:
+            self._connection.send_bytes(REQUEST.pack(QUIT, 0, 0, 0, 0, math.nan))
+        except (EOFError, OSError):
+            pass
+        self._process.join(GRACE_TIME)
+        if self._process.is_alive():
+            self._process.kill()
+            self._process.join()
+        self._connection.close()
+
+
+class EnginePool:
+    """
+    The warm hosts of the AIs, lent for a game at a time: acquire gives a host of the AI that isn't in use, a new one
+    if they all are, and release gives it back.
+    """
+
+    def __init__(self, move_time_limit: float = MOVE_TIME_LIMIT):
+        self.move_time_limit = move_time_limit
+        self._hosts = {} # name -> its hosts
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def acquire(self, name: str, ponder: bool = False) -> EngineHost:
+        """ Returns a host of the AI ready for a new game (see EngineHost.new_game) """
+        with self._lock:
+            if self._closed:
+                raise EngineError("the engine pool is closed")
+            host = next((host for host in self._hosts.get(name, []) if not host.in_use and not host.busy), None)
+            if host is None:
+                host = EngineHost(name, self.move_time_limit)
+                self._hosts.setdefault(name, []).append(host)
+            host.in_use = True
+        host.new_game(ponder)
+        return host
+
+    def release(self, host: EngineHost) -> None:
+        """ Gives a host back, its AI stops thinking at once if it can """
+        host.cancel()
+        host.in_use = False
+
+    def close(self) -> None:
+        """ Stops every worker process, acquire raises EngineError from then on """
+        with self._lock:
+            self._closed = True
+            for hosts in self._hosts.values():
+                for host in hosts:
+                    host.close()
+            self._hosts.clear()
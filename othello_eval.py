@@ -0,0 +1,133 @@
+"""
+This file contains the positional evaluation of the AIs: the weight of each cell, for any board size, and the sum of
+the weights of one player's discs minus the other's.
+
+The weights come from weights/weights_<rows>x<cols>.bin when there is such a file (see othello_train, which tunes
+them), else they are generated from the distance of each cell to the edges.
+
+A position is scored from its two bitboards. One at a time, the cells are grouped by weight (a mask per weight
+value), which makes a score a few bit counts. The leaves of a search are scored in batches: with NumPy, the bits of
+the whole batch are unpacked into a matrix and multiplied by the weights at once, without NumPy each position is
+scored with the masks.
+"""
+
+import array
+import os.path
+import struct
+import sys
+
+try:
+    import numpy
+except ImportError: # NumPy is optional, the masks do the job without it
+    numpy = None
+
+# Weight of a cell by its distance to the nearest top/bottom edge (row) and to the nearest left/right edge (column),
+# anything 3 or more cells from an edge weighing as if it was 3 away. On a 7x9 board, these are the weights of
+# https://courses.cs.washington.edu/courses/cse573/04au/Project/mini1/O-Thell-Us/Othellus.pdf modified to our needs
+EDGE_WEIGHTS = (
+    (100, -10, 11, 6),
+    (-10, -20, 1, 2),
+    (10, 1, 5, 4),
+    (6, 2, 4, 2),
+)
+
+WEIGHT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'weights')
+MAGIC = b'OTHW'
+VERSION = 1
+HEADER = struct.Struct('<4sHBB') # magic, version, rows, cols, followed by rows * cols int16 weights, row by row
+
+NUMPY_MIN_BATCH = 8 # smaller batches are scored faster with the masks than by setting NumPy up
+
+
+def generate_weights(rows: int, cols: int) -> tuple[tuple[int, ...], ...]:
+    """ Returns the weight of each cell of a board of the given size, row by row """
+    depth = len(EDGE_WEIGHTS) - 1
+    return tuple(tuple(EDGE_WEIGHTS[min(row, rows - 1 - row, depth)][min(col, cols - 1 - col, depth)]
+                       for col in range(cols))
+                 for row in range(rows))
+
+
+def weights_path(rows: int, cols: int) -> str:
+    """ Returns the path of the weight file of the board size """
+    return os.path.join(WEIGHT_FOLDER, f"weights_{rows}x{cols}.bin")
+
+
+def save_weights(path: str, weights: tuple[tuple[int, ...], ...]) -> None:
+    """ Writes the weight of each cell, row by row """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    values = array.array('h', (weight for line in weights for weight in line))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(weights), len(weights[0])))
+        file.write(values.tobytes())
+    os.replace(temporary_path, path)
+
+
+def load_weights(path: str) -> tuple[tuple[int, ...], ...]:
+    """ Reads a weight file, returns the weight of each cell row by row """
+    with open(path, 'rb') as file:
+        data = file.read()
+    magic, version, rows, cols = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION or len(data) != HEADER.size + 2 * rows * cols:
+        raise ValueError(f"{path} is not a weight file of version {VERSION}")
+    values = array.array('h')
+    values.frombytes(data[HEADER.size:])
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return tuple(tuple(values[row * cols:(row + 1) * cols]) for row in range(rows))
+
+
+class PositionalEvaluator:
+    """ Scores the positions of one board size with its weight table """
+
+    def __init__(self, rows: int, cols: int, weights: tuple[tuple[int, ...], ...] = None):
+        """
+        :param weights: the weight of each cell, row by row, generate_weights(rows, cols) by default
+        """
+        self.rows = rows
+        self.cols = cols
+        self.weights = weights if weights is not None else generate_weights(rows, cols)
+        masks = {}
+        for row in range(rows):
+            for col in range(cols):
+                masks[self.weights[row][col]] = masks.get(self.weights[row][col], 0) | 1 << (row * cols + col)
+        self.classes = tuple((weight, mask) for weight, mask in masks.items() if weight)
+        self._bytes = (rows * cols + 7) // 8
+        if numpy is not None:
+            self._vector = numpy.array([weight for line in self.weights for weight in line]
+                                       + [0] * (8 * self._bytes - rows * cols), dtype=numpy.int64)
+
+    def evaluate(self, own: int, opp: int) -> int:
+        """ Returns the sum of the weights of the `own` discs minus the sum of the weights of the `opp` discs """
+        score = 0
+        for weight, mask in self.classes:
+            score += weight * ((own & mask).bit_count() - (opp & mask).bit_count())
+        return score
+
+    def evaluate_batch(self, positions: list[tuple[int, int]]) -> list[int]:
+        """ Returns the evaluate() of each (own, opp) position """
+        if numpy is None or len(positions) < NUMPY_MIN_BATCH:
+            return [self.evaluate(own, opp) for own, opp in positions]
+        size = self._bytes
+        own = numpy.frombuffer(b''.join(bits.to_bytes(size, 'little') for bits, _ in positions), dtype=numpy.uint8)
+        opp = numpy.frombuffer(b''.join(bits.to_bytes(size, 'little') for _, bits in positions), dtype=numpy.uint8)
+        cells = (numpy.unpackbits(own, bitorder='little').astype(numpy.int64)
+                 - numpy.unpackbits(opp, bitorder='little')).reshape(len(positions), -1)
+        return (cells @ self._vector).tolist()
+
+
+_evaluators = {}
+
+
+def get_evaluator(rows: int, cols: int) -> PositionalEvaluator:
+    """ Returns the (cached) evaluator of the board size, with the weights of its file if there is one """
+    evaluator = _evaluators.get((rows, cols))
+    if evaluator is None:
+        path = weights_path(rows, cols)
+        weights = load_weights(path) if os.path.exists(path) else None
+        if weights is not None and (len(weights), len(weights[0])) != (rows, cols):
+            raise ValueError(f"{path} holds the weights of a {len(weights)}x{len(weights[0])} board")
+        evaluator = _evaluators[(rows, cols)] = PositionalEvaluator(rows, cols, weights)
+    return evaluator
@@ -1,9 +1,13 @@
 ''' This is the main file for the Othello game. It creates the game and the GUI and starts the game.
 '''
 
-import importlib
 import othello
+import othello_engine_host
 import othello_models
+import queue
+import random
+import sys
+import threading
 import tkinter
 
 # Default / Initial Game Settings
@@ -15,6 +19,7 @@ BACKGROUND_COLOR = othello_models.BACKGROUND_COLOR
 GAME_HEIGHT = 400
 GAME_WIDTH = 400
 WAITING_TIME = 400 # adding a extra time in ms to see better the development
+AI_POLL_TIME = 50 # ms between two looks at whether the AI thinking in the background has found its move
 
 class OthelloGUI:
     def __init__(self):
@@ -25,6 +30,9 @@ class OthelloGUI:
         self._white_name = "Human"
         self._white_ai = None
         self._black_ai = None
+        self._cancel_event = threading.Event() # set to stop the AI thinking for this game, a new one for each game
+        self._thinking = False
+        self._engines = othello_engine_host.EnginePool() # each AI in a worker process, loaded once for every game
 
         # Create my othello gamestate here (drawn from the original othello game code)
         self._game_state = othello.OthelloGame(self._rows, self._columns,
@@ -50,8 +58,9 @@ class OthelloGUI:
         self._game_menu.add_command(label='New Game', command=self._new_game)
         self._game_menu.add_command(label='Game Settings', command=self._configure_game_settings)
         self._game_menu.add_separator()
-        self._game_menu.add_command(label='Exit', command=self._root_window.destroy)
+        self._game_menu.add_command(label='Exit', command=self._on_close)
         self._menu_bar.add_cascade(label='Game', menu=self._game_menu)
+        self._root_window.protocol('WM_DELETE_WINDOW', self._on_close)
 
         # Layout all the widgets here using grid layout
         self._root_window.config(menu=self._menu_bar)
@@ -87,13 +96,24 @@ class OthelloGUI:
             self._columns = dialog.get_columns()
             self._black_name = dialog.get_black_name()
             self._white_name = dialog.get_white_name()
-            self._black_ai = None
-            self._white_ai = None
             # Create a new game with these settings now
             self._new_game()
 
+    def _on_close(self) -> None:
+        ''' Stops the AIs and closes the window '''
+        self._cancel_event.set()
+        self._engines.close()
+        self._root_window.destroy()
+
     def _new_game(self) -> None:
         ''' Creates a new game with current _game_state settings '''
+        self._cancel_event.set() # an AI may still be thinking about the last game
+        self._cancel_event = threading.Event()
+        for ai in (self._black_ai, self._white_ai):
+            if ai is not None:
+                self._engines.release(ai)
+        self._black_ai = self._white_ai = None
+        self._thinking = False
         self._game_state = othello.OthelloGame(self._rows, self._columns,
                                                othello.BLACK)
         self._board.new_game_settings(self._game_state)
@@ -103,10 +123,50 @@ class OthelloGUI:
         self._black_score.update_score(self._game_state)
         self._white_score.update_score(self._game_state)
         self._player_turn.update_turn(self._game_state.get_turn())
-        if self._white_name != "Human": # import the ai module if not human
-            self._white_ai = getattr(importlib.import_module(f"ai.{self._white_name}"), f"{self._white_name}")()
-        if self._black_name != "Human": # imports the ai module if not human
-            self._black_ai = getattr(importlib.import_module(f"ai.{self._black_name}"), f"{self._black_name}")()
+        if self._black_name != "Human" or self._white_name != "Human":
+            # their workers may have to start, which takes seconds: in the background, like their moves
+            self._player_turn.display_starting()
+            result = queue.Queue(maxsize=1)
+            threading.Thread(target=self._acquire_ais, args=(self._black_name, self._white_name, result),
+                             daemon=True).start()
+            self._root_window.after(AI_POLL_TIME, self._poll_acquire, result, self._cancel_event)
+
+    def _acquire_ais(self, black_name: str, white_name: str, result: queue.Queue) -> None:
+        ''' Runs in a background thread: puts the (black, white) hosts of the AIs of a new game in result (None for
+            a human), or the player whose AI couldn't start and the exception it raised '''
+        hosts = []
+        try:
+            # the AIs that can, think while the human does
+            for player, name, opponent in ((othello.BLACK, black_name, white_name), (othello.WHITE, white_name, black_name)):
+                hosts.append(self._engines.acquire(name, ponder=opponent == "Human") if name != "Human" else None)
+            result.put((tuple(hosts), None))
+        except Exception as error:
+            for host in hosts:
+                if host is not None:
+                    self._engines.release(host)
+            result.put((None, (player, error)))
+
+    def _poll_acquire(self, result: queue.Queue, cancel_event: threading.Event) -> None:
+        ''' Gives the game its AIs once _acquire_ais has them, and lets the one to move play. The AIs of an earlier
+            game are given back '''
+        try:
+            hosts, error = result.get_nowait()
+        except queue.Empty:
+            self._root_window.after(AI_POLL_TIME, self._poll_acquire, result, cancel_event)
+            return
+        if cancel_event is not self._cancel_event:
+            for host in hosts or ():
+                if host is not None:
+                    self._engines.release(host)
+            return
+        if error is not None:
+            (player, error) = error
+            print(f"the game is over, {error}", file=sys.stderr)
+            self._player_turn.display_ai_error(player)
+            return
+        (self._black_ai, self._white_ai) = hosts
+        if not self._game_state.is_game_over():
+            self._player_turn.update_turn(self._game_state.get_turn()) # a human may have played meanwhile
             self._play_ai()
 
     def _on_board_clicked(self, event: tkinter.Event) -> None:
@@ -134,7 +194,7 @@ class OthelloGUI:
                 self._player_turn.display_winner(self._game_state.return_winner())
             else:
                 self._player_turn.switch_turn(self._game_state)
-                self._root_window.after(WAITING_TIME, self._play_ai)
+                self._root_window.after(WAITING_TIME, self._play_ai, self._cancel_event)
                 # self._play_ai()
 
         except othello.InvalidMoveException:
@@ -161,16 +221,51 @@ class OthelloGUI:
 
     def _on_board_resized(self, event: tkinter.Event) -> None:
         ''' Called whenever the canvas is resized '''
-        self._board.redraw_board()
+        self._board.schedule_layout()
+
+    def _play_ai(self, cancel_event: threading.Event = None):
+        ''' Starts the AI whose turn it is thinking in a background thread, so the window stays responsive.
+            Its move is played by _poll_ai. cancel_event is the one of the game the call was scheduled in '''
+        if cancel_event is not None and cancel_event is not self._cancel_event: # scheduled during an earlier game
+            return
+        if self._thinking:
+            return
+        turn = self._game_state.get_turn()
+        ai = self._black_ai if turn == othello.BLACK else self._white_ai
+        if ai is None:
+            return
+        self._thinking = True
+        self._player_turn.display_thinking(turn)
+        result = queue.Queue(maxsize=1)
+        threading.Thread(target=self._think, args=(ai, self._game_state.copy_game(), result), daemon=True).start()
+        self._root_window.after(AI_POLL_TIME, self._poll_ai, result, self._cancel_event)
 
-    def _play_ai(self):
-        ''' Plays an AI move '''
-        if self._game_state.get_turn() == othello.BLACK and self._black_ai is not None:
-            move = self._black_ai.next_move(self._game_state.copy_game())
-            self._play(move[0], move[1])
-        elif self._game_state.get_turn() == othello.WHITE and self._white_ai is not None:
-            move = self._white_ai.next_move(self._game_state.copy_game())
-            self._play(move[0], move[1])
+    def _think(self, ai, game_state: othello.OthelloGame, result: queue.Queue) -> None:
+        ''' Runs in the AI thread: puts the AI's move, or the exception it raised, in result '''
+        try:
+            result.put((ai.next_move(game_state), None))
+        except Exception as error:
+            result.put((None, error))
+
+    def _poll_ai(self, result: queue.Queue, cancel_event: threading.Event) -> None:
+        ''' Plays the move of the AI thread once it has found it. Moves of an earlier game are thrown away, an AI
+            that fails ends the game '''
+        if cancel_event is not self._cancel_event:
+            return
+        try:
+            move, error = result.get_nowait()
+        except queue.Empty:
+            self._root_window.after(AI_POLL_TIME, self._poll_ai, result, cancel_event)
+            return
+        self._thinking = False
+        if isinstance(error, othello_engine_host.EngineTimeout): # its worker was restarted, the game goes on
+            print(f"{error}, playing a random move instead", file=sys.stderr)
+            move = random.choice(self._game_state.get_possible_move())
+        elif error is not None: # raising here would only reach Tk, with the game stuck on a thinking AI
+            print(f"the game is over, {error}", file=sys.stderr)
+            self._player_turn.display_ai_error(self._game_state.get_turn())
+            return
+        self._play(move[0], move[1])
 
 
 if __name__ == '__main__':
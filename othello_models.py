@@ -17,6 +17,11 @@ PLAYERS = {othello.BLACK: 'Black', othello.WHITE: 'White'}
 
 
 class GameBoard:
+    """
+    The board canvas. It keeps one line item per grid line and one oval item per cell, hidden while the cell is
+    empty: a move only recolours the cells that changed, and a resize only moves the items.
+    """
+
     def __init__(self, game_state: othello.OthelloGame, game_width: float,
                  game_height: float, root_window) -> None:
         # Initialize the game board's settings here
@@ -27,47 +32,84 @@ class GameBoard:
                                      width=game_width,
                                      height=game_height,
                                      background=GAME_COLOR)
+        self._width = float(game_width) # canvas size, only measured again on <Configure>
+        self._height = float(game_height)
+        self._lines = [] # canvas items of the horizontal then vertical lines
+        self._cells = [] # canvas item of each cell, row by row
+        self._drawn_bits = (0, 0) # (black, white) bitboards the ovals show
+        self._pending_layout = None # after() id of the coalesced relayout of a burst of resize events
 
     def new_game_settings(self, game_state) -> None:
         """ The game board's new game settings is now changed accordingly to
             the specified game state """
         self._game_state = game_state
-        self._rows = self._game_state.get_rows()
-        self._cols = self._game_state.get_columns()
+        if (self._rows, self._cols) != (game_state.get_rows(), game_state.get_columns()):
+            self._rows = self._game_state.get_rows()
+            self._cols = self._game_state.get_columns()
+            self._board.delete(tkinter.ALL)
+            self._lines = []
+            self._cells = []
 
     def redraw_board(self) -> None:
-        """ Redraws the board """
-        self._board.delete(tkinter.ALL)
-        self._redraw_lines()
-        self._redraw_cells()
-
-    def _redraw_lines(self) -> None:
-        """ Redraws the board's lines """
-        row_multiplier = float(self._board.winfo_height()) / self._rows
-        col_multiplier = float(self._board.winfo_width()) / self._cols
-
-        # Draw the horizontal lines first
+        """ Redraws the board: the cells that changed since the last redraw """
+        if not self._cells:
+            self._create_items()
+        black_bits = self._game_state.get_bits(othello.BLACK)
+        white_bits = self._game_state.get_bits(othello.WHITE)
+        changed = (black_bits ^ self._drawn_bits[0]) | (white_bits ^ self._drawn_bits[1])
+        while changed:
+            low = changed & -changed
+            changed ^= low
+            item = self._cells[low.bit_length() - 1]
+            if black_bits & low:
+                self._board.itemconfigure(item, fill=PLAYERS[othello.BLACK], state=tkinter.NORMAL)
+            elif white_bits & low:
+                self._board.itemconfigure(item, fill=PLAYERS[othello.WHITE], state=tkinter.NORMAL)
+            else:
+                self._board.itemconfigure(item, state=tkinter.HIDDEN)
+        self._drawn_bits = (black_bits, white_bits)
+
+    def schedule_layout(self, delay: int = 50) -> None:
+        """ Called on <Configure>: measures the canvas and moves the items `delay` ms after the last of a burst of
+            resize events, instead of once per event """
+        if self._pending_layout is not None:
+            self._board.after_cancel(self._pending_layout)
+        self._pending_layout = self._board.after(delay, self._layout)
+
+    def _layout(self) -> None:
+        """ Measures the canvas and moves the lines and the cells to fit it """
+        self._pending_layout = None
+        self._width = float(self._board.winfo_width())
+        self._height = float(self._board.winfo_height())
+        if not self._cells:
+            self._create_items()
+            self.redraw_board()
+            return
         for row in range(1, self._rows):
-            self._board.create_line(0, row * row_multiplier, self.get_board_width(), row * row_multiplier)
-
-        # Draw the column lines next
+            self._board.coords(self._lines[row - 1], *self._line_coords(row, None))
         for col in range(1, self._cols):
-            self._board.create_line(col * col_multiplier, 0, col * col_multiplier, self.get_board_height())
-
-    def _redraw_cells(self) -> None:
-        """ Redraws all the occupied cells in the board """
-        for row in range(self._rows):
-            for col in range(self._cols):
-                if self._game_state.get_board()[row][col] != othello.NONE:
-                    self._draw_cell(row, col)
-
-    def _draw_cell(self, row: int, col: int) -> None:
-        """ Draws the specified cell """
-        self._board.create_oval(col * self.get_cell_width(),
-                                row * self.get_cell_height(),
-                                (col + 1) * self.get_cell_width(),
-                                (row + 1) * self.get_cell_height(),
-                                fill=PLAYERS[self._game_state.get_board()[row][col]])
+            self._board.coords(self._lines[self._rows - 2 + col], *self._line_coords(None, col))
+        for index, item in enumerate(self._cells):
+            self._board.coords(item, *self._cell_coords(*divmod(index, self._cols)))
+
+    def _create_items(self) -> None:
+        """ Creates the line and cell items, every cell hidden """
+        self._lines = [self._board.create_line(*self._line_coords(row, None)) for row in range(1, self._rows)]
+        self._lines += [self._board.create_line(*self._line_coords(None, col)) for col in range(1, self._cols)]
+        self._cells = [self._board.create_oval(*self._cell_coords(row, col), state=tkinter.HIDDEN)
+                       for row in range(self._rows) for col in range(self._cols)]
+        self._drawn_bits = (0, 0)
+
+    def _line_coords(self, row: int | None, col: int | None) -> tuple[float, float, float, float]:
+        """ Returns the coordinates of the horizontal line above the row, or of the vertical line left of the col """
+        if row is not None:
+            return 0, row * self.get_cell_height(), self._width, row * self.get_cell_height()
+        return col * self.get_cell_width(), 0, col * self.get_cell_width(), self._height
+
+    def _cell_coords(self, row: int, col: int) -> tuple[float, float, float, float]:
+        """ Returns the bounding box of the disc of the cell """
+        (cell_width, cell_height) = (self.get_cell_width(), self.get_cell_height())
+        return col * cell_width, row * cell_height, (col + 1) * cell_width, (row + 1) * cell_height
 
     def update_game_state(self, game_state: othello.OthelloGame) -> None:
         """ Updates our current _game_state to the specified one in the argument """
@@ -82,12 +124,12 @@ class GameBoard:
         return self.get_board_height() / self.get_rows()
 
     def get_board_width(self) -> float:
-        """ Returns the board canvas's width """
-        return float(self._board.winfo_width())
+        """ Returns the board canvas's width, as of the last <Configure> """
+        return self._width
 
     def get_board_height(self) -> float:
-        """ Returns the board canvas's height """
-        return float(self._board.winfo_height())
+        """ Returns the board canvas's height, as of the last <Configure> """
+        return self._height
 
     def get_rows(self) -> int:
         """ Returns the total number of rows in the board """
@@ -181,6 +223,20 @@ class Turn:
         """ Displays a message when a player tries to cheat """
         self._turn_label['text'] = f"{PLAYERS[cheater]} cheated with row {row} and col {col}!"
 
+    def display_thinking(self, player: str) -> None:
+        """ Displays that the AI playing the player is looking for its move """
+        self._player = player
+        self._turn_label['text'] = PLAYERS[player] + " is thinking…"
+
+    def display_starting(self) -> None:
+        """ Displays that the AIs of a new game are starting """
+        self._turn_label['text'] = "Starting the AIs…"
+
+    def display_ai_error(self, player: str) -> None:
+        """ Displays that the AI playing the player failed, which ends the game """
+        self._player = player
+        self._turn_label['text'] = f"{PLAYERS[player]}'s AI failed, game over"
+
     def display_type_error(self, player: str, row: int, col: int) -> None:
         self._turn_label['text'] = f"{PLAYERS[player]} gives invalid type. Row : {type(row)}, Col : {type(col)}"
     
@@ -0,0 +1,233 @@
+"""
+This file contains the pattern evaluation: a position is scored as the sum of the learned values of the patterns of
+cells it is made of, like Logistello does.
+
+A pattern is a shape of cells anchored at a corner of the board: the 3x3 and 2x5 corners, the edge, the 2nd, 3rd and
+4th rows from the edge and the diagonal. Each shape is read from each of the 4 corners, and also along the other side
+of the corner, which gives the instances of the pattern on the board. The cells of an instance, read in order, make a
+base-3 number (0 empty, 1 own disc, 2 opponent disc), the index of the instance's value in the table of its pattern.
+All the instances of a pattern share the same table.
+
+The tables are stored per board size in patterns/patterns_<rows>x<cols>.bin and loaded the first time the size is
+evaluated. A size without a file gets tables made from the cell weights of othello_eval, which score about like the
+positional evaluation until tables are learned for it (see othello_train).
+"""
+
+import array
+import os.path
+import struct
+import sys
+
+import othello_eval
+
+try:
+    import numpy
+except ImportError: # NumPy is optional, the tables are read one value at a time without it
+    numpy = None
+
+PATTERN_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'patterns')
+MAGIC = b'OTHP'
+VERSION = 1
+HEADER = struct.Struct('<4sHBBHH') # magic, version, rows, cols, scale, number of tables
+TABLE_HEADER = struct.Struct('<12sB') # pattern name, number of cells, followed by 3 ** cells int16 values
+
+SCALE = 16 # the table values are in 1/SCALE of a point of score, the score is their sum divided by SCALE
+NUMPY_MIN_BATCH = 2 # a single position is scored faster without NumPy
+
+EMPTY, OWN, OPPONENT = 0, 1, 2 # digits of the index
+
+
+def pattern_shapes(rows: int, cols: int) -> list[tuple[str, list[tuple[int, int]]]]:
+    """ Returns the (name, cells in reading order) of each pattern, anchored at the top-left corner. The shapes
+        that don't fit the board are cut to it """
+    length = min(8, cols)
+    shapes = [
+        ('corner3x3', [(row, col) for row in range(3) for col in range(3)]),
+        ('corner2x5', [(row, col) for row in range(2) for col in range(min(5, cols))]),
+        ('edge', [(0, col) for col in range(length)]),
+        ('diagonal', [(index, index) for index in range(min(8, rows, cols))]),
+    ]
+    for depth, name in ((1, 'row2'), (2, 'row3'), (3, 'row4')):
+        if depth < rows // 2:
+            shapes.append((name, [(depth, col) for col in range(length)]))
+    return shapes
+
+
+def pattern_instances(rows: int, cols: int) -> list[tuple[tuple[str, int], tuple[int, ...]]]:
+    """ Returns the ((name, number of cells), cell indexes in reading order) of every instance of the patterns on
+        the board: each shape from each corner, along both sides of the corner. An instance that covers the same
+        cells as another one of its pattern is only kept once """
+    instances = []
+    seen = set()
+    for transposed in (False, True):
+        (shape_rows, shape_cols) = (cols, rows) if transposed else (rows, cols)
+        for name, cells in pattern_shapes(shape_rows, shape_cols):
+            if transposed:
+                cells = [(col, row) for row, col in cells]
+            for flip_rows in (False, True):
+                for flip_cols in (False, True):
+                    indexes = tuple((rows - 1 - row if flip_rows else row) * cols + (cols - 1 - col if flip_cols else col)
+                                    for row, col in cells)
+                    if (name, frozenset(indexes)) not in seen:
+                        seen.add((name, frozenset(indexes)))
+                        instances.append(((name, len(indexes)), indexes))
+    return instances
+
+
+def seed_tables(rows: int, cols: int) -> dict[tuple[str, int], array.array]:
+    """ Returns tables that score like the othello_eval weights: each cell weight is shared between the instances
+        covering the cell, and the value of an index is the sum of the shares of its own discs minus the sum of the
+        shares of its opponent discs """
+    weights = othello_eval.generate_weights(rows, cols)
+    instances = pattern_instances(rows, cols)
+    coverage = [0] * (rows * cols)
+    for pattern, indexes in instances:
+        for index in indexes:
+            coverage[index] += 1
+    shares = {} # pattern -> share of each of its cells, averaged over its instances
+    for pattern, indexes in instances:
+        share = [weights[index // cols][index % cols] / coverage[index] for index in indexes]
+        (total, count) = shares.get(pattern, ([0.0] * len(indexes), 0))
+        shares[pattern] = ([old + new for old, new in zip(total, share)], count + 1)
+    tables = {}
+    for pattern, (total, count) in shares.items():
+        values = [0.0]
+        for cell_share in total:
+            cell_share = cell_share / count * SCALE
+            values = [value + digit_value for digit_value in (0.0, cell_share, -cell_share) for value in values]
+        tables[pattern] = array.array('h', (round(value) for value in values))
+    return tables
+
+
+def table_path(rows: int, cols: int) -> str:
+    """ Returns the path of the table file of the board size """
+    return os.path.join(PATTERN_FOLDER, f"patterns_{rows}x{cols}.bin")
+
+
+def has_tables(rows: int, cols: int) -> bool:
+    """ Tells whether tables were learned for the board size """
+    return os.path.exists(table_path(rows, cols))
+
+
+def save_tables(path: str, rows: int, cols: int, tables: dict[tuple[str, int], array.array]) -> None:
+    """ Writes the tables of a board size """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, rows, cols, SCALE, len(tables)))
+        for (name, cells), values in tables.items():
+            if len(values) != 3 ** cells:
+                raise ValueError(f"the table of {name} has {len(values)} values instead of {3 ** cells}")
+            file.write(TABLE_HEADER.pack(name.encode(), cells))
+            values = array.array('h', values)
+            if sys.byteorder == 'big':
+                values.byteswap()
+            file.write(values.tobytes())
+    os.replace(temporary_path, path)
+
+
+def load_tables(path: str) -> tuple[int, int, dict[tuple[str, int], array.array]]:
+    """ Reads a table file, returns its board size and its tables """
+    with open(path, 'rb') as file:
+        data = file.read()
+    magic, version, rows, cols, scale, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION or scale != SCALE:
+        raise ValueError(f"{path} is not a pattern table file of version {VERSION}")
+    tables = {}
+    offset = HEADER.size
+    for _ in range(count):
+        name, cells = TABLE_HEADER.unpack_from(data, offset)
+        offset += TABLE_HEADER.size
+        values = array.array('h')
+        values.frombytes(data[offset:offset + 2 * 3 ** cells])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        if len(values) != 3 ** cells:
+            raise ValueError(f"{path} is truncated")
+        offset += 2 * 3 ** cells
+        tables[(name.rstrip(b'\0').decode(), cells)] = values
+    return rows, cols, tables
+
+
+class PatternEvaluator:
+    """ Scores the positions of one board size with the pattern tables, same interface as othello_eval.PositionalEvaluator """
+
+    def __init__(self, rows: int, cols: int, tables: dict[tuple[str, int], array.array] = None):
+        """
+        :param tables: the table of each (name, number of cells) pattern, seed_tables(rows, cols) by default
+        """
+        self.rows = rows
+        self.cols = cols
+        self.instances = pattern_instances(rows, cols)
+        self.tables = tables if tables is not None else seed_tables(rows, cols)
+        for pattern, indexes in self.instances:
+            if pattern not in self.tables:
+                raise ValueError(f"no table for the {pattern[0]} pattern of {pattern[1]} cells")
+        self._bytes = (rows * cols + 7) // 8
+
+        # for each instance, (table, ((byte of the board, 3 ** position of each bit of that byte), ...)), so that an
+        # index is a few lookups instead of a loop over the cells
+        self._lookups = []
+        for pattern, indexes in self.instances:
+            powers = {}
+            for position, index in enumerate(indexes):
+                byte_powers = powers.setdefault(index // 8, [0] * 8)
+                byte_powers[index % 8] = 3 ** position
+            self._lookups.append((self.tables[pattern], tuple(
+                (byte, tuple(sum(power for bit, power in enumerate(byte_powers) if value >> bit & 1) for value in range(256)))
+                for byte, byte_powers in sorted(powers.items()))))
+
+        if numpy is not None:
+            patterns = list(self.tables)
+            offsets = {}
+            flat = []
+            for pattern in patterns:
+                offsets[pattern] = sum(len(values) for values in flat)
+                flat.append(numpy.frombuffer(self.tables[pattern], dtype=numpy.int16))
+            self._flat = numpy.concatenate(flat).astype(numpy.int64)
+            self._offsets = numpy.array([offsets[pattern] for pattern, indexes in self.instances], dtype=numpy.int64)
+            self._powers = numpy.zeros((8 * self._bytes, len(self.instances)), dtype=numpy.int64)
+            for column, (pattern, indexes) in enumerate(self.instances):
+                for position, index in enumerate(indexes):
+                    self._powers[index, column] = 3 ** position
+
+    def evaluate(self, own: int, opp: int) -> int:
+        """ Returns the score of the position for the `own` player """
+        own_bytes = own.to_bytes(self._bytes, 'little')
+        opp_bytes = opp.to_bytes(self._bytes, 'little')
+        score = 0
+        for table, lookups in self._lookups:
+            index = 0
+            for byte, powers in lookups:
+                index += powers[own_bytes[byte]] + 2 * powers[opp_bytes[byte]]
+            score += table[index]
+        return score // SCALE
+
+    def evaluate_batch(self, positions: list[tuple[int, int]]) -> list[int]:
+        """ Returns the evaluate() of each (own, opp) position """
+        if numpy is None or len(positions) < NUMPY_MIN_BATCH:
+            return [self.evaluate(own, opp) for own, opp in positions]
+        size = self._bytes
+        own = numpy.frombuffer(b''.join(bits.to_bytes(size, 'little') for bits, _ in positions), dtype=numpy.uint8)
+        opp = numpy.frombuffer(b''.join(bits.to_bytes(size, 'little') for _, bits in positions), dtype=numpy.uint8)
+        digits = (numpy.unpackbits(own, bitorder='little').astype(numpy.int64)
+                  + 2 * numpy.unpackbits(opp, bitorder='little')).reshape(len(positions), -1)
+        indexes = digits @ self._powers + self._offsets
+        return (self._flat[indexes].sum(axis=1) // SCALE).tolist()
+
+
+_evaluators = {}
+
+
+def get_evaluator(rows: int, cols: int) -> PatternEvaluator:
+    """ Returns the (cached) evaluator of the board size, with the tables of its file if there is one """
+    evaluator = _evaluators.get((rows, cols))
+    if evaluator is None:
+        path = table_path(rows, cols)
+        tables = None
+        if os.path.exists(path):
+            (file_rows, file_cols, tables) = load_tables(path)
+            if (file_rows, file_cols) != (rows, cols):
+                raise ValueError(f"{path} holds the tables of a {file_rows}x{file_cols} board")
+        evaluator = _evaluators[(rows, cols)] = PatternEvaluator(rows, cols, tables)
+    return evaluator
@@ -0,0 +1,319 @@
+"""
+This file contains the game records: a compact binary file of finished games, written one game at a time and read
+back as a stream, for the analysis of many games (from the arena, from the GUI...).
+
+A record file is a header followed by the games, back to back. Each game is a header (board size, final scores,
+forfeit, lengths of the names and number of moves), the names of the two players, then one byte per move: the index
+of the cell (row * cols + col), or PASS when the player to move had to pass. Boards of 255 cells or more take two
+bytes per move. A game of 7x9 with short names takes about 80 bytes.
+
+Next to each record file, <file>.idx holds the offset of each game in the file, which gives the number of games and
+any game by number without reading the ones before it. The index is written along with the file, and can be rebuilt
+from it with build_index.
+
+Usage: python othello_record.py stats games.ogr --plies 4
+"""
+
+import argparse
+import array
+import mmap
+import os.path
+import struct
+import sys
+import time
+from collections import namedtuple
+
+import othello
+
+MAGIC = b'OTHG'
+INDEX_MAGIC = b'OTHI'
+VERSION = 1
+HEADER = struct.Struct('<4sH') # magic, version, of both the record file and the index file
+GAME_HEADER = struct.Struct('<BBHHBBBH') # rows, cols, black discs, white discs, forfeit, length of the black name,
+                                         # length of the white name, number of moves
+OFFSET = struct.Struct('<Q') # offset of a game in the record file, one per game in the index file
+
+PASS = 0xff # move of a pass
+WIDE_PASS = 0xffff # move of a pass when the moves take two bytes
+FORFEITS = {None: 0, othello.BLACK: 1, othello.WHITE: 2} # forfeit byte: who lost by forfeit
+FORFEIT_COLORS = {value: color for color, value in FORFEITS.items()}
+
+DEFAULT_PLIES = 4
+
+
+def index_path(path: str) -> str:
+    """ Returns the path of the index of a record file """
+    return path + '.idx'
+
+
+def move_size(rows: int, cols: int) -> int:
+    """ Returns the number of bytes of each move on a board size: one while every cell index is under PASS """
+    return 1 if rows * cols < PASS else 2
+
+
+def insert_passes(rows: int, cols: int, moves: list[tuple[int, int]]) -> list[tuple[int, int] | None]:
+    """ Returns the moves of a game, from the start, with a None where a player had to pass. OthelloGame passes
+        by itself, so the games it plays only list the moves actually played """
+    geometry = othello.get_geometry(rows, cols)
+    game = othello.OthelloGame(rows, cols, othello.BLACK)
+    own, opp = game.get_bits(othello.BLACK), game.get_bits(othello.WHITE)
+    full_moves = []
+    for row, col in moves:
+        if not geometry.legal_moves(own, opp): # the player to move can't, it's the other one's turn
+            full_moves.append(None)
+            (own, opp) = (opp, own)
+        bit = 1 << (row * cols + col)
+        flips = geometry.flips(bit, own, opp)
+        (own, opp) = (opp ^ flips, own | bit | flips)
+        full_moves.append((row, col))
+    return full_moves
+
+
+def decode_cells(moves: bytes, rows: int, cols: int) -> tuple[int, ...]:
+    """ Returns the cell index of each move of the raw bytes of a game, PASS (or WIDE_PASS) for the passes """
+    if move_size(rows, cols) == 1:
+        return tuple(moves)
+    values = array.array('H', moves)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return tuple(values)
+
+
+class GameRecord(namedtuple('GameRecord', 'black white rows cols scores forfeit moves')):
+    """
+    A game read from a record file: the names of the players, the board size, the final (black, white) scores,
+    the color that lost by forfeit (None if the game went to its end) and the moves, as the raw bytes of the file
+    (see move_list and positions to decode them).
+    """
+
+    __slots__ = ()
+
+    @property
+    def winner(self) -> str | None:
+        """ The color that won, None for a draw """
+        if self.forfeit is not None:
+            return othello.OPPOSITE[self.forfeit]
+        (black, white) = self.scores
+        if black == white:
+            return None
+        return othello.BLACK if black > white else othello.WHITE
+
+    def cells(self) -> tuple[int, ...]:
+        """ The cell index of each move, PASS (or WIDE_PASS) for the passes """
+        return decode_cells(self.moves, self.rows, self.cols)
+
+    def move_list(self) -> list[tuple[int, int] | None]:
+        """ The (row, col) of each move, None for the passes """
+        pass_cell = PASS if move_size(self.rows, self.cols) == 1 else WIDE_PASS
+        return [None if cell == pass_cell else divmod(cell, self.cols) for cell in self.cells()]
+
+    def positions(self):
+        """ Replays the game: yields the position before the first move, then the position after each move, as they
+            are played. The same OthelloGame is played on, copy it (copy_game) to keep a position """
+        game = othello.OthelloGame(self.rows, self.cols, othello.BLACK)
+        yield game
+        for move in self.move_list():
+            if move is not None: # OthelloGame already gave the turn back after the pass
+                game.move(*move)
+                yield game
+
+
+class RecordWriter:
+    """
+    Appends games to a record file and their offsets to its index, one game at a time. The file and its index are
+    created if they don't exist.
+    """
+
+    def __init__(self, path: str):
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new:
+            with open(path, 'rb') as file:
+                if HEADER.unpack(file.read(HEADER.size).ljust(HEADER.size, b'\0')) != (MAGIC, VERSION):
+                    raise ValueError(f"{path} is not a game record file of version {VERSION}")
+            if not os.path.exists(index_path(path)):
+                build_index(path)
+        self._file = open(path, 'ab')
+        self._index = open(index_path(path), 'ab')
+        if new:
+            self._file.write(HEADER.pack(MAGIC, VERSION))
+            self._index.truncate(0)
+            self._index.write(HEADER.pack(INDEX_MAGIC, VERSION))
+        self._offset = self._file.tell()
+
+    def write(self, black: str, white: str, rows: int, cols: int, moves: list[tuple[int, int] | None],
+              scores: tuple[int, int], forfeit: str = None) -> None:
+        """
+        Appends a game.
+
+        :param black: name of the black player
+        :param white: name of the white player
+        :param moves: the (row, col) of each move from the start, None for the passes (see insert_passes)
+        :param scores: final (black, white) scores
+        :param forfeit: the color that lost by forfeit, None if the game went to its end
+        """
+        black_name, white_name = black.encode()[:255], white.encode()[:255]
+        if move_size(rows, cols) == 1:
+            cells = bytes(PASS if move is None else move[0] * cols + move[1] for move in moves)
+        else:
+            values = array.array('H', (WIDE_PASS if move is None else move[0] * cols + move[1] for move in moves))
+            if sys.byteorder == 'big':
+                values.byteswap()
+            cells = values.tobytes()
+        data = b''.join((GAME_HEADER.pack(rows, cols, scores[0], scores[1], FORFEITS[forfeit], len(black_name),
+                                          len(white_name), len(moves)), black_name, white_name, cells))
+        self._file.write(data)
+        self._index.write(OFFSET.pack(self._offset))
+        self._offset += len(data)
+
+    def write_result(self, result: dict) -> None:
+        """ Appends a game played by othello_arena.play_game """
+        self.write(result['black'], result['white'], result['rows'], result['cols'],
+                   insert_passes(result['rows'], result['cols'], result['moves']), result['scores'], result['forfeit'])
+
+    def flush(self) -> None:
+        self._file.flush()
+        self._index.flush()
+
+    def close(self) -> None:
+        self._file.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class RecordReader:
+    """
+    A record file opened read-only, through a memory map: iterating over it decodes the games one at a time, in the
+    order they were written, and reader[number] reads one game through the index.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a game record file of version {VERSION}")
+        self._index = None
+
+    def close(self) -> None:
+        self._map.close()
+        if self._index is not None:
+            self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _read(self, offset: int) -> tuple[GameRecord, int]:
+        """ Decodes the game at the offset, returns it and the offset of the next one """
+        data = self._map
+        rows, cols, black, white, forfeit, black_length, white_length, count = GAME_HEADER.unpack_from(data, offset)
+        offset += GAME_HEADER.size
+        names_end = offset + black_length + white_length
+        end = names_end + count * move_size(rows, cols)
+        if end > len(data):
+            raise ValueError(f"{self.path} is truncated")
+        return GameRecord(data[offset:offset + black_length].decode(), data[offset + black_length:names_end].decode(),
+                          rows, cols, (black, white), FORFEIT_COLORS[forfeit], data[names_end:end]), end
+
+    def __iter__(self):
+        offset = HEADER.size
+        size = len(self._map)
+        while offset < size:
+            (record, offset) = self._read(offset)
+            yield record
+
+    def _open_index(self) -> mmap.mmap:
+        if self._index is None:
+            path = index_path(self.path)
+            if not os.path.exists(path) or os.path.getsize(path) <= HEADER.size:
+                raise ValueError(f"{self.path} has no index, see build_index")
+            with open(path, 'rb') as file:
+                self._index = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            if HEADER.unpack_from(self._index, 0) != (INDEX_MAGIC, VERSION):
+                raise ValueError(f"{path} is not a game record index of version {VERSION}")
+        return self._index
+
+    def __len__(self) -> int:
+        """ The number of games, from the index """
+        return (len(self._open_index()) - HEADER.size) // OFFSET.size
+
+    def __getitem__(self, number: int) -> GameRecord:
+        """ The game of the given number, from 0 in the order they were written """
+        count = len(self)
+        if number < 0:
+            number += count
+        if not 0 <= number < count:
+            raise IndexError(f"game {number} of {count}")
+        return self._read(OFFSET.unpack_from(self._index, HEADER.size + number * OFFSET.size)[0])[0]
+
+
+def build_index(path: str) -> int:
+    """ Writes the index of a record file from the file itself, returns the number of games """
+    temporary_path = index_path(path) + '.tmp'
+    count = 0
+    with RecordReader(path) as reader, open(temporary_path, 'wb') as file:
+        file.write(HEADER.pack(INDEX_MAGIC, VERSION))
+        offset = HEADER.size
+        size = len(reader._map)
+        while offset < size:
+            file.write(OFFSET.pack(offset))
+            offset = reader._read(offset)[1]
+            count += 1
+    os.replace(temporary_path, index_path(path))
+    return count
+
+
+def opening_stats(path: str, plies: int = DEFAULT_PLIES) -> dict[tuple, list[int]]:
+    """ Returns, for each opening (rows, cols and the cells of the moves of the first `plies` plies, see
+        decode_cells), the [games, black wins, draws, white wins] of the games of the file that started with it """
+    stats = {}
+    results = {othello.BLACK: 1, None: 2, othello.WHITE: 3}
+    with RecordReader(path) as reader:
+        for record in reader:
+            opening = (record.rows, record.cols, record.moves[:plies * move_size(record.rows, record.cols)])
+            counts = stats.get(opening)
+            if counts is None:
+                counts = stats[opening] = [0, 0, 0, 0]
+            counts[0] += 1
+            counts[results[record.winner]] += 1
+    return {(rows, cols, decode_cells(moves, rows, cols)): counts for (rows, cols, moves), counts in stats.items()}
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Reads the game record files written by othello_arena --record.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    stats_parser = subparsers.add_parser('stats', help="prints the results of each opening")
+    stats_parser.add_argument('path', help="record file")
+    stats_parser.add_argument('--plies', type=int, default=DEFAULT_PLIES, help="moves of the openings")
+    stats_parser.add_argument('--top', type=int, default=20, help="openings printed, the most played first")
+    index_parser = subparsers.add_parser('index', help="rebuilds the index of a record file")
+    index_parser.add_argument('path', help="record file")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.command == 'stats':
+        stats = opening_stats(args.path, args.plies)
+        games = sum(counts[0] for counts in stats.values())
+        print(f"{games} games, {len(stats)} openings in {time.perf_counter() - start:.1f}s")
+        print(f"{'opening':<32}{'games':>9}{'black':>8}{'draw':>8}{'white':>8}")
+        for (rows, cols, cells), counts in sorted(stats.items(), key=lambda item: -item[1][0])[:args.top]:
+            opening = ' '.join('pass' if cell in (PASS, WIDE_PASS) else f"{cell // cols},{cell % cols}"
+                               for cell in cells)
+            print(f"{f'{rows}x{cols} {opening}':<32}{counts[0]:>9}{counts[1] / counts[0]:>8.1%}"
+                  f"{counts[2] / counts[0]:>8.1%}{counts[3] / counts[0]:>8.1%}")
+    else:
+        count = build_index(args.path)
+        print(f"{count} games indexed in {time.perf_counter() - start:.1f}s -> {index_path(args.path)}")
+
+
+if __name__ == '__main__':
+    main()
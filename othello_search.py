@@ -0,0 +1,165 @@
+"""
+This file contains the search helpers shared by the AIs of the ai folder.
+
+It is kept out of the ai folder on purpose, every module of that folder is listed as a player.
+"""
+
+import time
+from collections import Counter
+
+# Bound types of a transposition table entry
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# Rough memory taken by one entry of the table: the slot, the entry tuple and its ints
+ENTRY_BYTES = 160
+
+
+class SearchTimeout(Exception):
+    """ Raised inside a search when its time is up, to unwind it at once """
+    pass
+
+
+class TranspositionTable:
+    """
+    Fixed-size transposition table indexed by the Zobrist key of the position (see OthelloGame.get_key).
+
+    Each slot holds one entry (key, depth, score, bound, best move, generation). When two positions
+    fall in the same slot, the deepest search is kept, unless the entry comes from an older search
+    (generation), which is always replaced. This lets the table be kept for the whole game.
+    """
+
+    def __init__(self, size_mb: float = 16):
+        """ Creates an empty table taking about `size_mb` megabytes. The number of slots is rounded
+            down to a power of two """
+        slots = max(1, int(size_mb * 1024 * 1024) // ENTRY_BYTES)
+        self.size = 1 << (slots.bit_length() - 1)
+        self._mask = self.size - 1
+        self._entries = [None] * self.size
+        self.generation = 0
+
+    def new_search(self) -> None:
+        """ To be called before each new search (usually each move): the entries of the previous
+            searches can then be replaced by any newer entry """
+        self.generation += 1
+
+    def clear(self) -> None:
+        """ Removes every entry """
+        self._entries = [None] * self.size
+        self.generation = 0
+
+    def probe(self, key: int) -> tuple | None:
+        """ Returns the entry (key, depth, score, bound, move, generation) stored for the position, or
+            None if there isn't any """
+        entry = self._entries[key & self._mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key: int, depth: int, score: float, bound: int, move: tuple[int, int] | None) -> None:
+        """ Stores the result of a search of `depth` plies on the position, with the depth-preferred
+            replacement policy """
+        index = key & self._mask
+        old = self._entries[index]
+        if old is None or old[0] == key or old[5] != self.generation or depth >= old[1]:
+            if move is None and old is not None and old[0] == key:
+                move = old[4]  # keep the best move we already know for this position
+            self._entries[index] = (key, depth, score, bound, move, self.generation)
+
+    def __len__(self) -> int:
+        """ Returns the number of filled slots """
+        return sum(entry is not None for entry in self._entries)
+
+
+class SearchStats:
+    """
+    Counters of one search, only collected when asked for since they slow the search down (see the collect_stats of
+    Michel_Peck). The counts are by ply, the root being ply 0, and the times in seconds by kind of work.
+    """
+
+    def __init__(self):
+        self.nodes = Counter() # ply -> positions visited
+        self.leaves = Counter() # ply -> positions evaluated
+        self.tt_hits = Counter() # ply -> positions answered by the transposition table
+        self.cutoffs = Counter() # (ply, index of the move in the ordering) -> cutoffs
+        self.times = Counter() # kind of work -> seconds
+        self.iterations = [] # one dict per iterative deepening iteration: depth, seconds, nodes, move, score, completed
+
+    def clear(self) -> None:
+        """ Sets every counter back to zero """
+        self.__init__()
+
+    def timed(self, function, kind: str):
+        """ Returns the function, adding the time of each call to the times of `kind` """
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.times[kind] += time.perf_counter() - start
+        return timed_function
+
+    def merge(self, other: 'SearchStats') -> None:
+        """ Adds the counters of another search to these, like the ones of a worker process """
+        self.nodes.update(other.nodes)
+        self.leaves.update(other.leaves)
+        self.tt_hits.update(other.tt_hits)
+        self.cutoffs.update(other.cutoffs)
+        self.times.update(other.times)
+
+    def total_nodes(self) -> int:
+        """ Returns the number of positions visited """
+        return sum(self.nodes.values())
+
+    def first_move_cutoff_rate(self) -> float:
+        """ Returns the share of the cutoffs made by the first move tried, 1 for a perfect move ordering """
+        cutoffs = sum(self.cutoffs.values())
+        first = sum(count for (ply, index), count in self.cutoffs.items() if index == 0)
+        return first / cutoffs if cutoffs else 0.0
+
+    def summary(self) -> dict:
+        """ Returns the counters as a dict that can be written as JSON """
+        plies = range(max(self.nodes, default=-1) + 1)
+        return {
+            'nodes': self.total_nodes(),
+            'leaves': sum(self.leaves.values()),
+            'tt_hits': sum(self.tt_hits.values()),
+            'cutoffs': sum(self.cutoffs.values()),
+            'first_move_cutoff_rate': self.first_move_cutoff_rate(),
+            'times': dict(self.times),
+            'by_ply': [{'nodes': self.nodes[ply], 'leaves': self.leaves[ply], 'tt_hits': self.tt_hits[ply],
+                        'cutoffs': {index: count for (cut_ply, index), count in sorted(self.cutoffs.items())
+                                    if cut_ply == ply}}
+                       for ply in plies],
+            'iterations': self.iterations,
+        }
+
+    def __str__(self) -> str:
+        lines = [f"{'ply':>4}{'nodes':>10}{'leaves':>10}{'tt hits':>10}{'cutoffs':>10}{'1st move':>10}"]
+        for ply, counts in enumerate(self.summary()['by_ply']):
+            cutoffs = sum(counts['cutoffs'].values())
+            first = f"{counts['cutoffs'].get(0, 0) / cutoffs:.0%}" if cutoffs else '-'
+            lines.append(f"{ply:>4}{counts['nodes']:>10}{counts['leaves']:>10}{counts['tt_hits']:>10}{cutoffs:>10}{first:>10}")
+        lines.append(', '.join(f"{kind} {seconds * 1000:.1f} ms" for kind, seconds in self.times.items()))
+        for iteration in self.iterations:
+            lines.append(f"depth {iteration['depth']}: {iteration['nodes']} nodes in {iteration['seconds'] * 1000:.1f} ms, "
+                         f"move {iteration['move']} score {iteration['score']}"
+                         + ('' if iteration['completed'] else ' (out of time)'))
+        return '\n'.join(lines)
+
+
+class TimedBoard:
+    """
+    Wraps an OthelloGame for a search that collects SearchStats: the time of move generation and of make/unmake is
+    added to the stats, everything else goes straight to the game.
+    """
+
+    def __init__(self, game, stats: SearchStats):
+        self.game = game
+        self.get_possible_move = stats.timed(game.get_possible_move, 'move generation')
+        self.make_move = stats.timed(game.make_move, 'make/unmake')
+        self.unmake_move = stats.timed(game.unmake_move, 'make/unmake')
+
+    def __getattr__(self, name: str):
+        return getattr(self.game, name)
@@ -0,0 +1,401 @@
+"""
+This file contains the engine server: the AIs of the ai folder as a local service, for many games at once, over a
+Unix socket or over stdin/stdout, with a line protocol.
+
+Each request is a line `<game> <command> [arguments]`, where <game> is any word chosen by the client to name one of
+its games, so that a connection can play many games at once. The reply is a line `<game> ok [values]` or
+`<game> error <message>`. The requests of one game are answered in order, the replies of different games can come in
+any order. The commands:
+
+- new <rows>x<cols> [<AI>]  starts a game from the initial position, played by Michel_Peck unless told otherwise
+- ai <AI>                   changes the AI of the game
+- position <B|W> <cells>    sets the position: the player to move and the rows*cols cells row by row, . B or W
+- play <row>,<col>          plays a move, replies the player to move next (B or W) or `over`
+- go [<seconds>]            asks the AI for its move, within the time if given, replies <row>,<col>
+- analyze [<seconds>]       same, replies <row>,<col> score <score> depth <depth> nodes <nodes> (- when unknown)
+- show                      replies the player to move and the cells
+- free                      forgets the game
+
+The searches (go and analyze) run in a bounded pool of worker processes, where each AI is loaded once, so the event
+loop only ever parses lines and plays moves. When as many searches as MAX_PENDING_PER_WORKER per worker are already
+waiting for the pool, the server stops reading the connection asking for more until one is done, which makes its
+writes block: the clients are slowed down instead of the server queueing without end.
+
+OthelloClient is the client side, for the tests and the programs using the server.
+
+Usage: python othello_server.py --socket /tmp/othello.sock --workers 4
+       python othello_server.py --stdio
+"""
+
+import argparse
+import asyncio
+import collections
+import contextlib
+import inspect
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import othello
+from othello_arena import discover_engines, load_engine
+
+DEFAULT_AI = 'Michel_Peck'
+DEFAULT_TIME_LIMIT = 1.0 # seconds of a search when the request doesn't say
+MAX_PENDING_PER_WORKER = 2 # searches waiting for or running in the pool, per worker, before the server stops reading
+MAX_LINE = 4096 # bytes of a request line
+
+
+class ProtocolError(Exception):
+    """ A request that can't be answered, replied as an error """
+
+
+def encode_cells(board: othello.OthelloGame) -> str:
+    """ Returns the cells of the board row by row, . B or W """
+    return ''.join(''.join(row) for row in board.get_board())
+
+
+def parse_move(text: str) -> tuple[int, int]:
+    """ Parses a move written <row>,<col> """
+    try:
+        row, col = (int(number) for number in text.split(','))
+    except ValueError:
+        raise ProtocolError(f"{text}: moves are written row,col") from None
+    return row, col
+
+
+def parse_seconds(arguments: list[str]) -> float:
+    """ Parses the optional time of go and analyze """
+    if not arguments:
+        return DEFAULT_TIME_LIMIT
+    try:
+        seconds = float(arguments[0])
+    except ValueError:
+        raise ProtocolError(f"{arguments[0]}: not a number of seconds") from None
+    if not 0 < seconds <= 3600:
+        raise ProtocolError(f"{arguments[0]}: seconds go from 0 to 3600")
+    return seconds
+
+
+_engines = {} # name -> AI, in each worker process of the pool
+
+
+def _search(name: str, rows: int, cols: int, turn: str, black_bits: int, white_bits: int,
+            time_limit: float) -> tuple[tuple[int, int], object, object, object]:
+    """ Runs in the pool: returns the move of the AI on the position, with its score, depth and nodes if it has
+        them (None otherwise). The AI is loaded at its first search in the process and kept for the next ones """
+    engine = _engines.get(name)
+    if engine is None:
+        engine = _engines[name] = load_engine(name)
+    board = othello.OthelloGame(rows, cols, turn)
+    board.set_bits(black_bits, white_bits)
+    if 'time_limit' in inspect.signature(engine.next_move).parameters:
+        move = engine.next_move(board, time_limit=time_limit)
+    else:
+        move = engine.next_move(board)
+    return ((move[0], move[1]), getattr(engine, 'score', None), getattr(engine, 'depth_reached', None),
+            getattr(engine, 'nodes', None))
+
+
+async def _read_lines(reader: asyncio.StreamReader):
+    """ Yields the lines of the reader until its end, and None in place of a line longer than MAX_LINE. All the
+        bytes of a long line are dropped, up to its newline, even when they arrive after the first MAX_LINE ones """
+    skipping = False # in the middle of a long line
+    while True:
+        try:
+            line = await reader.readuntil(b'\n')
+        except asyncio.IncompleteReadError as error: # the end, maybe after a last line without newline
+            line = error.partial
+            if not line:
+                return
+        except asyncio.LimitOverrunError as error: # the bytes stay in the reader, the ones before a newline are dropped
+            await reader.readexactly(error.consumed)
+            if not skipping:
+                skipping = True
+                yield None
+            continue
+        if skipping: # the end of the long line
+            skipping = False
+            continue
+        yield line
+
+
+class _FileWriter:
+    """ The part of asyncio.StreamWriter the server uses, writing to a file (replies are short, it never blocks long) """
+
+    def __init__(self, file):
+        self._file = file
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+        self._file.flush()
+
+    async def drain(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self._file.flush()
+
+
+class Game:
+    """ A game of a connection: its position and the AI asked for its moves """
+
+    def __init__(self, rows: int, cols: int, ai: str):
+        self.board = othello.OthelloGame(rows, cols, othello.BLACK)
+        self.ai = ai
+
+
+class OthelloServer:
+    """
+    Answers the requests of any number of connections. Each connection has its own games, which are gone when it
+    closes.
+    """
+
+    def __init__(self, workers: int = None):
+        """
+        :param workers: processes of the search pool, all the CPUs by default
+        :type workers: int
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.ai_names = discover_engines()
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        self._pending = asyncio.Semaphore(self.workers * MAX_PENDING_PER_WORKER)
+        self.searches = 0
+
+    def close(self) -> None:
+        self._pool.shutdown(cancel_futures=True)
+
+    async def serve_unix(self, path: str) -> None:
+        """ Serves the connections of the Unix socket at path, until cancelled """
+        server = await asyncio.start_unix_server(self.handle_connection, path, limit=MAX_LINE)
+        async with server:
+            await server.serve_forever()
+
+    async def serve_stdio(self) -> None:
+        """ Serves a single connection made of stdin and stdout, until stdin is closed """
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=MAX_LINE)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        try:
+            transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, sys.stdout)
+            writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+        except ValueError: # stdout is a file, written without the event loop
+            writer = _FileWriter(sys.stdout.buffer)
+        await self.handle_connection(reader, writer)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """ Reads the requests of a connection and answers each of them in a task of its own """
+        games = {}
+        locks = {} # game name -> [lock, requests using it], the requests of a name are answered one after the other
+        tasks = set()
+        try:
+            async for line in _read_lines(reader):
+                if line is None:
+                    writer.write(b"- error line too long\n")
+                    try:
+                        await writer.drain()
+                    except ConnectionError:
+                        pass
+                    continue
+                words = line.decode(errors='replace').split()
+                if not words:
+                    continue
+                if len(words) > 1 and words[1] in ('go', 'analyze'):
+                    await self._pending.acquire() # backpressure: no more reading while the pool is saturated
+                task = asyncio.create_task(self._answer(games, locks, words, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def _answer(self, games: dict[str, Game], locks: dict[str, list], words: list[str],
+                      writer: asyncio.StreamWriter) -> None:
+        """ Answers one request, in order with the other requests of its game name. The lock belongs to the name,
+            not to the Game, so that the requests after a new wait for it and then find the new game """
+        (name, command, arguments) = (words[0], words[1] if len(words) > 1 else '', words[2:])
+        searching = command in ('go', 'analyze')
+        entry = locks.setdefault(name, [asyncio.Lock(), 0]) # before any await: the tasks get the lock in order
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                if command == 'new':
+                    games[name] = self._new_game(arguments)
+                    reply = 'ok'
+                else:
+                    game = games.get(name)
+                    if game is None:
+                        raise ProtocolError(f"no game {name}, start it with new")
+                    reply = await self._run(game, command, arguments)
+                    if command == 'free':
+                        del games[name]
+        except ProtocolError as error:
+            reply = f"error {error}"
+        except Exception as error: # the AI raised, the pool broke...
+            reply = f"error {type(error).__name__}: {error}".replace('\n', ' ')
+        finally:
+            entry[1] -= 1
+            if not entry[1]: # nobody else waits on this name
+                del locks[name]
+            if searching:
+                self._pending.release()
+        writer.write(f"{name} {reply}\n".encode())
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    def _new_game(self, arguments: list[str]) -> Game:
+        if not arguments:
+            raise ProtocolError("new needs a size, like 7x9")
+        try:
+            rows, cols = (int(number) for number in arguments[0].lower().split('x'))
+        except ValueError:
+            raise ProtocolError(f"{arguments[0]}: sizes are written ROWSxCOLS") from None
+        if not (4 <= rows <= 19 and 4 <= cols <= 19):
+            raise ProtocolError(f"{arguments[0]}: boards go from 4x4 to 19x19")
+        return Game(rows, cols, self._check_ai(arguments[1] if len(arguments) > 1 else DEFAULT_AI))
+
+    def _check_ai(self, name: str) -> str:
+        if name not in self.ai_names:
+            raise ProtocolError(f"no AI called {name}")
+        return name
+
+    async def _run(self, game: Game, command: str, arguments: list[str]) -> str:
+        """ Runs a command on a game, returns the reply without the game name """
+        board = game.board
+        if command == 'ai':
+            game.ai = self._check_ai(arguments[0] if arguments else '')
+            return 'ok'
+        if command == 'position':
+            if len(arguments) != 2 or arguments[0] not in (othello.BLACK, othello.WHITE) \
+                    or len(arguments[1]) != board.get_rows() * board.get_columns() \
+                    or set(arguments[1]) - {othello.NONE, othello.BLACK, othello.WHITE}:
+                raise ProtocolError(f"position needs the player to move and {board.get_rows() * board.get_columns()} "
+                                    f"cells, . B or W")
+            black_bits = white_bits = 0
+            for index, cell in enumerate(arguments[1]):
+                if cell == othello.BLACK:
+                    black_bits |= 1 << index
+                elif cell == othello.WHITE:
+                    white_bits |= 1 << index
+            game.board = othello.OthelloGame(board.get_rows(), board.get_columns(), arguments[0])
+            game.board.set_bits(black_bits, white_bits)
+            return 'ok'
+        if command == 'play':
+            (row, col) = parse_move(arguments[0] if arguments else '')
+            try:
+                board.move(row, col)
+            except (othello.InvalidMoveException, othello.InvalidTypeException):
+                raise ProtocolError(f"{row},{col} isn't a legal move") from None
+            return 'ok over' if board.is_game_over() else f"ok {board.get_turn()}"
+        if command in ('go', 'analyze'):
+            if board.is_game_over():
+                raise ProtocolError("the game is over")
+            if not board.can_move(board.get_turn()):
+                board.switch_turn() # a position set up with the player to move having to pass
+            loop = asyncio.get_running_loop()
+            self.searches += 1
+            (move, score, depth, nodes) = await loop.run_in_executor(
+                self._pool, _search, game.ai, board.get_rows(), board.get_columns(), board.get_turn(),
+                board.get_bits(othello.BLACK), board.get_bits(othello.WHITE), parse_seconds(arguments))
+            if command == 'go':
+                return f"ok {move[0]},{move[1]}"
+            return (f"ok {move[0]},{move[1]} score {'-' if score is None else score} "
+                    f"depth {'-' if depth is None else depth} nodes {'-' if nodes is None else nodes}")
+        if command == 'show':
+            return f"ok {board.get_turn()} {encode_cells(board)}"
+        if command == 'free':
+            return 'ok'
+        raise ProtocolError(f"unknown command {command!r}")
+
+
+class ServerError(Exception):
+    """ The error reply of a request """
+
+
+class OthelloClient:
+    """
+    The client side of the protocol: request sends a request and waits for its reply, many games can be waited for
+    at once from different tasks.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        self._waiting = collections.defaultdict(collections.deque) # game -> futures of its requests, in order
+        self._reading = asyncio.create_task(self._read_replies())
+
+    @classmethod
+    async def connect_unix(cls, path: str) -> 'OthelloClient':
+        """ Connects to the server listening on the Unix socket at path """
+        (reader, writer) = await asyncio.open_unix_connection(path)
+        return cls(reader, writer)
+
+    async def request(self, game: str, command: str, *arguments) -> list[str]:
+        """
+        Sends a request and returns the values of its reply.
+
+        :param game: the name of the game, a word
+        :param command: new, ai, position, play, go, analyze, show or free, see the module
+        :param arguments: the arguments of the command, written with str()
+        :return: The words of the reply after `ok`
+        :raises ServerError: the reply is an error
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[game].append(future)
+        self._writer.write(' '.join(str(word) for word in (game, command) + arguments).encode() + b'\n')
+        await self._writer.drain()
+        words = await future
+        if words[0] != 'ok':
+            raise ServerError(' '.join(words[1:]))
+        return words[1:]
+
+    async def _read_replies(self) -> None:
+        """ Hands each reply to the request waiting for it """
+        try:
+            while line := await self._reader.readline():
+                (game, *words) = line.decode().split()
+                if self._waiting.get(game):
+                    self._waiting[game].popleft().set_result(words or ['error', 'empty reply'])
+        finally:
+            for futures in self._waiting.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(ConnectionError("the server closed the connection"))
+
+    async def close(self) -> None:
+        self._writer.close()
+        await self._writer.wait_closed()
+        self._reading.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._reading
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serves the AIs of the ai folder with a line protocol.")
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument('--socket', help="path of the Unix socket to listen on")
+    where.add_argument('--stdio', action='store_true', help="serve a single connection on stdin and stdout")
+    parser.add_argument('--workers', type=int, default=None, help="processes of the search pool, all the CPUs by default")
+    args = parser.parse_args(argv)
+
+    async def serve() -> None:
+        server = OthelloServer(args.workers)
+        try:
+            if args.stdio:
+                await server.serve_stdio()
+            else:
+                if os.path.exists(args.socket):
+                    os.remove(args.socket)
+                await server.serve_unix(args.socket)
+        finally:
+            server.close()
+
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(serve())
+
+
+if __name__ == '__main__':
+    main()
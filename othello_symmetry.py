@@ -0,0 +1,139 @@
+"""
+This file contains the symmetries of the board: the ways to turn or mirror it that give back a board of the same size,
+4 on a rectangular board (identity, mirror of the columns, mirror of the rows, half turn) and 8 on a square one (the
+same, plus the transpose, the quarter turns and the anti-transpose). A position and its images play the same, so
+anything keyed by position (the opening book, the training sets) can keep one of them: the canonical one.
+
+The canonical image of a position is the one with the smallest (black discs, white discs) bitboards, or (own, opp)
+for the positions seen from the player to move. canonical_key returns its Zobrist key and the transform from the
+position to it; a move found on the canonical position goes back to the position with original_move.
+
+A transform moves every disc of a bitboard at once through tables of the image of each byte of the bitboard, built
+once per board size.
+"""
+
+import othello
+
+IDENTITY = 0 # always the first transform, so that the position itself wins the ties
+
+# (row, col) -> (row, col) of its image on a rows x cols board, the last 4 only for square boards
+TRANSFORMS = (
+    lambda row, col, rows, cols: (row, col),
+    lambda row, col, rows, cols: (row, cols - 1 - col), # mirror of the columns
+    lambda row, col, rows, cols: (rows - 1 - row, col), # mirror of the rows
+    lambda row, col, rows, cols: (rows - 1 - row, cols - 1 - col), # half turn
+    lambda row, col, rows, cols: (col, row), # transpose
+    lambda row, col, rows, cols: (col, rows - 1 - row), # quarter turn clockwise
+    lambda row, col, rows, cols: (cols - 1 - col, row), # quarter turn counterclockwise
+    lambda row, col, rows, cols: (cols - 1 - col, rows - 1 - row), # anti-transpose
+)
+
+
+class Symmetries:
+    """
+    The transforms of a board size, shared by every game of that size. A transform is a number, an index in
+    cell_maps.
+    """
+
+    def __init__(self, rows: int, cols: int):
+        self.rows = rows
+        self.cols = cols
+        self.geometry = othello.get_geometry(rows, cols)
+        transforms = TRANSFORMS if rows == cols else TRANSFORMS[:4]
+        # cell_maps[transform][index] is the index of the image of the cell of bit `index`
+        self.cell_maps = tuple(tuple(row * cols + col for row, col in
+                                     (transform(index // cols, index % cols, rows, cols) for index in range(rows * cols)))
+                               for transform in transforms)
+        self.inverses = tuple(next(inverse for inverse, other in enumerate(self.cell_maps)
+                                   if all(other[image] == index for index, image in enumerate(cell_map)))
+                              for cell_map in self.cell_maps)
+
+        # byte_tables[transform][position][value]: image of the bits `value` of the byte at `position` of a bitboard
+        self._bytes = (rows * cols + 7) // 8
+        self._byte_tables = []
+        for cell_map in self.cell_maps:
+            tables = []
+            for position in range(self._bytes):
+                table = [0] * 256
+                for value in range(1, 256):
+                    low = (value & -value).bit_length() - 1 # the images of the other bits are already in the table
+                    index = position * 8 + low
+                    table[value] = table[value & (value - 1)] | (1 << cell_map[index] if index < rows * cols else 0)
+                tables.append(tuple(table))
+            self._byte_tables.append(tuple(tables))
+
+    def __len__(self) -> int:
+        return len(self.cell_maps)
+
+    def transform_bits(self, bits: int, transform: int) -> int:
+        """ Returns the image of a bitboard """
+        if transform == IDENTITY:
+            return bits
+        image = 0
+        for table, byte in zip(self._byte_tables[transform], bits.to_bytes(self._bytes, 'little')):
+            if byte:
+                image |= table[byte]
+        return image
+
+    def transform_move(self, move: tuple[int, int], transform: int) -> tuple[int, int]:
+        """ Returns the image of a (row, col) """
+        return divmod(self.cell_maps[transform][move[0] * self.cols + move[1]], self.cols)
+
+    def original_move(self, move: tuple[int, int], transform: int) -> tuple[int, int]:
+        """ Returns the (row, col) whose image by the transform is the move: a move of the canonical position back
+            on the position it comes from """
+        return self.transform_move(move, self.inverses[transform])
+
+    def canonical_bits(self, first: int, second: int) -> tuple[int, int, int]:
+        """ Returns the canonical image of the position of the two bitboards, (black, white) or (own, opp), and the
+            transform from the position to it """
+        best = (first, second, IDENTITY)
+        for transform in range(1, len(self.cell_maps)):
+            image = self.transform_bits(first, transform)
+            if image > best[0]:
+                continue
+            image_second = self.transform_bits(second, transform)
+            if (image, image_second) < best[:2]:
+                best = (image, image_second, transform)
+        return best
+
+    def key(self, black: int, white: int, turn: str) -> int:
+        """ Returns the Zobrist key of a position, the same as OthelloGame.get_key of a game in that position """
+        geometry = self.geometry
+        key = geometry.white_turn_key if turn == othello.WHITE else 0
+        for bits, keys in ((black, geometry.black_keys), (white, geometry.white_keys)):
+            while bits:
+                bit = bits & -bits
+                bits ^= bit
+                key ^= keys[bit.bit_length() - 1]
+        return key
+
+    def canonical_key(self, board: othello.OthelloGame) -> tuple[int, int]:
+        """ Returns the Zobrist key of the canonical image of the board, the same for all the images of the board,
+            and the transform from the board to it """
+        (black, white, transform) = self.canonical_bits(board.get_bits(othello.BLACK), board.get_bits(othello.WHITE))
+        if transform == IDENTITY:
+            return board.get_key(), IDENTITY
+        return self.key(black, white, board.get_turn()), transform
+
+
+_symmetries = {}
+
+
+def get_symmetries(rows: int, cols: int) -> Symmetries:
+    """ Returns the (cached) Symmetries of the board size """
+    symmetries = _symmetries.get((rows, cols))
+    if symmetries is None:
+        symmetries = _symmetries[(rows, cols)] = Symmetries(rows, cols)
+    return symmetries
+
+
+def canonical_key(board: othello.OthelloGame) -> tuple[int, int]:
+    """ Returns the key of the canonical image of the board and the transform from the board to it (see
+        Symmetries.canonical_key) """
+    return get_symmetries(board.get_rows(), board.get_columns()).canonical_key(board)
+
+
+def original_move(board: othello.OthelloGame, move: tuple[int, int], transform: int) -> tuple[int, int]:
+    """ Returns the move of the board whose image by the transform is `move`, a move of the canonical image """
+    return get_symmetries(board.get_rows(), board.get_columns()).original_move(move, transform)
@@ -0,0 +1,342 @@
+"""
+This file contains the tuning of the evaluations: it makes the AIs play each other to collect positions, then fits the
+cell weights (othello_eval) and the pattern tables (othello_patterns) so that they predict how each game ended.
+
+- generate: plays games in worker processes and appends every position to a dataset file, as fixed-size records
+  (discs of the player to move, discs of its opponent, empty cells, final disc margin of the player to move)
+- dedupe: rewrites a dataset with each position once, as its canonical image (othello_symmetry): the positions that
+  repeat from game to game, or that are mirrored or turned images of each other, become one record with the mean of
+  their final margins
+- fit: reads the dataset through a memory map, a chunk at a time so it can be bigger than the memory, and writes
+  the pattern table file (and the cell weight file if asked) of the board size, loaded by the AIs the next time
+  they play on it
+
+The cell weights are a least-squares fit, from X^T X and X^T y summed over the chunks. The pattern tables are fitted
+by passes of averaged gradient steps over the chunks.
+
+Usage: python othello_train.py generate --size 7x9 --games 2000 --data data/7x9.positions
+       python othello_train.py dedupe --data data/7x9.positions --out data/7x9.unique.positions
+       python othello_train.py fit --data data/7x9.positions
+"""
+
+import argparse
+import inspect
+import os.path
+import random
+import struct
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+import othello
+import othello_eval
+import othello_patterns
+import othello_symmetry
+from othello_arena import load_engine, parse_size
+
+MAGIC = b'OTHD'
+VERSION = 1
+HEADER = struct.Struct('<4sHBB') # magic, version, rows, cols, followed by the records
+
+DEFAULT_ENGINES = ['Michel_Peck', 'Random']
+SEARCH_DEPTH = 2 # depth of the AIs that take one, deep enough to play sensible games, shallow enough to play many
+RANDOM_MOVES = 0.1 # share of the moves played at random, so that the games don't all look alike
+CHUNK = 1 << 16 # records read at a time
+DEDUPE_PARTITION = 1 << 21 # records per partition of dedupe, about what it holds in memory at a time
+RIDGE = 1.0 # keeps the fit of the cell weights stable for the cells that are rarely played
+MAX_WEIGHT = 100 # the fitted cell weights are scaled so that the largest is worth this, like the generated ones
+SCORE_PER_DISC = 10 # the fitted pattern tables score a position 10 points per disc of final margin they predict
+
+
+def record_dtype(rows: int, cols: int) -> numpy.dtype:
+    """ Returns the NumPy type of a record of the datasets of the board size """
+    size = (rows * cols + 7) // 8
+    return numpy.dtype([('own', numpy.uint8, size), ('opp', numpy.uint8, size), ('empties', '<u2'), ('margin', '<i2')])
+
+
+def open_dataset(path: str) -> tuple[int, int, numpy.memmap]:
+    """ Maps a dataset file, returns its board size and its records """
+    with open(path, 'rb') as file:
+        magic, version, rows, cols = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a dataset of version {VERSION}")
+    dtype = record_dtype(rows, cols)
+    count = (os.path.getsize(path) - HEADER.size) // dtype.itemsize
+    return rows, cols, numpy.memmap(path, dtype=dtype, mode='r', offset=HEADER.size, shape=(count,))
+
+
+def play_game(engine_names: tuple[str, str], rows: int, cols: int, seed: int, depth: int = SEARCH_DEPTH,
+              random_moves: float = RANDOM_MOVES) -> bytes:
+    """ Plays one game and returns the records of its positions. The AIs that take a depth search that deep """
+    rng = random.Random(seed)
+    random.seed(seed)
+    engines = {othello.BLACK: load_engine(engine_names[0]), othello.WHITE: load_engine(engine_names[1])}
+    game = othello.OthelloGame(rows, cols, othello.BLACK)
+    positions = [] # (turn, own, opp, empties)
+    while not game.is_game_over():
+        turn = game.get_turn()
+        positions.append((turn, game.get_bits(turn), game.get_bits(othello.OPPOSITE[turn]),
+                          rows * cols - sum(game.get_scores())))
+        engine = engines[turn]
+        if rng.random() < random_moves:
+            move = rng.choice(game.get_possible_move())
+        elif 'max_depth' in inspect.signature(engine.next_move).parameters:
+            move = engine.next_move(game.copy_game(), time_limit=None, max_depth=depth)
+        else:
+            move = engine.next_move(game.copy_game())
+        game.move(move[0], move[1])
+    for engine in engines.values():
+        if hasattr(engine, 'close'):
+            engine.close()
+
+    records = numpy.zeros(len(positions), dtype=record_dtype(rows, cols))
+    size = records.dtype['own'].shape[0]
+    for index, (turn, own, opp, empties) in enumerate(positions):
+        records['own'][index] = numpy.frombuffer(own.to_bytes(size, 'little'), dtype=numpy.uint8)
+        records['opp'][index] = numpy.frombuffer(opp.to_bytes(size, 'little'), dtype=numpy.uint8)
+        records['empties'][index] = empties
+        records['margin'][index] = game.get_scores(turn) - game.get_scores(othello.OPPOSITE[turn])
+    return records.tobytes()
+
+
+def _play_game(args: tuple) -> bytes:
+    """ play_game for the worker processes """
+    return play_game(*args)
+
+
+def generate(path: str, rows: int, cols: int, games: int, engine_names: list[str] = DEFAULT_ENGINES,
+             workers: int = None, seed: int = 0, depth: int = SEARCH_DEPTH, random_moves: float = RANDOM_MOVES,
+             on_progress=None) -> int:
+    """
+    Plays `games` games on `workers` processes (all the CPUs by default, 0 or 1 to play them here) between
+    random pairs of the AIs, and appends their positions to the dataset, created if needed.
+
+    :param on_progress: called with (games done, games) as the games finish
+    :return: The number of records added
+    """
+    rng = random.Random(seed)
+    tasks = [((rng.choice(engine_names), rng.choice(engine_names)), rows, cols, seed + number, depth, random_moves)
+             for number in range(games)]
+    if os.path.exists(path):
+        if open_dataset(path)[:2] != (rows, cols):
+            raise ValueError(f"{path} is a dataset of another board size")
+    else:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, rows, cols))
+
+    added = 0
+    with open(path, 'ab') as file:
+        if workers is not None and workers <= 1:
+            results = map(_play_game, tasks)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(workers)
+            results = pool.map(_play_game, tasks, chunksize=4)
+        try:
+            for done, records in enumerate(results, 1):
+                file.write(records) # streamed, a game at a time
+                added += len(records) // record_dtype(rows, cols).itemsize
+                if on_progress is not None:
+                    on_progress(done, games)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+    return added
+
+
+def canonical_discs(own: numpy.ndarray, opp: numpy.ndarray, rows: int, cols: int) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """ Returns the canonical images of the positions of the packed own and opp discs (a row of bytes per position),
+        the same ones as othello_symmetry.Symmetries.canonical_bits: the smallest (own, opp) as integers """
+    size = rows * cols
+    own_cells = numpy.unpackbits(own, axis=1, bitorder='little')[:, :size]
+    opp_cells = numpy.unpackbits(opp, axis=1, bitorder='little')[:, :size]
+    best_own, best_opp = own, opp
+    best = numpy.concatenate((own[:, ::-1], opp[:, ::-1]), axis=1) # most significant byte first, compared in order
+    lines = numpy.arange(len(own))
+    for cell_map in othello_symmetry.get_symmetries(rows, cols).cell_maps[1:]:
+        images = []
+        for cells in (own_cells, opp_cells):
+            image = numpy.zeros_like(cells)
+            image[:, list(cell_map)] = cells
+            images.append(numpy.packbits(image, axis=1, bitorder='little'))
+        candidate = numpy.concatenate((images[0][:, ::-1], images[1][:, ::-1]), axis=1)
+        differ = candidate != best
+        first = differ.argmax(axis=1) # first byte where they differ
+        smaller = differ.any(axis=1) & (candidate[lines, first] < best[lines, first])
+        best[smaller] = candidate[smaller]
+        best_own = numpy.where(smaller[:, None], images[0], best_own)
+        best_opp = numpy.where(smaller[:, None], images[1], best_opp)
+    return best_own, best_opp
+
+
+def dedupe(path: str, out_path: str) -> tuple[int, int]:
+    """ Writes the dataset again with each position once, as its canonical image, with the mean final margin of
+        its records. Returns the number of records read and written.
+
+        The dataset may not fit in memory: the canonical records are first spread over partition files by a hash of
+        their position, so that all the records of a position land in the same partition, then each partition is
+        deduplicated on its own and appended to the output """
+    rows, cols, records = open_dataset(path)
+    dtype = record_dtype(rows, cols)
+    size = dtype['own'].shape[0]
+    partitions = max(1, -(-len(records) // DEDUPE_PARTITION))
+    multipliers = numpy.random.default_rng(0).integers(1, 1 << 63, size=2 * size,
+                                                       dtype=numpy.uint64) | numpy.uint64(1)
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(out_path) or '.') as directory:
+        part_paths = [os.path.join(directory, f'{number}.positions') for number in range(partitions)]
+        part_files = [open(part_path, 'wb') for part_path in part_paths]
+        try:
+            for file in part_files:
+                file.write(HEADER.pack(MAGIC, VERSION, rows, cols))
+            for start in range(0, len(records), CHUNK):
+                chunk = numpy.array(records[start:start + CHUNK])
+                chunk['own'], chunk['opp'] = canonical_discs(chunk['own'], chunk['opp'], rows, cols)
+                hashes = (numpy.concatenate((chunk['own'], chunk['opp']), axis=1) * multipliers).sum(axis=1)
+                numbers = (hashes >> numpy.uint64(32)) % numpy.uint64(partitions)
+                for number, file in enumerate(part_files):
+                    file.write(chunk[numbers == number].tobytes())
+        finally:
+            for file in part_files:
+                file.close()
+
+        written = 0
+        with open(out_path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, rows, cols))
+            for part_path in part_paths:
+                part = open_dataset(part_path)[2]
+                if not len(part):
+                    continue
+                positions = numpy.concatenate((part['own'], part['opp']), axis=1)
+                positions, first, inverse = numpy.unique(positions, axis=0, return_index=True, return_inverse=True)
+                inverse = inverse.ravel()
+                unique = numpy.zeros(len(positions), dtype=dtype)
+                unique['own'] = positions[:, :size]
+                unique['opp'] = positions[:, size:]
+                unique['empties'] = part['empties'][first]
+                unique['margin'] = numpy.round(numpy.bincount(inverse, weights=part['margin']) / numpy.bincount(inverse))
+                file.write(unique.tobytes()) # streamed, a partition at a time
+                written += len(unique)
+                del part # unmapped before the directory is removed
+    return len(records), written
+
+
+def _chunks(records: numpy.memmap, min_empties: int = 0):
+    """ Yields (own discs matrix, opponent discs matrix, margins) for a chunk of records at a time, the matrices with
+        a 0/1 column per cell. Positions with fewer than `min_empties` empty cells are skipped """
+    for start in range(0, len(records), CHUNK):
+        chunk = records[start:start + CHUNK]
+        if min_empties:
+            chunk = chunk[chunk['empties'] >= min_empties]
+        if len(chunk):
+            yield (numpy.unpackbits(chunk['own'], axis=1, bitorder='little'),
+                   numpy.unpackbits(chunk['opp'], axis=1, bitorder='little'),
+                   chunk['margin'].astype(numpy.float64))
+
+
+def fit_weights(records: numpy.memmap, rows: int, cols: int, min_empties: int = 0) -> tuple[tuple[int, ...], ...]:
+    """ Returns the cell weights whose sum over the discs of the player to move minus the sum over the discs of the
+        opponent best predicts the final disc margin, made symmetric and scaled to MAX_WEIGHT """
+    size = rows * cols
+    xtx = numpy.zeros((size, size))
+    xty = numpy.zeros(size)
+    for own, opp, margins in _chunks(records, min_empties):
+        cells = (own[:, :size].astype(numpy.float64) - opp[:, :size])
+        xtx += cells.T @ cells
+        xty += cells.T @ margins
+    weights = numpy.linalg.solve(xtx + RIDGE * numpy.eye(size), xty).reshape(rows, cols)
+    weights = (weights + weights[::-1, :] + weights[:, ::-1] + weights[::-1, ::-1]) / 4 # the board's symmetries
+    if rows == cols:
+        weights = (weights + weights.T) / 2
+    weights *= MAX_WEIGHT / max(numpy.abs(weights).max(), 1e-9)
+    return tuple(tuple(int(round(weight)) for weight in line) for line in weights)
+
+
+def fit_patterns(records: numpy.memmap, rows: int, cols: int, epochs: int = 8, learning_rate: float = 0.5,
+                 min_empties: int = 0) -> dict[tuple[str, int], numpy.ndarray]:
+    """ Returns the pattern tables whose sum best predicts the final disc margin (SCORE_PER_DISC points per disc).
+        Each pass over the records moves each value towards the average error of the positions using it """
+    evaluator = othello_patterns.PatternEvaluator(rows, cols) # for the layout of the tables
+    patterns = list(evaluator.tables)
+    sizes = [len(evaluator.tables[pattern]) for pattern in patterns]
+    offsets = {pattern: sum(sizes[:index]) for index, pattern in enumerate(patterns)}
+    instance_offsets = numpy.array([offsets[pattern] for pattern, indexes in evaluator.instances], dtype=numpy.int64)
+    powers = numpy.zeros((rows * cols, len(evaluator.instances)), dtype=numpy.int64)
+    for column, (pattern, indexes) in enumerate(evaluator.instances):
+        for position, index in enumerate(indexes):
+            powers[index, column] = 3 ** position
+
+    values = numpy.zeros(sum(sizes))
+    for epoch in range(epochs):
+        for own, opp, margins in _chunks(records, min_empties):
+            digits = own[:, :rows * cols].astype(numpy.int64) + 2 * opp[:, :rows * cols]
+            indexes = digits @ powers + instance_offsets
+            errors = margins * SCORE_PER_DISC - values[indexes].sum(axis=1)
+            totals = numpy.bincount(indexes.ravel(), weights=numpy.repeat(errors, indexes.shape[1]), minlength=len(values))
+            counts = numpy.bincount(indexes.ravel(), minlength=len(values))
+            values += learning_rate * totals / (counts + 1) / len(evaluator.instances)
+    return {pattern: values[offsets[pattern]:offsets[pattern] + size] for pattern, size in zip(patterns, sizes)}
+
+
+def fit(path: str, epochs: int = 8, patterns_path: str = None, cell_weights: bool = False,
+        weights_path: str = None) -> list[str]:
+    """ Fits the pattern tables, and the cell weights if asked, on the dataset and writes them where the AIs load
+        them from (or to the given paths). Returns the paths written """
+    rows, cols, records = open_dataset(path)
+    paths = []
+    if cell_weights or weights_path:
+        weights_path = weights_path or othello_eval.weights_path(rows, cols)
+        othello_eval.save_weights(weights_path, fit_weights(records, rows, cols))
+        paths.append(weights_path)
+    patterns_path = patterns_path or othello_patterns.table_path(rows, cols)
+    tables = fit_patterns(records, rows, cols, epochs)
+    othello_patterns.save_tables(patterns_path, rows, cols, {
+        pattern: numpy.clip(numpy.round(values * othello_patterns.SCALE), -32768, 32767).astype(numpy.int16)
+        for pattern, values in tables.items()})
+    paths.append(patterns_path)
+    return paths
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Tunes the evaluations of the AIs on games they play.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    generate_parser = commands.add_parser('generate', help="play games and append their positions to a dataset")
+    generate_parser.add_argument('--size', type=parse_size, default=(7, 9), help="board size, like 7x9")
+    generate_parser.add_argument('--games', type=int, default=1000)
+    generate_parser.add_argument('--data', required=True, help="dataset file, created or added to")
+    generate_parser.add_argument('--engines', nargs='+', default=DEFAULT_ENGINES, help="AIs to pair at random")
+    generate_parser.add_argument('--depth', type=int, default=SEARCH_DEPTH, help="depth of the AIs that take one")
+    generate_parser.add_argument('--random-moves', type=float, default=RANDOM_MOVES, help="share of random moves")
+    generate_parser.add_argument('--workers', type=int, default=None, help="processes, all the CPUs by default")
+    generate_parser.add_argument('--seed', type=int, default=0)
+    dedupe_parser = commands.add_parser('dedupe', help="write a dataset with each position once, in one orientation")
+    dedupe_parser.add_argument('--data', required=True, help="dataset file")
+    dedupe_parser.add_argument('--out', required=True, help="dataset file to write")
+    fit_parser = commands.add_parser('fit', help="fit the weights and the pattern tables on a dataset")
+    fit_parser.add_argument('--data', required=True, help="dataset file")
+    fit_parser.add_argument('--epochs', type=int, default=8, help="passes over the dataset for the pattern tables")
+    fit_parser.add_argument('--patterns', help="pattern table file to write, the one the AIs load by default")
+    fit_parser.add_argument('--cell-weights', action='store_true',
+                            help="also fit the cell weights of the positional evaluation, which the patterns usually beat")
+    fit_parser.add_argument('--weights', help="cell weight file to write, the one the AIs load by default")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.command == 'generate':
+        (rows, cols) = args.size
+        added = generate(args.data, rows, cols, args.games, args.engines, args.workers, args.seed, args.depth,
+                         args.random_moves, on_progress=lambda done, total: print(f"\r{done}/{total} games", end='', flush=True))
+        print(f"\r{added} positions from {args.games} games in {time.perf_counter() - start:.1f}s -> {args.data}")
+    elif args.command == 'dedupe':
+        (read, written) = dedupe(args.data, args.out)
+        print(f"{read} positions -> {written} in {time.perf_counter() - start:.1f}s -> {args.out}")
+    else:
+        paths = fit(args.data, args.epochs, args.patterns, args.cell_weights, args.weights)
+        print(f"fitted in {time.perf_counter() - start:.1f}s -> {', '.join(paths)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Tests of the engine server (othello_server) through OthelloClient, over a Unix socket and over stdio, and of the
+requests longer than MAX_LINE.
+
+Usage: python -m pytest test_othello_server.py
+"""
+
+import asyncio
+import io
+import os
+import socket
+import sys
+import tempfile
+import unittest
+
+import othello
+import othello_server
+
+SEARCH_TIME = 0.2 # seconds of the go and analyze requests
+
+
+class ServerRequestsMixin:
+    """ The requests of a game, run with the client of a connection to the server (self.client) """
+
+    async def check_game(self, name: str) -> None:
+        board = othello.OthelloGame(6, 6, othello.BLACK)
+        self.assertEqual(await self.client.request(name, 'new', '6x6'), [])
+        (row, col) = board.get_possible_move()[0]
+        board.move(row, col)
+        self.assertEqual(await self.client.request(name, 'play', f"{row},{col}"), [board.get_turn()])
+
+        (move,) = await self.client.request(name, 'go', SEARCH_TIME)
+        self.assertIn(othello_server.parse_move(move), board.get_possible_move())
+        (move, _, score, _, depth, _, nodes) = await self.client.request(name, 'analyze', SEARCH_TIME)
+        self.assertIn(othello_server.parse_move(move), board.get_possible_move())
+        self.assertNotEqual(score, '-')
+        self.assertGreaterEqual(int(depth), 1)
+
+        self.assertEqual(await self.client.request(name, 'free'), [])
+        with self.assertRaises(othello_server.ServerError):
+            await self.client.request(name, 'show')
+
+    async def test_games(self) -> None:
+        await asyncio.gather(*(self.check_game(f"game{number}") for number in range(4)))
+
+    async def test_errors(self) -> None:
+        with self.assertRaises(othello_server.ServerError):
+            await self.client.request('g', 'new', '6', '6')
+        await self.client.request('g', 'new', '6x6')
+        with self.assertRaises(othello_server.ServerError):
+            await self.client.request('g', 'play', '0,0')
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), "no Unix sockets")
+class UnixServerTest(ServerRequestsMixin, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, 'othello.sock')
+        self.server = othello_server.OthelloServer(workers=2)
+        self.serving = asyncio.create_task(self.server.serve_unix(path))
+        while not os.path.exists(path):
+            await asyncio.sleep(0.01)
+        self.client = await othello_server.OthelloClient.connect_unix(path)
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        self.serving.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await self.serving
+        self.server.close()
+        self.directory.cleanup()
+
+
+class StdioServerTest(ServerRequestsMixin, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, othello_server.__file__, '--stdio', '--workers', '2',
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE)
+        self.client = othello_server.OthelloClient(self.process.stdout, self.process.stdin)
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close() # closes stdin, the server stops
+        self.assertEqual(await self.process.wait(), 0)
+
+    async def test_long_line(self) -> None:
+        self.process.stdin.write(b'x' * (othello_server.MAX_LINE + 1000))
+        await self.process.stdin.drain()
+        await asyncio.sleep(0.5) # read by the server before the rest comes
+        self.process.stdin.write(b' g new 6x6\n') # the end of the long line, not a request
+        self.assertEqual(await self.client.request('h', 'new', '6x6'), [])
+        with self.assertRaises(othello_server.ServerError):
+            await self.client.request('g', 'show')
+
+
+class LongLineTest(unittest.IsolatedAsyncioTestCase):
+    """ The replies of handle_connection to the bytes of a reader fed a chunk at a time """
+
+    async def asyncSetUp(self) -> None:
+        self.server = othello_server.OthelloServer(workers=1)
+
+    async def asyncTearDown(self) -> None:
+        self.server.close()
+
+    async def replies(self, *chunks: bytes) -> list[str]:
+        reader = asyncio.StreamReader(limit=othello_server.MAX_LINE)
+        output = io.BytesIO()
+        writer = othello_server._FileWriter(output)
+        writer.close = lambda: None # the output is read after the connection is done
+        connection = asyncio.create_task(self.server.handle_connection(reader, writer))
+        for chunk in chunks:
+            reader.feed_data(chunk)
+            await asyncio.sleep(0.01) # each chunk is read before the next one comes
+        reader.feed_eof()
+        await connection
+        return output.getvalue().decode().splitlines()
+
+    async def test_end_of_long_line_is_dropped(self) -> None:
+        self.assertEqual(await self.replies(b'x' * 5000, b' g new 6x6\nh new 6x6\n'),
+                         ['- error line too long', 'h ok'])
+
+    async def test_long_line_in_many_parts(self) -> None:
+        self.assertEqual(await self.replies(*[b'x' * 3000] * 3, b'\n', b'h new 4x4'),
+                         ['- error line too long', 'h ok'])
+
+    async def test_long_line_at_the_end(self) -> None:
+        self.assertEqual(await self.replies(b'x' * 10000), ['- error line too long'])
+
+
+if __name__ == '__main__':
+    unittest.main()